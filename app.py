@@ -1,14 +1,34 @@
+import uuid
+import hashlib
 import streamlit as st
-from workflows.engine import generate_media_pack, save_pack, build_markdown, quality_check_pack
+from workflows.engine import WorkflowResult, generate_media_pack, save_pack, build_markdown, quality_check_pack, reroll_section
+from workflows.store import PackStore, DEFAULT_STORE
+from workflows.tracing import trace, span
+from workflows.service import get_service, ServiceBusy
 
 # Optional Gemini backend (will only be used if installed + API key provided)
 try:
-    from workflows.gemini_llm import gemini_generate_pack
+    from workflows.gemini_llm import gemini_generate_pack, gemini_stream_pack, pack_result, gemini_reroll_pack
+    from workflows.llm_cache import ResponseCache
+    from workflows.ratelimit import get_scheduler, key_label, rate_text, SchedulerRejected
+    from workflows.hedge import HedgedGeneration
     GEMINI_AVAILABLE = True
 except Exception:
     GEMINI_AVAILABLE = False
 
 
+@st.cache_resource
+def get_response_cache(path: str = ".glowmini_cache/gemini.sqlite"):
+    # One on-disk cache per process; identical Gemini requests are served from it
+    return ResponseCache(path)
+
+
+@st.cache_resource
+def get_pack_store(path: str = DEFAULT_STORE):
+    # Every generated pack is recorded here; the History panel reads its index
+    return PackStore(path)
+
+
 st.set_page_config(page_title="GlowMiniAI (Offline + Gemini)", page_icon="✨", layout="centered")
 
 # Optional logo (won't break if missing)
@@ -29,10 +49,26 @@ if GEMINI_AVAILABLE:
 engine_mode = st.selectbox("Engine", engine_options, index=0)
 
 api_key = ""
+use_cache = False
+stream_sections = False
+deadline_sec = None
 if engine_mode == "Gemini (API)":
     api_key = st.text_input("Gemini API Key", type="password", help="Không có key → hãy chọn Offline. Key chỉ dùng trên máy bạn khi nhập vào.")
     if not api_key.strip():
         st.warning("Chưa có API key. Hãy dán key hoặc chuyển về Offline (Mock).")
+    stream_sections = st.checkbox("Stream sections as they arrive", value=True, help="Hiện từng phần (Outline/Script/Shotlist/Prompts) ngay khi Gemini viết xong.")
+    if st.checkbox("Latency budget", value=False, help="Hiện bản Offline ngay; thay bằng Gemini nếu Gemini trả lời kịp trong thời hạn."):
+        deadline_sec = st.slider("Deadline (giây)", 0.5, 15.0, 3.0, 0.5)
+    use_cache = st.checkbox("Cache Gemini responses (local)", value=True, help="Yêu cầu giống hệt sẽ dùng lại kết quả đã lưu, không gọi API lại.")
+    if use_cache:
+        cs = get_response_cache().stats()
+        st.caption(f"Cache: {cs['entries']} entries · hits {cs['hits']} · misses {cs['misses']} · hit rate {cs['hit_rate']:.0%}")
+    if api_key.strip():
+        # process-wide scheduler state for this key (shared with every other session on this server)
+        bs = get_scheduler().stats().get(key_label(api_key.strip()))
+        if bs:
+            st.caption(f"Backend: circuit {bs['circuit']} · {rate_text(bs['rate'])} · queued {sum(bs['queued'].values())} · "
+                       f"ok {bs['ok']} · throttled {bs['throttled']} · failed {bs['failed']}")
 
 # ===== Inputs =====
 topic = st.text_input("Chủ đề / Topic", value="Tối ưu quy trình tạo nội dung cho shop online")
@@ -60,140 +96,329 @@ col1, col2, col3 = st.columns(3)
 with col1:
     gen = st.button("Generate", use_container_width=True)
 with col2:
-    save_local = st.button("Save to /output (local)", use_container_width=True)
+    regen = st.button("Regenerate", use_container_width=True, help="Tạo bản mới thay cho kết quả đang hiển thị.")
 with col3:
-    download = st.button("Download .md", use_container_width=True)
+    save_local = st.button("Save to /output (local)", use_container_width=True)
 
-# ===== Run =====
-if gen or save_local or download:
-    if not topic.strip():
-        st.error("Vui lòng nhập chủ đề.")
-    else:
-        # ---------- Generate with Gemini if selected and key provided ----------
-        used_engine = "Offline"
-        mode = ""
-        outline = ""
-        script = ""
-        shotlist = ""
-        prompts = ""
-
-        if engine_mode == "Gemini (API)" and api_key.strip():
-            try:
-                data = gemini_generate_pack(
-                    api_key=api_key.strip(),
-                    topic=topic.strip(),
-                    language=lang,
-                    platform=platform,
-                    duration_sec=int(duration),
-                    audience=audience,
-                    style_preset=style_preset,
-                )
-                used_engine = "Gemini"
-                mode = data.get("mode", "LLM")
-                outline = data.get("outline", "")
-                script = data.get("script", "")
-                shotlist = data.get("shotlist", "")
-                prompts = data.get("prompts", "")
-                st.success(f"✅ Generated with **Gemini**. Mode: **{mode}**")
-            except Exception as e:
-                st.error(f"Gemini error → fallback Offline. Details: {e}")
-
-        # ---------- Offline fallback ----------
-        if used_engine != "Gemini":
-            res = generate_media_pack(
-                topic=topic.strip(),
-                language=lang,
-                platform=platform,
-                duration_sec=int(duration),
-                audience=audience,
-                style_preset=style_preset,
-                seed=int(seed) if seed is not None else None,
-            )
-            used_engine = "Offline"
-            mode = res.mode
-            outline = res.outline
-            script = res.script
-            shotlist = res.shotlist
-            prompts = res.prompts
-            st.success(f"✅ Generated with **Offline**. Detected Mode: **{mode}**")
-
-        # ---------- Display ----------
-        st.subheader("Outline")
-        st.code(outline)
-
-        st.subheader("Script")
-        st.code(script)
-
-        st.subheader("Shotlist")
-        st.code(shotlist)
-
-        st.subheader("Prompt Pack")
-        st.code(prompts)
-
-        # ---------- QC ----------
-        st.subheader("🔍 Quality Control")
-        scores, avg_score, suggestions = quality_check_pack(outline, script, shotlist, prompts)
-
-        st.write(f"**Average Score:** {avg_score}/10")
-        for k, v in scores.items():
-            st.write(f"- {k}: {v}/10")
-
-        if suggestions:
-            st.write("**Suggestions:**")
-            for s in suggestions:
-                st.write(f"- {s}")
+# process-wide pool shared by every session on this server
+ss = get_service().stats()
+st.caption(f"Generation service: {ss['running']}/{ss['workers']} busy · {ss['queued']} queued · "
+           f"{ss['in_flight']} in flight · {ss['coalesced']} shared requests")
+
+
+SECTION_TITLES = {"outline": "Outline", "script": "Script", "shotlist": "Shotlist", "prompts": "Prompt Pack"}
+REROLL_LABELS = {"hook": "Hook (outline + script)", "outline": "Outline", "script": "Script",
+                 "shotlist": "Shotlist (+ prompts)", "prompts": "Prompt Pack"}
+
+
+def run_generation(job, req: dict, cache, store) -> dict:
+    """
+    Generate once (Gemini if selected, else Offline), then QC + assemble markdown.
+    Runs on the shared service's worker threads, never touching `st`: streamed Gemini
+    sections and the hedged offline draft are published on `job` for the waiting
+    sessions to draw. Every stage is traced; the timings are kept with the result.
+    """
+    with trace() as tr:
+        out = _generate(job, req, cache, store, tr)
+    out["timings"] = tr.table()
+    return out
+
+
+def _generate(job, req: dict, cache, store, tr) -> dict:
+    notices = []
+    used_engine = "Offline"
+    res = None
+    data = {}
+    key, deadline = req["api_key"], req["deadline_sec"]
+    params = {k: req[k] for k in ("topic", "language", "platform", "duration_sec", "audience", "style_preset")}
+
+    # ---------- Generate with Gemini if selected and key provided ----------
+    if req["gemini"] and not get_scheduler().available(key):
+        notices.append(("warning", "Gemini paused (backend unhealthy or quota used up) → Offline."))
+    elif req["gemini"] and deadline is not None:
+        hedged = HedgedGeneration(key, seed=req["seed"], deadline_sec=deadline, cache=cache, **params)
+        job.publish("note", f"Offline draft · waiting up to {deadline:g}s for Gemini…")
+        job.publish("sections", {k: getattr(hedged.offline, k) for k in SECTION_TITLES})
+        with span("gemini_hedged"):
+            res = hedged.result()
+        hedge = res.meta["hedge"]
+        if hedged.upgraded:
+            used_engine = "Gemini"
+            notices.append(("success", f"✅ Generated with **Gemini** in {hedge['elapsed_ms']:.0f} ms (deadline {deadline:g}s). Mode: **{res.mode}**"))
+        elif hedged.outcome == "timeout":
+            notices.append(("warning", f"Gemini missed the {deadline:g}s deadline → Offline."))
         else:
-            st.success("Output quality is strong. No major issues detected.")
-
-        # ---------- Markdown pack ----------
+            notices.append(("warning", f"Gemini {hedged.outcome} → Offline. {hedged.error or ''}"))
+    elif req["gemini"]:
+        try:
+            kwargs = dict(api_key=key, cache=cache, **params)
+            if req["stream"]:
+                job.publish("note", "Gemini is writing…")
+                for name, value in gemini_stream_pack(**kwargs):
+                    data[name] = value
+                    if name in SECTION_TITLES:
+                        job.publish("sections", {k: v for k, v in data.items() if k in SECTION_TITLES})
+            else:
+                data = gemini_generate_pack(**kwargs)
+            used_engine = "Gemini"
+            data["mode"] = data.get("mode", "LLM")
+            res = pack_result(data, timings_ms=tr.timings(), **params)
+            notices.append(("success", f"✅ Generated with **Gemini**. Mode: **{data['mode']}**"))
+        except SchedulerRejected as e:
+            notices.append(("warning", f"Gemini skipped → Offline. {e}"))
+        except Exception as e:
+            notices.append(("error", f"Gemini error → fallback Offline. Details: {e}"))
+
+    # ---------- Offline fallback ----------
+    if res is None:
+        res = generate_media_pack(seed=req["seed"], **params)
+        notices.append(("success", f"✅ Generated with **Offline**. Detected Mode: **{res.mode}**"))
+
+    try:
+        with span("history_put"):
+            store.put(res)
+    except Exception as e:
+        notices.append(("warning", f"History not recorded: {e}"))
+    return pack_view(res, used_engine, notices)
+
+
+def pack_view(res: WorkflowResult, engine: str, notices: list) -> dict:
+    """Everything the page shows for one pack: sections, QC and the download markdown."""
+    # ---------- QC ----------
+    qc = quality_check_pack(res.outline, res.script, res.shotlist, res.prompts)
+
+    # ---------- Markdown pack ----------
+    with span("markdown"):
         md = f"""# GlowMiniAI Output Pack
-Topic: {topic.strip()}
-Engine: {used_engine}
-Mode: {mode}
-Language: {lang}
-Platform: {platform}
-Duration: {int(duration)}s
-Audience: {audience}
-Style: {style_preset}
+Topic: {res.topic}
+Engine: {engine}
+Mode: {res.mode}
+Language: {res.language}
+Platform: {res.platform}
+Duration: {res.duration_sec}s
+Audience: {res.audience}
+Style: {res.style_preset}
 
 ## Outline
-{outline}
+{res.outline}
 
 ## Script
-{script}
+{res.script}
 
 ## Shotlist
-{shotlist}
+{res.shotlist}
 
 ## Prompt Pack
-{prompts}
+{res.prompts}
 """
-
-        # Local save (only meaningful on local)
-        if save_local:
-            # If offline, you can save using existing helper; if Gemini, save the assembled md
-            if used_engine == "Offline":
-                path = save_pack(res, out_dir)  # type: ignore
-                st.info(f"📄 Saved locally: {path}")
+    return {"mode": res.mode, "outline": res.outline, "script": res.script, "shotlist": res.shotlist, "prompts": res.prompts,
+            "engine": engine, "res": res, "qc": qc, "md": md, "notices": notices, "saved_path": None}
+
+
+def result_from_store(res: WorkflowResult) -> dict:
+    engine = "Gemini" if res.meta.get("mode") == "gemini" else "Offline"
+    return {
+        "mode": res.mode, "outline": res.outline, "script": res.script, "shotlist": res.shotlist, "prompts": res.prompts,
+        "engine": engine, "res": res, "qc": quality_check_pack(res.outline, res.script, res.shotlist, res.prompts),
+        "md": build_markdown(res), "notices": [("info", f"🗂 Loaded from history: {res.topic} ({res.meta.get('generated_at')})")],
+        "saved_path": None, "timings": None,
+    }
+
+
+# ===== Session result store =====
+# Results are kept per input combination so Save/Download (and any rerun) reuse the
+# pack on screen instead of calling Gemini / the offline engine again.
+MAX_STORED_RESULTS = 20
+results = st.session_state.setdefault("pack_results", {})
+result_key = (engine_mode, bool(api_key.strip()), use_cache, deadline_sec, topic.strip(), lang, platform, int(duration), audience, style_preset,
+              int(seed) if seed is not None else None)
+
+
+def generation_request() -> dict:
+    """The inputs on screen, as plain values a worker thread can use."""
+    return {"gemini": engine_mode == "Gemini (API)" and bool(api_key.strip()), "api_key": api_key.strip(),
+            "stream": stream_sections, "deadline_sec": deadline_sec, "topic": topic.strip(), "language": lang,
+            "platform": platform, "duration_sec": int(duration), "audience": audience, "style_preset": style_preset,
+            "seed": int(seed) if seed is not None else None}
+
+
+def wait_for(job, live) -> None:
+    """
+    Draw the job's queue place / progress into `live` until it is done. A rerun
+    (any widget touched meanwhile) interrupts only this wait: the job keeps running
+    and the next run of this session waits for it again or collects its result.
+    """
+    service = get_service()
+    while not job.wait(0.25):
+        progress = job.progress
+        with live.container():
+            place = service.position(job)
+            status = f"⏳ Queued · #{place} in line" if place else f"⚙️ Generating · {job.elapsed():.1f}s"
+            if job.callers > 1:
+                status += f" · shared with {job.callers - 1} identical request(s)"
+            st.caption(status)
+            if progress.get("note"):
+                st.caption(progress["note"])
+            for key, value in progress.get("sections", {}).items():
+                st.subheader(SECTION_TITLES[key])
+                st.code(value)
+
+
+def collect_jobs() -> None:
+    # move finished jobs into this session's results (a copy each: sessions sharing a job must not share saved_path)
+    for key, job in list(jobs.items()):
+        if not job.done():
+            continue
+        del jobs[key]
+        try:
+            results.pop(key, None)
+            results[key] = dict(job.result())
+        except Exception as e:
+            if key == result_key:
+                st.error(f"Generation failed: {e}")
+    while len(results) > MAX_STORED_RESULTS:
+        results.pop(next(iter(results)))
+
+
+# Generation runs on the process-wide service: identical requests in flight from any
+# session are generated once, and the pending Job survives reruns in session_state.
+jobs = st.session_state.setdefault("pack_jobs", {})
+# Save only ever writes the pack on screen (a history pack included); only Generate/Regenerate start a job
+if (gen or regen) and not topic.strip():
+    st.error("Vui lòng nhập chủ đề.")
+elif save_local and "history_result" not in st.session_state and result_key not in results and result_key not in jobs:
+    st.warning("Chưa có kết quả để lưu. Hãy bấm Generate trước.")
+elif regen or (gen and result_key not in results and result_key not in jobs):
+    results.pop(result_key, None)
+    request = generation_request()
+    # a different API key never shares a Gemini call (quota and billing stay per key)
+    flight_key = result_key + (hashlib.sha256(request["api_key"].encode()).hexdigest()[:16],)
+    cache = get_response_cache() if use_cache else None
+    if regen:
+        # a new answer, never the cached one or a job already running for the same inputs;
+        # it replaces the cache entry, so the next Generate shows it too
+        flight_key += ("regen", uuid.uuid4().hex)
+        cache = cache.refresh() if cache is not None else None
+    try:
+        jobs[result_key] = get_service().submit(flight_key, run_generation, request, cache, get_pack_store())
+    except ServiceBusy as e:
+        st.error(f"Server busy, try again in a moment: {e}")
+if result_key in jobs:
+    live = st.empty()
+    wait_for(jobs[result_key], live)
+    live.empty()  # the stored result is rendered below
+collect_jobs()
+
+if gen or regen:
+    st.session_state.pop("history_result", None)
+
+# ===== History (pack store index; no pack files are read until one is loaded) =====
+with st.sidebar:
+    st.markdown("### 🗂 History")
+    try:
+        store = get_pack_store()
+        entries = store.find(limit=50)
+        st.caption(f"{len(store)} packs stored")
+    except Exception as e:
+        store, entries = None, []
+        st.caption(f"History unavailable: {e}")
+    if entries:
+        picked = st.selectbox("Recent packs", entries, format_func=lambda e: f"{e.generated_at} · {e.mode} · {e.topic[:40]}")
+        if st.button("Load", use_container_width=True):
+            st.session_state["history_result"] = result_from_store(store.get(picked.id))
+
+result = st.session_state.get("history_result") or results.get(result_key)
+
+# ===== Display =====
+if result:
+    for kind, msg in result["notices"]:
+        getattr(st, kind)(msg)
+
+    st.subheader("Outline")
+    st.code(result["outline"])
+
+    st.subheader("Script")
+    st.code(result["script"])
+
+    st.subheader("Shotlist")
+    st.code(result["shotlist"])
+
+    st.subheader("Prompt Pack")
+    st.code(result["prompts"])
+
+    # ---------- Re-roll one section (the rest of the pack is kept) ----------
+    rc1, rc2 = st.columns([3, 1])
+    with rc1:
+        reroll_target = st.selectbox("Re-roll section", list(REROLL_LABELS), format_func=REROLL_LABELS.get,
+                                     help="Chỉ tạo lại phần đã chọn (và phần phụ thuộc vào nó), giữ nguyên phần còn lại.")
+    with rc2:
+        st.write("")
+        do_reroll = st.button("🎲 Re-roll", use_container_width=True)
+    if do_reroll:
+        try:
+            with st.spinner("Re-rolling…"), trace() as tr:
+                if result["engine"] == "Gemini":
+                    if not (GEMINI_AVAILABLE and api_key.strip()):
+                        raise ValueError("Gemini pack: enter the API key to re-roll it with Gemini.")
+                    new_res = gemini_reroll_pack(api_key.strip(), result["res"], reroll_target)
+                else:
+                    new_res = reroll_section(result["res"], reroll_target)
+                try:
+                    get_pack_store().put(new_res)
+                except Exception:
+                    pass
+                rerolled = pack_view(new_res, result["engine"],
+                                     [("success", f"🎲 Re-rolled **{REROLL_LABELS[reroll_target]}**; kept the other sections.")])
+            rerolled["timings"] = tr.table()
+            if st.session_state.get("history_result") is result:
+                st.session_state["history_result"] = rerolled
             else:
-                import os, datetime
-                os.makedirs(out_dir, exist_ok=True)
-                fname = f"{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}_{topic.strip().replace(' ', '_')[:40]}.md"
-                path = os.path.join(out_dir, fname)
-                with open(path, "w", encoding="utf-8") as f:
-                    f.write(md)
-                st.info(f"📄 Saved locally: {path}")
-
-        # Download
-        if download:
-            filename = f"GlowMiniAI_{used_engine}_{mode}_{topic.strip()}".replace(" ", "_")[:90] + ".md"
-            st.download_button(
-                label="⬇️ Click to download .md",
-                data=md,
-                file_name=filename,
-                mime="text/markdown",
-                use_container_width=True
-            )
+                results[result_key] = rerolled
+            st.rerun()
+        except Exception as e:
+            st.error(f"Re-roll failed: {e}")
+
+    # ---------- QC ----------
+    st.subheader("🔍 Quality Control")
+    scores, avg_score, suggestions = result["qc"]
+
+    st.write(f"**Average Score:** {avg_score}/10")
+    for k, v in scores.items():
+        st.write(f"- {k}: {v}/10")
+
+    if suggestions:
+        st.write("**Suggestions:**")
+        for s in suggestions:
+            st.write(f"- {s}")
+    else:
+        st.success("Output quality is strong. No major issues detected.")
+
+    # Local save (only meaningful on local) — saves exactly the pack shown above
+    if save_local:
+        with trace() as tr:
+            path = save_pack(result["res"], out_dir)
+        result["saved_path"] = path
+        result["save_timings"] = tr.table()
+    if result["saved_path"]:
+        st.info(f"📄 Saved locally: {result['saved_path']}")
+
+    # ---------- Timings ----------
+    if result.get("timings"):
+        with st.expander("⏱ Timings"):
+            st.dataframe(result["timings"], hide_index=True, use_container_width=True)
+            if result.get("save_timings"):
+                st.caption("Save to /output")
+                st.dataframe(result["save_timings"], hide_index=True, use_container_width=True)
+
+    # Download (served from the stored markdown, no regeneration)
+    filename = f"GlowMiniAI_{result['engine']}_{result['mode']}_{topic.strip()}".replace(" ", "_")[:90] + ".md"
+    st.download_button(
+        label="⬇️ Download .md",
+        data=result["md"],
+        file_name=filename,
+        mime="text/markdown",
+        use_container_width=True
+    )
 
 st.markdown("---")
 st.markdown("### Run locally")
@@ -1,21 +1,513 @@
 #!/usr/bin/env python3
 from __future__ import annotations
-import argparse
-from workflows.engine import generate_media_pack, save_pack
+import argparse, sys
+
+def cmd_generate(argv):
+    from workflows.engine import generate_media_pack, save_pack
 
-def main():
     parser = argparse.ArgumentParser(prog="glowctl", description="GlowMiniAI - offline workflow demo (no API key needed).")
     parser.add_argument("topic", help="Topic / keyword for the demo pack")
     parser.add_argument("--lang", default="vi", help="Language: vi or en (default: vi)")
     parser.add_argument("--out", default="output", help="Output directory (default: output)")
-    args = parser.parse_args()
+    parser.add_argument("--store", default=None, help="Also record the pack in this pack store (see `glowctl history`)")
+    args = parser.parse_args(argv)
 
     res = generate_media_pack(args.topic, args.lang)
     path = save_pack(res, args.out)
+    if args.store:
+        from workflows.store import PackStore
+        print("🗂  Stored as:", PackStore(args.store).put(res))
 
     print("✅ Generated pack:", path)
     print("— Outline preview —")
     print(res.outline)
+    return 0
+
+def cmd_batch(argv):
+    from workflows.batch import read_rows, run_batch
+
+    parser = argparse.ArgumentParser(prog="glowctl batch", description="Generate many packs from a CSV/JSONL file.")
+    parser.add_argument("input", help="CSV (with header) or JSONL file: topic, language, platform, duration_sec, audience, style_preset, seed")
+    parser.add_argument("--out", default="output", help="Output directory, a .zip / .tar(.gz) / .jsonl file, or a .packstore (default: output)")
+    parser.add_argument("--format", choices=["dir", "zip", "tar", "jsonl", "store"], default=None, help="Override the output format guessed from --out")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count, 0 = in-process)")
+    parser.add_argument("--chunk-size", type=int, default=64, help="Rows per worker task (default: 64)")
+    parser.add_argument("--progress", type=int, default=1000, help="Print progress every N rows (0 = off)")
+    _near_dup_args(parser)
+    args = parser.parse_args(argv)
+
+    seen = [0]
+
+    def on_result(row_no, path, error):
+        seen[0] += 1
+        if error:
+            print(f"❌ row {row_no}: {error}", file=sys.stderr)
+        if args.progress and seen[0] % args.progress == 0:
+            print(f"… {seen[0]} rows done", file=sys.stderr)
+
+    from workflows.export import PackExporter, open_sink, guess_format
+
+    guard = _near_dup_guard(args)
+    if (args.format or guess_format(args.out)) == "dir" and guard is None:
+        # workers write their own files: nothing but paths crosses the process boundary
+        report = run_batch(read_rows(args.input), args.out, workers=args.workers, chunk_size=args.chunk_size, on_result=on_result)
+    else:
+        # the near-duplicate index lives in this process, so guarded packs go through the exporter
+        with PackExporter(open_sink(args.out, args.format), guard=guard) as exporter:
+            report = run_batch(read_rows(args.input), None, workers=args.workers, chunk_size=args.chunk_size,
+                               on_result=on_result, exporter=exporter)
+
+    print(f"✅ Batch done: {report.ok} ok, {report.failed} failed, {report.total} rows "
+          f"in {report.elapsed_sec:.2f}s ({report.rows_per_sec:.1f} rows/s) → {args.out}")
+    _near_dup_summary(guard)
+    return 1 if report.failed else 0
+
+def _near_dup_args(parser):
+    parser.add_argument("--near-dup", choices=["flag", "reroll", "skip"], default=None,
+                        help="Check each pack against those already written (SimHash of script/shotlist/prompts): "
+                             "flag it in meta, re-roll it, or skip it")
+    parser.add_argument("--near-dup-distance", type=int, default=3, help="Max differing fingerprint bits for a near-duplicate (default: 3)")
+
+def _near_dup_guard(args):
+    if not args.near_dup:
+        return None
+    from workflows.neardup import NearDupGuard
+    return NearDupGuard(args.near_dup, max_distance=args.near_dup_distance)
+
+def _near_dup_summary(guard):
+    if guard is not None:
+        s = guard.stats
+        print(f"🔎 Near-duplicates: {s.flagged + s.rerolled + s.skipped} of {s.checked} packs "
+              f"({s.flagged} flagged, {s.rerolled} re-rolled, {s.skipped} skipped)")
+
+def _build_parser(prog, description):
+    parser = argparse.ArgumentParser(prog=prog, description=description)
+    parser.add_argument("input", help="CSV (with header) or JSONL file, same columns as `batch`")
+    parser.add_argument("--out", default="output", help="Output directory; its manifest is kept in .glowmini-manifest.json (default: output)")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes for large rebuilds (default: CPU count, 0 = in-process)")
+    parser.add_argument("--chunk-size", type=int, default=64, help="Rows per worker task (default: 64)")
+    parser.add_argument("--no-prune", action="store_true", help="Keep packs of rows that are no longer in the input")
+    return parser
+
+def _build_summary(report, out):
+    print(f"✅ Build: {report.built} built, {report.unchanged} unchanged, {report.pruned} pruned, {report.failed} failed"
+          f"{f', {report.duplicates} duplicate rows' if report.duplicates else ''} "
+          f"of {report.total} rows in {report.elapsed_sec:.2f}s → {out}")
+    for row_no, error in report.failures[:20]:
+        print(f"❌ row {row_no}: {error}", file=sys.stderr)
+
+def cmd_build(argv):
+    from workflows.build import build
+
+    parser = _build_parser("glowctl build", "Generate packs for new or changed rows only, and prune packs of deleted rows.")
+    parser.add_argument("--dry-run", action="store_true", help="Only report what would be built and pruned")
+    args = parser.parse_args(argv)
+    report = build(args.input, args.out, workers=args.workers, chunk_size=args.chunk_size,
+                   prune=not args.no_prune, dry_run=args.dry_run)
+    if args.dry_run:
+        print(f"🔎 Dry run: {report.built} to build, {report.unchanged} unchanged, {report.pruned} to prune of {report.total} rows")
+    else:
+        _build_summary(report, args.out)
+    return 1 if report.failed else 0
+
+def cmd_watch(argv):
+    from workflows.build import watch
+
+    parser = _build_parser("glowctl watch", "Build, then rebuild whenever the input file or the content templates change.")
+    parser.add_argument("--interval", type=float, default=1.0, help="Seconds between checks for changes (default: 1)")
+    args = parser.parse_args(argv)
+
+    def on_build(report, reason):
+        if reason != "start":
+            print(f"🔄 {reason} changed", file=sys.stderr)
+        _build_summary(report, args.out)
+
+    def on_error(e):
+        print(f"❌ Rebuild failed, still watching: {type(e).__name__}: {e}", file=sys.stderr)
+
+    print(f"👀 Watching {args.input} and the content templates (Ctrl+C to stop)", file=sys.stderr)
+    try:
+        watch(args.input, args.out, interval=args.interval, on_build=on_build, on_error=on_error,
+              workers=args.workers, chunk_size=args.chunk_size, prune=not args.no_prune)
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+def _seeds(spec):
+    # "1-5,9,none" → [1, 2, 3, 4, 5, 9, None]
+    out = []
+    for part in spec.split(","):
+        part = part.strip()
+        if part.lower() == "none":
+            out.append(None)
+        elif "-" in part:
+            lo, hi = part.split("-", 1)
+            out.extend(range(int(lo), int(hi) + 1))
+        elif part:
+            out.append(int(part))
+    return out
+
+def cmd_sweep(argv):
+    from workflows.variants import SweepReport, generate_variants, grid_size
+    from workflows.export import PackExporter, open_sink
+
+    parser = argparse.ArgumentParser(prog="glowctl sweep", description="Generate every platform × style × duration × seed variant of some topics.")
+    parser.add_argument("topics", nargs="+", help="Topic(s) to sweep")
+    parser.add_argument("--lang", default="vi", help="Language (default: vi)")
+    parser.add_argument("--audience", default="General")
+    parser.add_argument("--platforms", default="YouTube Shorts", help="Comma-separated platforms (default: YouTube Shorts)")
+    parser.add_argument("--styles", default="Cinematic 3D", help="Comma-separated style presets (default: Cinematic 3D)")
+    parser.add_argument("--durations", default="35", help="Comma-separated durations in seconds (default: 35)")
+    parser.add_argument("--seeds", default="none", help="Seeds: e.g. 1-10 or 1,2,7 (default: none = one unseeded draw)")
+    parser.add_argument("--no-dedupe", action="store_true", help="Keep variants whose sections are identical to an earlier one")
+    parser.add_argument("--out", default="output", help="Output directory, a .zip / .tar(.gz) / .jsonl file, or a .packstore (default: output)")
+    parser.add_argument("--format", choices=["dir", "zip", "tar", "jsonl", "store"], default=None, help="Override the output format guessed from --out")
+    _near_dup_args(parser)
+    args = parser.parse_args(argv)
+
+    split = lambda s: [x.strip() for x in s.split(",") if x.strip()]
+    try:
+        grid = dict(platforms=split(args.platforms), style_presets=split(args.styles),
+                    durations=[int(d) for d in split(args.durations)], seeds=_seeds(args.seeds))
+    except ValueError as e:
+        parser.error(f"bad grid value: {e}")
+    if not grid_size(args.topics, **grid):
+        parser.error("empty grid: every list needs at least one value")
+    report = SweepReport()
+    guard = _near_dup_guard(args)
+    with PackExporter(open_sink(args.out, args.format), guard=guard) as exporter:
+        for res in generate_variants(args.topics, args.lang, audience=args.audience, dedupe=not args.no_dedupe,
+                                     report=report, **grid):
+            exporter.submit(res)
+
+    print(f"✅ Sweep done: {report.unique} packs from {grid_size(args.topics, **grid)} variants "
+          f"({report.duplicates} duplicates skipped) in {report.elapsed_sec:.2f}s → {args.out}")
+    _near_dup_summary(guard)
+    return 0
+
+def cmd_history(argv):
+    from workflows.store import PackStore, DEFAULT_STORE
+
+    parser = argparse.ArgumentParser(prog="glowctl history", description="List packs recorded in a pack store.")
+    parser.add_argument("--store", default=DEFAULT_STORE, help=f"Pack store directory (default: {DEFAULT_STORE})")
+    parser.add_argument("--topic", default=None)
+    parser.add_argument("--mode", default=None)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--engine", default=None)
+    parser.add_argument("--since", default=None, help="generated_at lower bound, e.g. 20260101_000000")
+    parser.add_argument("--until", default=None, help="generated_at upper bound")
+    parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    store = PackStore(args.store)
+    entries = store.find(topic=args.topic, mode=args.mode, seed=args.seed, engine=args.engine,
+                         since=args.since, until=args.until, limit=args.limit)
+    for e in entries:
+        print(f"{e.id}  {e.generated_at}  {e.mode:<20}  {e.engine:<22}  seed={e.seed}  {e.topic}")
+    print(f"— {len(entries)} shown / {len(store)} stored")
+    return 0
+
+def cmd_show(argv):
+    from workflows.engine import build_markdown
+    from workflows.store import PackStore, DEFAULT_STORE
+
+    parser = argparse.ArgumentParser(prog="glowctl show", description="Print a stored pack as markdown.")
+    parser.add_argument("id", help="Pack id from `glowctl history`")
+    parser.add_argument("--store", default=DEFAULT_STORE, help=f"Pack store directory (default: {DEFAULT_STORE})")
+    args = parser.parse_args(argv)
+
+    try:
+        print(build_markdown(PackStore(args.store).get(args.id)))
+    except KeyError:
+        print(f"❌ No pack with id {args.id}", file=sys.stderr)
+        return 1
+    return 0
+
+def cmd_compact(argv):
+    from workflows.store import PackStore, DEFAULT_STORE
+
+    parser = argparse.ArgumentParser(prog="glowctl compact", description="Rewrite a pack store without deleted records.")
+    parser.add_argument("--store", default=DEFAULT_STORE, help=f"Pack store directory (default: {DEFAULT_STORE})")
+    parser.add_argument("--reindex", action="store_true", help="Rebuild the index from the segment files first")
+    args = parser.parse_args(argv)
+
+    store = PackStore(args.store)
+    if args.reindex:
+        print("🔎 Reindexed:", store.reindex(), "packs")
+    stats = store.compact()
+    print(f"✅ Compacted {stats['records']} packs: {stats['bytes_before']} → {stats['bytes_after']} bytes")
+    return 0
+
+def _named_floats(pairs, flag):
+    out = {}
+    for pair in pairs or ():
+        name, sep, value = pair.rpartition("=")
+        if not sep:
+            raise SystemExit(f"glowctl qc: {flag} expects NAME=VALUE, got {pair!r}")
+        out[name] = float(value)
+    return out
+
+def cmd_qc(argv):
+    import json
+    from workflows.qc import Rubric, get_rubric, qc_many
+    from workflows.store import PackStore, DEFAULT_STORE
+    from workflows.compact import compact_pack
+
+    parser = argparse.ArgumentParser(prog="glowctl qc", description="Re-score stored packs (or a .jsonl export) against the QC rubric.")
+    parser.add_argument("source", nargs="?", default=DEFAULT_STORE, help=f"Pack store directory or .jsonl export (default: {DEFAULT_STORE})")
+    parser.add_argument("--rubric", default=None, help="Rubric JSON file (default: workflows/content/rubric.json)")
+    parser.add_argument("--weight", action="append", metavar="NAME=W", help="Override a criterion weight (repeatable)")
+    parser.add_argument("--threshold", action="append", metavar="NAME=T", help="Override a criterion pass threshold (repeatable)")
+    parser.add_argument("--since", default=None, help="generated_at lower bound (stores only)")
+    parser.add_argument("--failing", type=int, default=0, help="Also list up to N lowest-scoring packs")
+    args = parser.parse_args(argv)
+
+    # the whole set is held until qc_many runs: offline packs are kept compact (inputs + picks)
+    if args.source.lower().endswith((".jsonl", ".ndjson")):
+        packs, names = [], []
+        with open(args.source, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    raw = json.loads(line)
+                    names.append(raw.get("name", str(len(names) + 1)))
+                    packs.append(compact_pack(raw))
+    else:
+        store = PackStore(args.source)
+        entries = store.find(since=args.since, limit=None, newest_first=False)
+        packs = [compact_pack(store.get(e.id)) for e in entries]
+        names = [e.id for e in entries]
+
+    rubric = Rubric.from_file(args.rubric) if args.rubric else get_rubric()
+    report = qc_many(packs, rubric, weights=_named_floats(args.weight, "--weight"),
+                     thresholds=_named_floats(args.threshold, "--threshold"))
+    print(json.dumps(report.stats, ensure_ascii=False, indent=2))
+    for i in report.averages.argsort(kind="stable")[:args.failing]:
+        print(f"{report.averages[i]:.1f}  {names[i]}  {' | '.join(report.suggestions[i])}")
+    return 0
+
+def cmd_bench(argv):
+    from workflows.bench import run_suite, compare, load_report, save_report
+
+    parser = argparse.ArgumentParser(prog="glowctl bench", description="Microbenchmarks for the engine hot paths and the Gemini client (fake transport).")
+    parser.add_argument("--only", default=None, help="Run benchmarks whose name contains this text")
+    parser.add_argument("--repeat", type=int, default=20, help="Timed samples per benchmark (default: 20)")
+    parser.add_argument("--warmup", type=int, default=3, help="Untimed warmup samples (default: 3)")
+    parser.add_argument("--number", type=int, default=None, help="Calls per sample (default: auto-calibrated)")
+    parser.add_argument("--json", default=None, help="Write the results to this JSON file (usable as a --baseline)")
+    parser.add_argument("--baseline", default=None, help="Compare against a previous --json report")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Regression threshold vs baseline, 0.10 = 10%% slower (default: 0.10)")
+    parser.add_argument("--metric", choices=["p50_us", "mean_us", "min_us", "p90_us"], default="p50_us")
+    args = parser.parse_args(argv)
+    if args.repeat < 1:
+        parser.error("--repeat must be at least 1")
+
+    print(f"{'benchmark':<42} {'calls':>7} {'p50 µs':>10} {'p90 µs':>10} {'p99 µs':>10} {'mean µs':>10}")
+    report = run_suite(only=args.only, repeat=args.repeat, warmup=args.warmup, number=args.number,
+                       on_result=lambda r: print(f"{r.name:<42} {r.number:>7} {r.p50_us:>10.2f} {r.p90_us:>10.2f} {r.p99_us:>10.2f} {r.mean_us:>10.2f}"))
+    if args.json:
+        save_report(report, args.json)
+        print("💾 Results:", args.json)
+    if not args.baseline:
+        return 0
+
+    rows = compare(report, load_report(args.baseline), threshold=args.threshold, metric=args.metric)
+    print(f"\n{'vs baseline (' + args.metric + ')':<42} {'base':>10} {'now':>10} {'change':>9}")
+    for row in rows:
+        change = "new" if row["change"] is None else f"{row['change'] * 100:+.1f}%"
+        base = "-" if row["baseline"] is None else f"{row['baseline']:.2f}"
+        print(f"{row['name']:<42} {base:>10} {row['current']:>10.2f} {change:>9}{'  ❌' if row['regressed'] else ''}")
+    regressed = [row["name"] for row in rows if row["regressed"]]
+    if regressed:
+        print(f"❌ {len(regressed)} regression(s) over {args.threshold * 100:.0f}%", file=sys.stderr)
+        return 1
+    print("✅ No regressions")
+    return 0
+
+def cmd_loadtest(argv):
+    import json
+    from workflows.loadtest import load_workload, recorded_workload, synthetic_workload, run_loadtest
+
+    parser = argparse.ArgumentParser(prog="glowctl loadtest",
+                                     description="Replay a workload against the engine (and a stand-in Gemini API) and report latency percentiles as JSON.")
+    src = parser.add_mutually_exclusive_group()
+    src.add_argument("--workload", default=None, help="CSV/JSONL workload: batch columns plus engine (offline|gemini|hedged) and deadline_ms")
+    src.add_argument("--from-store", nargs="?", const="", default=None, metavar="STORE",
+                     help="Replay the pack store history (default store if no path is given)")
+    src.add_argument("--synthetic", type=int, default=1000, help="Synthetic workload of N requests (default: 1000)")
+    parser.add_argument("--gemini-ratio", type=float, default=0.2, help="Synthetic: share of engine=gemini requests (default: 0.2)")
+    parser.add_argument("--hedged-ratio", type=float, default=0.0, help="Synthetic: share of hedged requests (default: 0)")
+    parser.add_argument("--deadline-ms", type=float, default=1500.0, help="Synthetic: deadline of hedged requests (default: 1500)")
+    parser.add_argument("--langs", default=None, help="Synthetic: comma-separated languages (default: all)")
+    parser.add_argument("--concurrency", type=int, default=8, help="Workers; closed loop unless --rate is given (default: 8)")
+    parser.add_argument("--rate", type=float, default=None, help="Open loop: Poisson arrivals at this many requests/sec")
+    parser.add_argument("--requests", type=int, default=None, help="Stop after this many requests (default: one pass over the workload)")
+    parser.add_argument("--duration", type=float, default=None, help="Stop after this many seconds")
+    parser.add_argument("--gemini-url", default=None, help="Gemini REST base URL (default: start a local stand-in)")
+    parser.add_argument("--api-key", default="loadtest", help="Key sent to --gemini-url (default: loadtest)")
+    parser.add_argument("--gemini-rate", type=float, default=100.0, help="Scheduler ceiling for Gemini calls, req/s (default: 100)")
+    parser.add_argument("--latency-ms", type=float, default=800.0, help="Stand-in: median latency (default: 800)")
+    parser.add_argument("--jitter", type=float, default=0.3, help="Stand-in: log-normal latency spread, 0 = fixed (default: 0.3)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Stand-in: share of calls answered 503 (default: 0)")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Stand-in: share of calls answered 429 at random (default: 0)")
+    parser.add_argument("--rps-limit", type=float, default=None, help="Stand-in: answer 429 above this many calls/sec, like a key quota")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the synthetic mix, arrivals and stand-in (default: 0)")
+    parser.add_argument("--json", default=None, help="Write the report here instead of printing it")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.workload:
+            workload = load_workload(args.workload)
+        elif args.from_store is not None:
+            workload = recorded_workload(args.from_store or None)
+        else:
+            langs = [x.strip() for x in args.langs.split(",") if x.strip()] if args.langs else None
+            workload = synthetic_workload(args.synthetic, args.gemini_ratio, args.hedged_ratio, args.deadline_ms, langs, args.seed)
+    except (OSError, ValueError) as e:
+        print(f"❌ {e}", file=sys.stderr)
+        return 1
+
+    standin = {"latency_ms": args.latency_ms, "jitter": args.jitter, "error_rate": args.error_rate,
+               "rate_limit_rate": args.throttle_rate, "rps_limit": args.rps_limit, "seed": args.seed}
+    print(f"🏋 {len(workload)} workload rows · " + (f"open loop {args.rate:g} req/s" if args.rate else "closed loop")
+          + f" · concurrency {args.concurrency}", file=sys.stderr)
+    report = run_loadtest(workload, gemini_url=args.gemini_url, api_key=args.api_key, standin=standin,
+                          gemini_rate=args.gemini_rate, concurrency=args.concurrency, rate=args.rate,
+                          requests=args.requests, duration_sec=args.duration, seed=args.seed,
+                          on_progress=lambda n, t: print(f"  {n} done · {t:.0f}s", file=sys.stderr))
+    lat = report["latency_ms"]
+    print(f"✅ {report['requests']} requests in {report['elapsed_sec']}s · {report['throughput_rps']} req/s · "
+          f"p50 {lat.get('p50')} · p95 {lat.get('p95')} · p99 {lat.get('p99')} ms · errors {report['errors']['rate']:.2%} · "
+          f"max RSS {report['memory']['max_rss_mb']} MB", file=sys.stderr)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print("💾 Report:", args.json, file=sys.stderr)
+    else:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    return 0
+
+def cmd_api(argv):
+    from workflows.api import serve
+
+    parser = argparse.ArgumentParser(prog="glowctl api", description="Serve /generate, /batch, /qc and /health over HTTP (JSON).")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count, 0 = inline on the event loop)")
+    parser.add_argument("--max-queue", type=int, default=1024, help="Packs admitted at once before answering 429 (default: 1024)")
+    parser.add_argument("--max-batch", type=int, default=1000, help="Max items per /batch or /qc request (default: 1000)")
+    parser.add_argument("--cache", default=None, help="SQLite response cache for engine=gemini requests")
+    args = parser.parse_args(argv)
+
+    cache = None
+    if args.cache:
+        from workflows.llm_cache import ResponseCache
+        cache = ResponseCache(args.cache)
+    print(f"🌐 GlowMiniAI API on http://{args.host}:{args.port} (Ctrl+C to stop)", file=sys.stderr)
+    serve(args.host, args.port, workers=args.workers, max_queue=args.max_queue, max_batch=args.max_batch, cache=cache)
+    return 0
+
+def cmd_serve(argv):
+    from workflows import daemon
+
+    parser = argparse.ArgumentParser(prog="glowctl serve", description="Keep a warm glowctl on a Unix socket; other glowctl calls forward to it.")
+    parser.add_argument("--socket", default=None, help=f"Socket path (default: $GLOWMINI_SOCKET or {daemon.default_socket()})")
+    parser.add_argument("--idle-timeout", type=float, default=900.0, help="Exit after this many seconds without calls (default: 900)")
+    parser.add_argument("--max-clients", type=int, default=64, help="Concurrent calls (default: 64)")
+    parser.add_argument("--detach", action="store_true", help="Run in the background")
+    parser.add_argument("--status", action="store_true", help="Show the running daemon and exit")
+    parser.add_argument("--stop", action="store_true", help="Stop the running daemon and exit")
+    args = parser.parse_args(argv)
+
+    path = args.socket or daemon.default_socket()
+    if args.status or args.stop:
+        info = daemon.ping(path)
+        if info is None:
+            print(f"No glowctl daemon on {path}")
+            return 1
+        if args.stop:
+            daemon.stop(path)
+            print(f"🛑 Stopped glowctl daemon (pid {info['pid']})")
+        else:
+            print(f"✅ glowctl daemon pid {info['pid']} on {info['socket']}: {info['served']} calls served, "
+                  f"{info['clients']} running, up {info['uptime_sec']}s")
+        return 0
+    if not daemon.supported():
+        print("❌ glowctl serve needs Unix domain sockets and fork()", file=sys.stderr)
+        return 1
+    if daemon.ping(path) is not None:
+        print(f"❌ A glowctl daemon is already listening on {path}", file=sys.stderr)
+        return 1
+
+    print(f"🔥 glowctl daemon on {path} (idle timeout {args.idle_timeout:.0f}s)", file=sys.stderr)
+    if args.detach:
+        daemon.detach()
+    daemon.Daemon(run, path=path, idle_timeout=args.idle_timeout, max_clients=args.max_clients).serve_forever()
+    return 0
+
+COMMANDS = {
+    "batch": cmd_batch,
+    "build": cmd_build,
+    "watch": cmd_watch,
+    "sweep": cmd_sweep,
+    "history": cmd_history,
+    "show": cmd_show,
+    "compact": cmd_compact,
+    "qc": cmd_qc,
+    "bench": cmd_bench,
+    "loadtest": cmd_loadtest,
+    "api": cmd_api,
+    "serve": cmd_serve,
+}
+
+# long-running or timing-sensitive commands always run in this process
+LOCAL_ONLY = {"serve", "api", "bench", "loadtest", "watch"}
+
+def _dispatch(argv):
+    if argv and argv[0] in COMMANDS:
+        return COMMANDS[argv[0]](argv[1:])
+    return cmd_generate(argv)
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    if not (argv and argv[0] in LOCAL_ONLY):
+        from workflows.daemon import forward
+        code = forward(argv)
+        if code is not None:
+            return code
+    return run(argv)
+
+def run(argv):
+    """Run a glowctl command line in this process (also what the daemon runs per call)."""
+    # global flags, accepted anywhere on the command line
+    opts = argparse.ArgumentParser(add_help=False, allow_abbrev=False)
+    opts.add_argument("--profile", action="store_true")
+    opts.add_argument("--cprofile", default=None)
+    flags, argv = opts.parse_known_args(argv)
+    if not (flags.profile or flags.cprofile):
+        return _dispatch(argv)
+
+    from workflows.tracing import trace
+    profiler = None
+    if flags.cprofile:
+        import cProfile
+        profiler = cProfile.Profile()
+    with trace() as t:
+        if profiler:
+            profiler.enable()
+        try:
+            return _dispatch(argv)
+        finally:
+            if profiler:
+                profiler.disable()
+            if flags.profile:
+                print("\n⏱  Stage timings (this process)\n" + t.format(), file=sys.stderr)
+            if profiler:
+                if flags.cprofile == "-":
+                    import pstats
+                    pstats.Stats(profiler, stream=sys.stderr).sort_stats("cumulative").print_stats(25)
+                else:
+                    profiler.dump_stats(flags.cprofile)
+                    print(f"📈 cProfile stats: {flags.cprofile} (python -m pstats {flags.cprofile})", file=sys.stderr)
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
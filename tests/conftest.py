@@ -0,0 +1,4 @@
+import os, sys
+
+# the repo is run from a checkout (no package install): make `workflows` importable
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,77 @@
+import asyncio, json
+
+import pytest
+
+from workflows.api import ApiService, HTTPError, _params
+
+def call(service, path, body, method="POST"):
+    return asyncio.run(service._dispatch(method, path, json.dumps(body).encode()))
+
+@pytest.mark.parametrize("body, message", [
+    ({"topic": "x", "language": 5}, "language must be a string"),
+    ({"topic": "x", "platform": {}}, "platform must be a string"),
+    ({"topic": "x", "seed": 1.5}, "seed must be an integer"),
+    ({"topic": "x", "seed": True}, "seed must be an integer"),
+    ({"topic": "x", "duration": "30"}, "duration_sec must be an integer"),
+    ({"topic": 7}, "topic must be a string"),
+    ({"topic": "  "}, "missing topic"),
+    (["x"], "expected a JSON object"),
+])
+def test_params_rejects_wrong_types(body, message):
+    with pytest.raises(HTTPError, match=message) as err:
+        _params(body)
+    assert err.value.status == 400
+
+def test_params_accepts_typed_fields():
+    assert _params({"topic": " Kho ", "lang": "en", "seed": 3, "duration_sec": 30, "style": None}) == \
+        {"topic": "Kho", "language": "en", "seed": 3, "duration_sec": 30}
+
+def test_generate_answers_400_not_500():
+    service = ApiService(workers=0)
+    status, payload, _ = call(service, "/generate", {"topic": "x", "language": 5})
+    assert status == 400 and "language" in payload["error"]
+    status, payload, _ = call(service, "/generate", {"topic": "Kho hàng", "seed": 1})
+    assert status == 200 and payload["outline"]
+    assert service.pending == 0
+
+def test_batch_item_errors_are_per_item():
+    service = ApiService(workers=0)
+    status, payload, _ = call(service, "/batch", {"items": [{"topic": "a", "seed": 1}, {"topic": "b", "seed": "1"}]})
+    assert status == 200
+    assert payload["ok"] == 1 and "seed must be an integer" in payload["results"][1]["error"]
+
+def test_oversized_batch_is_413_even_when_idle():
+    service = ApiService(workers=0, max_queue=2)
+    status, _, headers = call(service, "/batch", {"items": [{"topic": "a"}] * 3})
+    assert status == 413 and "Retry-After" not in headers
+    service.pending = 1  # capacity only temporarily used up: that one is worth retrying
+    status, _, headers = call(service, "/batch", {"items": [{"topic": "a"}] * 2})
+    assert status == 429 and headers["Retry-After"]
+
+@pytest.mark.parametrize("body", [
+    {"outline": "o", "script": 5, "shotlist": "s", "prompts": "p"},
+    {"packs": [{"outline": "o", "script": ["s"]}]},
+    {"packs": [{"outline": "o"}], "weights": {"Clarity": "high"}},
+    {"packs": [{"outline": "o"}], "thresholds": [1]},
+])
+def test_qc_rejects_bad_sections(body):
+    status, payload, _ = call(ApiService(workers=0), "/qc", body)
+    assert status == 400, payload
+
+@pytest.mark.parametrize("fallback", [True, False])
+def test_packed_and_unpacked_gemini_batches_answer_alike(monkeypatch, fallback):
+    from workflows import gemini_client
+    from workflows.ratelimit import GeminiScheduler
+
+    client = gemini_client.GeminiClient("k", transport=gemini_client.FakeTransport(fail=lambda n: RuntimeError("boom")),
+                                        retries=0, scheduler=GeminiScheduler())
+    monkeypatch.setitem(gemini_client._clients, ("k", gemini_client.MODEL_NAME), client)
+    shapes = []
+    for packed in (True, False):
+        body = {"engine": "gemini", "api_key": "k", "packed": packed, "fallback": fallback,
+                "items": [{"topic": "a", "seed": 1}, {"topic": "b", "seed": 2}]}
+        status, payload, _ = call(ApiService(workers=0), "/batch", body)
+        assert status == 200
+        shapes.append([sorted(k for k in r if k in ("error", "warning", "outline")) for r in payload["results"]])
+    assert shapes[0] == shapes[1]
+    assert shapes[0][0] == (["outline", "warning"] if fallback else ["error"])
@@ -0,0 +1,37 @@
+import json, os
+
+import pytest
+
+from workflows.batch import BatchReport, read_rows, run_batch
+from workflows.export import DirectorySink, PackExporter
+
+ROWS = [{"topic": "a", "seed": 1}, {"topic": "a", "seed": 1}, {"topic": "a", "seed": 1}, {"topic": "b", "seed": 2},
+        {"topic": ""}, {"topic": "c", "seed": "x"}]
+
+@pytest.fixture
+def rows_file(tmp_path):
+    path = tmp_path / "in.jsonl"
+    path.write_text("\n".join(json.dumps(r) for r in ROWS) + "\n", encoding="utf-8")
+    return str(path)
+
+@pytest.mark.parametrize("workers", [0, 2])
+def test_duplicate_rows_get_their_own_files(rows_file, tmp_path, workers):
+    out = tmp_path / "out"
+    seen = []
+    report = run_batch(read_rows(rows_file), str(out), workers=workers, chunk_size=2,
+                       on_result=lambda row_no, path, error: seen.append((row_no, path, error)))
+    assert (report.total, report.ok, report.failed) == (6, 4, 2)
+    files = sorted(os.listdir(out))
+    assert len(files) == 4 and not [f for f in files if f.endswith(".tmp")]
+    assert sum(1 for f in files if f.endswith("_2.md") or f.endswith("_3.md")) == 2
+    assert sorted(os.path.basename(p) for _, p, e in seen if e is None) == files
+
+def test_directory_mode_names_match_the_exporter(rows_file, tmp_path):
+    run_batch(read_rows(rows_file), str(tmp_path / "direct"), workers=0)
+    with PackExporter(DirectorySink(str(tmp_path / "exported"))) as exporter:
+        run_batch(read_rows(rows_file), None, workers=0, exporter=exporter)
+    unstamped = lambda d: sorted(name.split("_", 2)[2] for name in os.listdir(tmp_path / d))  # drop generated_at
+    assert unstamped("direct") == unstamped("exported")
+
+def test_rows_per_sec_counts_packs_only():
+    assert BatchReport(total=10, ok=4, failed=6, elapsed_sec=2.0).rows_per_sec == 2.0
@@ -0,0 +1,29 @@
+import pytest
+
+from workflows.classifier import ModeClassifier
+
+MODES = [
+    {"name": "Business Growth", "keywords": ["bán", "khách hàng", "shop"]},
+    {"name": "AI System", "keywords": ["dữ liệu", "ai"]},
+    {"name": "Education", "keywords": ["học"]},
+]
+
+@pytest.fixture
+def classifier():
+    return ModeClassifier(MODES, strategy="score", fold_exclude=["bán", "học"])
+
+@pytest.mark.parametrize("topic, mode", [
+    ("Học dữ liệu", "AI System"),
+    ("hoc du lieu", "AI System"),
+    ("hoc dữ lieu", "AI System"),      # partly accented: the ASCII-typed words still count
+    ("phân tích du lieu", "AI System"),
+    ("ban hang", "General"),           # fold_exclude: "ban" is not "bán"
+    ("bàn học", "Education"),
+])
+def test_partly_accented_topics(classifier, topic, mode):
+    assert classifier.classify(topic).mode == mode
+
+def test_folded_repeat_of_an_exact_hit_counts_once(classifier):
+    result = classifier.classify("dữ liệu, dữ liệu và du lieu")
+    assert result.scores["AI System"] == 3.0
+    assert sorted(result.matches) == ["du lieu", "dữ liệu", "dữ liệu"]
@@ -0,0 +1,65 @@
+import json
+
+import pytest
+
+from workflows.gemini_client import FakeTransport, GeminiClient, fake_pack_text
+from workflows.gemini_llm import PACK_KEYS, IncrementalPackParser
+from workflows.llm_cache import ResponseCache
+
+REQUEST = dict(topic="Kho hàng", language="vi", platform="TikTok", duration_sec=45, audience="General",
+               style_preset="Cinematic 3D")
+
+def _chunks(text, size):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+def test_parser_emits_each_field_once_as_it_completes():
+    text = json.dumps({"mode": "General", "outline": ["a", "b"], "script": "s {x}", "shotlist": ["S1"], "prompts": "p"})
+    parser = IncrementalPackParser()
+    seen = []
+    for chunk in _chunks("```json\n" + text + "\n```", 7):
+        seen += parser.feed(chunk)
+    assert parser.done
+    assert [k for k, _ in seen] == ["mode", "outline", "script", "shotlist", "prompts"]
+    assert dict(seen) == json.loads(text)
+    assert parser.close() == []
+
+def test_parser_leaves_cut_off_field_unreported():
+    text = json.dumps({"outline": "o", "script": "a long script"})
+    parser = IncrementalPackParser()
+    seen = parser.feed(text[:-10])
+    assert seen == [("outline", "o")]
+    assert not parser.done
+
+def test_stream_pack_yields_every_key_and_caches(tmp_path):
+    cache = ResponseCache(str(tmp_path / "c.sqlite"))
+    transport = FakeTransport()
+    client = GeminiClient("k", transport=transport, cache=cache, retries=0)
+    streamed = dict(client.stream_pack(**REQUEST))
+    assert set(streamed) == set(PACK_KEYS)
+    assert dict(client.stream_pack(**REQUEST)) == streamed
+    assert transport.calls == 1
+
+def test_truncated_stream_raises_and_is_not_cached(tmp_path):
+    cache = ResponseCache(str(tmp_path / "c.sqlite"))
+    assert len(fake_pack_text("Topic: Kho hàng")) > 900
+    transport = FakeTransport(max_output_chars=900)
+    client = GeminiClient("k", transport=transport, cache=cache, retries=0)
+    got = {}
+    with pytest.raises(ValueError, match="incomplete"):
+        for key, value in client.stream_pack(**REQUEST):
+            got[key] = value
+    assert got and set(got) != set(PACK_KEYS)
+    assert cache.stats()["entries"] == 0
+
+    client.transport.max_output_chars = None  # the next request gets a full answer, not the cut-off one
+    assert set(dict(client.stream_pack(**REQUEST))) == set(PACK_KEYS)
+    assert transport.calls == 2
+
+def test_truncated_blocking_answer_is_retried_then_raises(tmp_path):
+    cache = ResponseCache(str(tmp_path / "c.sqlite"))
+    transport = FakeTransport(max_output_chars=900)
+    client = GeminiClient("k", transport=transport, cache=cache, retries=1, backoff=0.0)
+    with pytest.raises(ValueError):
+        client.generate_pack(**REQUEST)
+    assert transport.calls == 2
+    assert cache.stats()["entries"] == 0
@@ -0,0 +1,81 @@
+import pytest
+
+from workflows import llm_cache
+from workflows.llm_cache import ResponseCache
+
+class Clock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(llm_cache, "time", clock)
+    return clock
+
+@pytest.fixture
+def cache(tmp_path):
+    c = ResponseCache(str(tmp_path / "cache.sqlite"), ttl_sec=60, max_entries=3, max_bytes=None, evict_every=1)
+    yield c
+    c.close()
+
+def test_key_ignores_whitespace_and_language_case():
+    a = ResponseCache.key_for({"topic": "Cà  phê ", "language": "VI"}, "v1")
+    assert a == ResponseCache.key_for({"topic": "Cà phê", "language": "vi"}, "v1")
+    assert a != ResponseCache.key_for({"topic": "Cà phê", "language": "vi"}, "v2")
+
+def test_entries_expire_after_ttl(cache, clock):
+    cache.put("k", {"v": 1})
+    clock.now += 60
+    assert cache.get("k") == {"v": 1}
+    clock.now += 1
+    assert cache.get("k") is None
+    stats = cache.stats()
+    assert (stats["entries"], stats["hits"], stats["misses"], stats["expired"]) == (0, 1, 1, 1)
+    assert stats["hit_rate"] == 0.5
+
+def test_evicts_least_recently_used_beyond_max_entries(cache, clock):
+    for key in "abc":
+        clock.now += 1
+        cache.put(key, {"k": key})
+    clock.now += 1
+    assert cache.get("a") == {"k": "a"}  # a is now the most recently used
+    clock.now += 1
+    cache.put("d", {"k": "d"})
+    assert [cache.get(k) is not None for k in "abcd"] == [True, False, True, True]
+    assert cache.stats()["evictions"] == 1
+
+def test_evict_drops_expired_and_oversized(tmp_path, clock):
+    cache = ResponseCache(str(tmp_path / "c.sqlite"), ttl_sec=10, max_entries=None, max_bytes=40, evict_every=1000)
+    cache.put("old", {"v": "x"})
+    clock.now += 20
+    for key in ("p", "q", "r"):
+        clock.now += 1
+        cache.put(key, {"v": "y" * 10})
+    assert cache.evict() == 2  # "old" expired, "p" is the least recently used over 40 bytes
+    assert cache.stats()["entries"] == 2 and cache.get("p") is None
+    cache.close()
+
+def test_get_or_compute_computes_once(cache):
+    calls = []
+    compute = lambda: calls.append(1) or {"v": len(calls)}
+    assert cache.get_or_compute("k", compute) == {"v": 1}
+    assert cache.get_or_compute("k", compute) == {"v": 1}
+    assert len(calls) == 1
+
+def test_refresh_misses_but_stores_the_new_answer(cache):
+    cache.put("k", {"v": "old"})
+    fresh = cache.refresh()
+    assert fresh.get("k") is None
+    assert fresh.get_or_compute("k", lambda: {"v": "new"}) == {"v": "new"}
+    assert cache.get("k") == {"v": "new"}
+    assert fresh.stats() == cache.stats()
+
+def test_clear_resets_entries_and_counters(cache):
+    cache.put("k", {"v": 1})
+    cache.get("k")
+    cache.clear()
+    assert cache.stats() == {"entries": 0, "bytes": 0, "hits": 0, "misses": 0, "hit_rate": 0.0, "evictions": 0, "expired": 0}
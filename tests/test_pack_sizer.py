@@ -0,0 +1,29 @@
+from workflows.gemini_client import FakeTransport, GeminiClient, PackSizer, fake_pack_text
+from workflows.gemini_llm import build_packed_prompt
+
+def requests(tag, n=20):
+    return [dict(topic=f"{tag} topic {i}", language="en", platform="TikTok", duration_sec=30, audience="General",
+                 style_preset="Cinematic 3D") for i in range(n)]
+
+def test_cut_off_item_is_not_charged_to_the_parsed_ones():
+    sizer = PackSizer(item_output_chars=1000.0)
+    sizer.observe(items=4, response_chars=2500, parsed=2, complete=False)
+    assert sizer.item_output_chars == 0.7 * 1000 + 0.3 * 2500 / 3
+    assert sizer.size([50] * 10) >= 2
+
+def test_no_pairs_once_two_items_do_not_fit():
+    sizer = PackSizer()
+    sizer.observe(items=2, response_chars=5000, parsed=1, complete=False)
+    assert sizer.size([50] * 10) == 1
+
+def test_pack_size_recovers_after_truncated_answers():
+    item_chars = len(fake_pack_text(build_packed_prompt(requests("x", 1))))
+    transport = FakeTransport(max_output_chars=int(item_chars * 2.5))  # room for two items, not three
+    client = GeminiClient("k", transport=transport, retries=0)
+    first = client.generate_packed(requests("a"))
+    assert client.sizer.stats["truncated"] and all(isinstance(r, dict) for r in first)
+
+    before = transport.calls
+    second = client.generate_packed(requests("b"))
+    assert all(isinstance(r, dict) for r in second)
+    assert transport.calls - before <= 12  # packs of two, not 20 single calls
@@ -0,0 +1,120 @@
+import asyncio, threading, time
+
+import pytest
+
+from workflows.ratelimit import (
+    BATCH, FAILED, INTERACTIVE, OK, THROTTLED, AdaptiveTokenBucket, CircuitBreaker, CircuitOpenError, GeminiScheduler,
+    QueueTimeoutError, deadline,
+)
+
+def test_bucket_has_no_limit_until_the_first_throttle():
+    bucket = AdaptiveTokenBucket(None, burst=4)
+    now = time.monotonic()
+    for _ in range(100):
+        bucket.refill(now)
+        assert bucket.wait_time() == 0.0
+        bucket.take(now)
+    bucket.on_throttle(now)
+    assert bucket.rate == 50.0  # half of what was granted in the last second
+    assert bucket.tokens <= 0
+
+def test_bucket_growth_scales_with_rate_and_respects_ceiling():
+    bucket = AdaptiveTokenBucket(None, burst=4, growth=0.1)
+    bucket.on_throttle(time.monotonic())
+    bucket.rate = 20.0
+    bucket.on_success(time.monotonic())
+    assert bucket.rate == pytest.approx(22.0)
+    capped = AdaptiveTokenBucket(5.0, burst=1)
+    capped.on_throttle(time.monotonic())
+    for _ in range(1000):
+        capped.on_success(time.monotonic())
+    assert capped.rate == 5.0
+
+def test_bucket_recovers_after_a_quiet_period():
+    bucket = AdaptiveTokenBucket(None, burst=4, recover_after=10.0)
+    now = time.monotonic()
+    bucket.on_throttle(now)
+    bucket.on_success(now + 5)
+    assert bucket.rate is not None
+    bucket.on_success(now + 11)
+    assert bucket.rate is None
+
+def test_breaker_opens_probes_and_backs_off():
+    breaker = CircuitBreaker(threshold=2, cooldown=10.0, max_cooldown=15.0)
+    breaker.on_failure(0.0)
+    assert breaker.allow(0.0)
+    breaker.on_failure(1.0)
+    assert breaker.state == "open" and not breaker.allow(5.0)
+    assert breaker.allow(11.0) and breaker.state == "half_open"
+    breaker.on_grant(11.0)
+    assert not breaker.allow(12.0)  # one probe at a time
+    breaker.on_failure(12.0)
+    assert breaker.state == "open" and breaker.cooldown == 15.0
+    assert breaker.allow(27.0)
+    breaker.on_success()
+    assert breaker.state == "closed" and breaker.cooldown == 10.0
+
+def test_scheduler_rejects_while_open():
+    scheduler = GeminiScheduler(failure_threshold=1, cooldown=60.0)
+    scheduler.acquire("k")
+    scheduler.release("k", FAILED)
+    assert not scheduler.available("k")
+    with pytest.raises(CircuitOpenError):
+        scheduler.acquire("k")
+
+def test_throttle_sets_a_rate_from_the_granted_one():
+    scheduler = GeminiScheduler()
+    for _ in range(10):
+        scheduler.acquire("k")
+        scheduler.release("k", OK)
+    assert scheduler.stats()["…k"]["rate"] is None
+    scheduler.acquire("k")
+    scheduler.release("k", THROTTLED)
+    assert scheduler.stats()["…k"]["rate"] == pytest.approx(5.5)
+
+def test_aacquire_waits_on_the_loop_in_priority_order():
+    scheduler = GeminiScheduler(rate=100.0, burst=1.0, max_wait={INTERACTIVE: None})
+    order = []
+
+    async def one(level, tag):
+        await scheduler.aacquire("k", level)
+        order.append(tag)
+        scheduler.release("k", OK)
+
+    async def main():
+        threads = threading.active_count()
+        batch = [asyncio.create_task(one(BATCH, "b")) for _ in range(50)]
+        await asyncio.sleep(0.02)
+        assert threading.active_count() <= threads  # no thread per waiting call
+        await one(INTERACTIVE, "i")
+        await asyncio.gather(*batch)
+
+    asyncio.run(main())
+    assert len(order) == 51 and order.index("i") < 10
+
+def test_cancelled_aacquire_leaves_the_queue():
+    scheduler = GeminiScheduler(rate=1.0, burst=1.0)
+
+    async def main():
+        await scheduler.aacquire("k", BATCH)  # takes the only token
+        task = asyncio.create_task(scheduler.aacquire("k", BATCH))
+        await asyncio.sleep(0.01)
+        assert scheduler.stats()["…k"]["queued"]["batch"] == 1
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(main())
+    stats = scheduler.stats()["…k"]
+    assert stats["queued"]["batch"] == 0 and stats["granted"] == 1
+
+def test_aacquire_honours_an_enclosing_deadline():
+    scheduler = GeminiScheduler(rate=1.0, burst=1.0)
+
+    async def main():
+        with deadline(time.monotonic() + 0.05):
+            await scheduler.aacquire("k", BATCH)
+            with pytest.raises(QueueTimeoutError):
+                await scheduler.aacquire("k", BATCH)
+
+    asyncio.run(main())
+    assert scheduler.stats()["…k"]["timed_out"] == 1
@@ -0,0 +1,51 @@
+import os
+
+import pytest
+
+from workflows.engine import generate_media_pack, pack_digest, result_dict
+from workflows.store import PackStore
+
+@pytest.fixture
+def packs():
+    return [generate_media_pack(topic=t, seed=s) for t, s in (("cà phê sáng", 1), ("học tiếng Anh", 2), ("cà phê sáng", 3))]
+
+@pytest.fixture
+def store(tmp_path):
+    s = PackStore(str(tmp_path / "store"), max_segment_bytes=4096)
+    yield s
+    s.close()
+
+def test_put_get_round_trip(store, packs):
+    ids = store.put_many(packs + packs[:1])
+    assert ids == [pack_digest(p) for p in packs] and len(store) == 3
+    for pack_id, res in zip(ids, packs):
+        assert pack_id in store
+        assert result_dict(store.get(pack_id)) == result_dict(res)
+    assert store.put(packs[0]) == ids[0] and len(store) == 3
+    with pytest.raises(KeyError):
+        store.get("missing")
+
+def test_find_filters_the_index(store, packs):
+    store.put_many(packs)
+    assert {e.seed for e in store.find(topic="cà phê sáng")} == {1, 3}
+    assert [e.seed for e in store.find(seed=2)] == [2]
+    entry = store.find(seed=2)[0]
+    assert store.find(mode=entry.mode, seed=2) == [entry]
+    assert [r.topic for r in store.scan(topic="học tiếng Anh")] == ["học tiếng Anh"]
+
+def test_delete_compact_and_reindex(store, packs, tmp_path):
+    ids = store.put_many(packs)
+    assert store.delete(ids[1]) and not store.delete(ids[1])
+    assert ids[1] not in store and len(store) == 2
+    assert store.reindex() == 2 and ids[1] not in store
+    stats = store.compact()
+    assert stats["records"] == 2 and stats["bytes_after"] < stats["bytes_before"]
+    assert result_dict(store.get(ids[2])) == result_dict(packs[2])
+    store.close()
+    for name in os.listdir(tmp_path / "store"):
+        if name.startswith("index.sqlite"):
+            os.remove(tmp_path / "store" / name)  # lose the index; the segments are the source of truth
+    reopened = PackStore(str(tmp_path / "store"), max_segment_bytes=4096)
+    assert reopened.reindex() == 2
+    assert sorted(e.id for e in reopened.find()) == sorted(ids[::2])
+    reopened.close()
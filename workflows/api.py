@@ -0,0 +1,473 @@
+from __future__ import annotations
+import os, json, time, signal, asyncio, functools
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Any, List, Optional, Tuple, Callable, TYPE_CHECKING
+
+from workflows.engine import WorkflowResult, generate_media_pack, quality_check_pack, pack_digest, reroll_section, result_dict
+from workflows.batch import normalize_row
+from workflows.ratelimit import BATCH, SchedulerRejected, get_scheduler, priority
+
+if TYPE_CHECKING:
+    from workflows.llm_cache import ResponseCache
+
+_REASONS = {
+    200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 413: "Payload Too Large",
+    429: "Too Many Requests", 431: "Request Header Fields Too Large", 500: "Internal Server Error",
+    501: "Not Implemented", 502: "Bad Gateway", 503: "Service Unavailable",
+}
+
+class HTTPError(Exception):
+    def __init__(self, status: int, message: str, headers: Optional[Dict[str, str]] = None):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers or {}
+
+# ---------- work units (module level so they can run in worker processes) ----------
+
+def pack_payload(res: WorkflowResult, qc: bool = False) -> Dict[str, Any]:
+    """JSON body for one pack: the WorkflowResult fields, its digest and optional QC."""
+    out = result_dict(res)
+    out["digest"] = pack_digest(res)
+    if qc:
+        scores, avg, suggestions = quality_check_pack(res.outline, res.script, res.shotlist, res.prompts)
+        out["qc"] = {"scores": scores, "average": avg, "suggestions": suggestions}
+    return out
+
+def _generate_one(params: Dict[str, Any], qc: bool) -> Dict[str, Any]:
+    return pack_payload(generate_media_pack(**params), qc)
+
+def _generate_chunk(items: List[Tuple[int, Dict[str, Any]]], qc: bool) -> List[Tuple[int, Dict[str, Any]]]:
+    out = []
+    for i, params in items:
+        try:
+            out.append((i, pack_payload(generate_media_pack(**params), qc)))
+        except Exception as e:
+            out.append((i, {"error": f"{type(e).__name__}: {e}"}))
+    return out
+
+def _reroll_one(pack: Dict[str, Any], section: str, seed: Optional[int], qc: bool) -> Dict[str, Any]:
+    return pack_payload(reroll_section(_result(pack), section, seed), qc)
+
+def _qc_packs(packs: List[Dict[str, Any]], weights: Optional[Dict[str, float]], thresholds: Optional[Dict[str, float]]) -> Dict[str, Any]:
+    from workflows.qc import qc_many
+
+    report = qc_many(packs, weights=weights, thresholds=thresholds)
+    return {
+        "criteria": list(report.criteria),
+        "packs": [dict(zip(("scores", "average", "suggestions"), report.pack(i))) for i in range(len(packs))],
+        "stats": report.stats,
+    }
+
+# ---------- service ----------
+
+class ApiService:
+    """
+    Minimal HTTP/1.1 JSON service on asyncio streams (keep-alive, Content-Length bodies).
+
+      GET  /health    liveness + queue depth + Gemini scheduler state per key
+      POST /generate  {topic, language, platform, duration_sec, audience, style_preset, seed, qc, engine, deadline_ms}
+      POST /batch     {items: [...], qc, engine}
+      POST /qc        {outline, script, shotlist, prompts} or {packs: [...], weights, thresholds}
+      POST /reroll    {pack: <a /generate response>, section, seed, qc} -> the pack with one section re-rolled
+
+    Offline work runs in a process pool (workers=0: inline on the event loop). Every
+    admitted pack takes a slot until it is answered; with `max_queue` slots in use new
+    requests get 429 + Retry-After instead of piling up. engine="gemini" goes through
+    the async Gemini client (key from the request or GEMINI_API_KEY) and falls back to
+    the offline engine on errors unless fallback=false. Gemini calls pass the
+    process-wide ratelimit scheduler: /generate queues as interactive, /batch as
+    batch, and while the key's circuit is open they fall back without calling out.
+    /generate with engine=gemini and deadline_ms is hedged: the Gemini pack if it
+    arrives in time, else the offline pack at the deadline (meta.hedge says which).
+    """
+
+    def __init__(self, workers: Optional[int] = None, max_queue: int = 1024, max_batch: int = 1000,
+                 max_body: int = 8 * 1024 * 1024, chunk_size: int = 64, gemini_api_key: Optional[str] = None,
+                 cache: Optional["ResponseCache"] = None):
+        self.workers = (os.cpu_count() or 1) if workers is None else workers
+        self.max_queue = max_queue
+        self.max_batch = max_batch
+        self.max_body = max_body
+        self.chunk_size = max(1, chunk_size)
+        self.gemini_api_key = gemini_api_key if gemini_api_key is not None else os.environ.get("GEMINI_API_KEY", "")
+        self.cache = cache
+        self.pending = 0
+        self.started = time.time()
+        self.counters: Dict[str, int] = {"requests": 0, "packs": 0, "rejected": 0, "errors": 0, "gemini": 0, "fallbacks": 0,
+                                         "hedged": 0, "hedged_offline": 0}
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._stop: Optional[asyncio.Event] = None
+        self._connections: set = set()
+        self._routes: Dict[str, Tuple[str, Callable]] = {
+            "/health": ("GET", self.health),
+            "/generate": ("POST", self.generate),
+            "/batch": ("POST", self.batch),
+            "/qc": ("POST", self.qc),
+            "/reroll": ("POST", self.reroll),
+        }
+
+    # ----- lifecycle -----
+    async def start(self, host: str = "127.0.0.1", port: int = 8080) -> asyncio.AbstractServer:
+        if self.workers > 0:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        self._server = await asyncio.start_server(self._handle, host, port, limit=64 * 1024, backlog=1024)
+        return self._server
+
+    async def serve_forever(self, host: str = "127.0.0.1", port: int = 8080) -> None:
+        """Serve until stop() or SIGINT/SIGTERM; the worker pool is shut down on the way out."""
+        self._stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, self._stop.set)
+            except (NotImplementedError, RuntimeError):
+                pass  # Windows / not the main thread: Ctrl+C still raises KeyboardInterrupt
+        server = await self.start(host, port)
+        try:
+            async with server:
+                await self._stop.wait()
+                server.close()
+                # drop idle keep-alive connections; their handlers exit quietly
+                for task in list(self._connections):
+                    task.cancel()
+                await asyncio.gather(*self._connections, return_exceptions=True)
+        finally:
+            self.close()
+
+    def stop(self) -> None:
+        if self._stop is not None:
+            self._stop.set()
+
+    def close(self) -> None:
+        if self._server is not None:
+            self._server.close()
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
+
+    # ----- backpressure -----
+    def _admit(self, n: int = 1) -> None:
+        if n > self.max_queue:
+            # would never fit, however long the client waits: not a 429
+            raise HTTPError(413, f"request needs {n} pack slots, over the server's {self.max_queue}")
+        if self.pending + n > self.max_queue:
+            self.counters["rejected"] += 1
+            raise HTTPError(429, f"server busy: {self.pending} packs pending (max {self.max_queue})", {"Retry-After": "1"})
+        self.pending += n
+
+    async def _run(self, fn: Callable, *args: Any) -> Any:
+        if self._pool is None:
+            return fn(*args)
+        return await asyncio.get_running_loop().run_in_executor(self._pool, fn, *args)
+
+    # ----- handlers -----
+    async def health(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        return {"status": "ok", "pending": self.pending, "max_queue": self.max_queue, "workers": self.workers,
+                "uptime_sec": round(time.time() - self.started, 1), **self.counters, "gemini": get_scheduler().stats()}
+
+    async def generate(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        params = _params(body)
+        qc = bool(body.get("qc", False))
+        self._admit()
+        try:
+            if body.get("engine") == "gemini":
+                if body.get("deadline_ms") is not None:
+                    return await self._gemini_hedged(params, body, qc)
+                return await self._gemini_one(params, body, qc)
+            return await self._run(_generate_one, params, qc)
+        finally:
+            self.pending -= 1
+
+    async def batch(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        items = body.get("items")
+        if not isinstance(items, list):
+            raise HTTPError(400, "expected {\"items\": [...]}")
+        if len(items) > min(self.max_batch, self.max_queue):
+            raise HTTPError(413, f"batch too large: {len(items)} items (max {min(self.max_batch, self.max_queue)})")
+        qc = bool(body.get("qc", False))
+        results: List[Optional[Dict[str, Any]]] = [None] * len(items)
+        valid: List[Tuple[int, Dict[str, Any]]] = []
+        for i, item in enumerate(items):
+            try:
+                valid.append((i, _params(item)))
+            except HTTPError as e:
+                results[i] = {"error": str(e)}
+        self._admit(max(1, len(valid)))
+        try:
+            if body.get("engine") == "gemini":
+                if body.get("packed", True) and len(valid) > 1:
+                    done = await self._gemini_packed([p for _, p in valid], body, qc)
+                else:
+                    with priority(BATCH):  # the gathered tasks inherit it
+                        done = await asyncio.gather(*(self._gemini_one(p, body, qc) for _, p in valid), return_exceptions=True)
+                for (i, _), r in zip(valid, done):
+                    results[i] = {"error": f"{type(r).__name__}: {r}"} if isinstance(r, BaseException) else r
+            else:
+                chunks = [valid[k:k + self.chunk_size] for k in range(0, len(valid), self.chunk_size)]
+                for chunk in await asyncio.gather(*(self._run(_generate_chunk, c, qc) for c in chunks)):
+                    for i, r in chunk:
+                        results[i] = r
+        finally:
+            self.pending -= max(1, len(valid))
+        failed = sum(1 for r in results if "error" in r)
+        self.counters["packs"] += len(results) - failed
+        return {"results": results, "ok": len(results) - failed, "failed": failed}
+
+    async def qc(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        packs = body.get("packs")
+        if packs is None:
+            missing = [k for k in ("outline", "script", "shotlist", "prompts") if not isinstance(body.get(k), str)]
+            if missing:
+                raise HTTPError(400, f"missing section(s): {', '.join(missing)}")
+            scores, avg, suggestions = quality_check_pack(body["outline"], body["script"], body["shotlist"], body["prompts"])
+            return {"scores": scores, "average": avg, "suggestions": suggestions}
+        if not isinstance(packs, list) or not all(isinstance(p, dict) for p in packs):
+            raise HTTPError(400, "expected {\"packs\": [{outline, script, shotlist, prompts}, ...]}")
+        for i, pack in enumerate(packs):
+            bad = [k for k in ("outline", "script", "shotlist", "prompts") if not isinstance(pack.get(k, ""), (str, type(None)))]
+            if bad:
+                raise HTTPError(400, f"packs[{i}]: section(s) must be strings: {', '.join(bad)}")
+        for name in ("weights", "thresholds"):
+            value = body.get(name)
+            if value is not None and not (isinstance(value, dict) and all(
+                    isinstance(v, (int, float)) and not isinstance(v, bool) for v in value.values())):
+                raise HTTPError(400, f"{name} must be an object of numbers per criterion")
+        if len(packs) > min(self.max_batch, self.max_queue):
+            raise HTTPError(413, f"too many packs: {len(packs)} (max {min(self.max_batch, self.max_queue)})")
+        self._admit(max(1, len(packs)))
+        try:
+            return await self._run(_qc_packs, packs, body.get("weights"), body.get("thresholds"))
+        except ValueError as e:
+            raise HTTPError(400, str(e))
+        finally:
+            self.pending -= max(1, len(packs))
+
+    async def reroll(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        pack = body.get("pack")
+        section = body.get("section")
+        if not isinstance(pack, dict) or not isinstance(section, str):
+            raise HTTPError(400, "expected {\"pack\": {...}, \"section\": \"hook|outline|script|shotlist|prompts\"}")
+        qc = bool(body.get("qc", False))
+        self._admit()
+        try:
+            if (pack.get("meta") or {}).get("mode") == "gemini":
+                from workflows.gemini_llm import gemini_reroll_pack
+
+                key = str(body.get("api_key") or self.gemini_api_key).strip()
+                if not key:
+                    raise HTTPError(400, "Gemini pack: re-roll needs an api_key (request body or GEMINI_API_KEY)")
+                res = await asyncio.get_running_loop().run_in_executor(None, gemini_reroll_pack, key, _result(pack), section)
+                return pack_payload(res, qc)
+            return await self._run(_reroll_one, pack, section, body.get("seed"), qc)
+        except (ValueError, TypeError) as e:
+            raise HTTPError(400, str(e))
+        finally:
+            self.pending -= 1
+
+    def _gemini_key(self, body: Dict[str, Any]) -> str:
+        key = str(body.get("api_key") or self.gemini_api_key).strip()
+        if not key:
+            raise HTTPError(400, "engine=gemini needs an api_key (request body or GEMINI_API_KEY)")
+        return key
+
+    async def _gemini_fallback(self, params: Dict[str, Any], body: Dict[str, Any], qc: bool, e: Exception) -> Dict[str, Any]:
+        rejected = isinstance(e, SchedulerRejected)
+        if body.get("fallback", True) is False:
+            if rejected:
+                raise HTTPError(503, f"Gemini skipped: {e}", {"Retry-After": str(max(1, round(e.retry_after)))})
+            raise HTTPError(502, f"Gemini error: {e}")
+        self.counters["fallbacks"] += 1
+        out = await self._run(_generate_one, params, qc)
+        out["warning"] = f"{'Gemini skipped' if rejected else 'Gemini error'}, offline fallback: {e}"
+        return out
+
+    async def _gemini_answer(self, params: Dict[str, Any], body: Dict[str, Any], qc: bool, data: Any) -> Dict[str, Any]:
+        """One item's Gemini answer (or the exception raised instead) as its pack; every failure goes to _gemini_fallback."""
+        from workflows.gemini_llm import pack_result
+
+        try:
+            if isinstance(data, BaseException):
+                raise data
+            return pack_payload(pack_result(data, **_gemini_request(params)), qc)
+        except Exception as e:
+            return await self._gemini_fallback(params, body, qc, e)
+
+    async def _gemini_one(self, params: Dict[str, Any], body: Dict[str, Any], qc: bool) -> Dict[str, Any]:
+        from workflows.gemini_client import get_client
+
+        key = self._gemini_key(body)
+        self.counters["gemini"] += 1
+        try:
+            data = await get_client(key).agenerate_pack(cache=self.cache, **_gemini_request(params))
+        except Exception as e:
+            data = e
+        return await self._gemini_answer(params, body, qc, data)
+
+    async def _gemini_hedged(self, params: Dict[str, Any], body: Dict[str, Any], qc: bool) -> Dict[str, Any]:
+        from workflows.hedge import HedgedGeneration
+
+        try:
+            deadline_ms = float(body["deadline_ms"])
+        except (TypeError, ValueError):
+            raise HTTPError(400, "deadline_ms must be a number")
+        if deadline_ms < 0:
+            raise HTTPError(400, "deadline_ms must be >= 0")
+        key = self._gemini_key(body)
+        self.counters["gemini"] += 1
+        self.counters["hedged"] += 1
+        # the offline pack is generated inline: it takes well under a millisecond
+        hedged = HedgedGeneration(key, seed=params.get("seed"), deadline_sec=deadline_ms / 1000.0, cache=self.cache,
+                                  **_gemini_request(params))
+        res = await hedged.aresult()
+        if not hedged.upgraded:
+            self.counters["hedged_offline"] += 1
+        return pack_payload(res, qc)
+
+    async def _gemini_packed(self, items: List[Dict[str, Any]], body: Dict[str, Any], qc: bool) -> List[Any]:
+        """
+        Several topics per model call (GeminiClient.generate_packed). Each item ends
+        as it would through _gemini_one: its pack, _gemini_fallback's answer to a
+        failed call or a missing/bad item, or the missing-api_key error.
+        """
+        from workflows.gemini_client import get_client
+
+        try:
+            key = self._gemini_key(body)
+        except HTTPError as e:
+            return [e] * len(items)  # _gemini_one raises it for every item too
+        requests = [_gemini_request(p) for p in items]
+        self.counters["gemini"] += len(requests)
+        client = get_client(key)
+        loop = asyncio.get_running_loop()
+        try:
+            done = await loop.run_in_executor(None, functools.partial(client.generate_packed, requests, cache=self.cache))
+        except Exception as e:
+            done = [e] * len(requests)
+        return list(await asyncio.gather(*(self._gemini_answer(p, body, qc, d) for p, d in zip(items, done)),
+                                         return_exceptions=True))
+
+    # ----- HTTP plumbing -----
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        task = asyncio.current_task()
+        self._connections.add(task)
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except asyncio.IncompleteReadError:
+                    break
+                except asyncio.LimitOverrunError:
+                    writer.write(_response(431, {"error": "headers too large"}, False))
+                    break
+                try:
+                    method, target, version, headers = _parse_head(head)
+                except ValueError:
+                    writer.write(_response(400, {"error": "malformed request"}, False))
+                    break
+                keep_alive = _keep_alive(version, headers)
+                if "chunked" in headers.get("transfer-encoding", "").lower():
+                    writer.write(_response(501, {"error": "chunked bodies are not supported; send Content-Length"}, False))
+                    break
+                try:
+                    length = int(headers.get("content-length") or 0)
+                    if length < 0:
+                        raise ValueError
+                except ValueError:
+                    writer.write(_response(400, {"error": "invalid Content-Length"}, False))
+                    break
+                if length > self.max_body:
+                    writer.write(_response(413, {"error": f"body over {self.max_body} bytes"}, False))
+                    break
+                body = await reader.readexactly(length) if length else b""
+                status, payload, extra = await self._dispatch(method, target.split("?", 1)[0], body)
+                writer.write(_response(status, payload, keep_alive, extra))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except asyncio.CancelledError:
+            pass  # shutting down
+        finally:
+            self._connections.discard(task)
+            writer.close()
+
+    async def _dispatch(self, method: str, path: str, raw: bytes) -> Tuple[int, Any, Dict[str, str]]:
+        self.counters["requests"] += 1
+        try:
+            route = self._routes.get(path.rstrip("/") or "/")
+            if route is None:
+                raise HTTPError(404, f"no route {path}")
+            if method != route[0]:
+                raise HTTPError(405, f"{path} expects {route[0]}", {"Allow": route[0]})
+            try:
+                body = json.loads(raw) if raw.strip() else {}
+            except ValueError as e:
+                raise HTTPError(400, f"invalid JSON: {e}")
+            if not isinstance(body, dict):
+                raise HTTPError(400, "expected a JSON object")
+            payload = await route[1](body)
+            if path.startswith("/generate"):
+                self.counters["packs"] += 1
+            return 200, payload, {}
+        except HTTPError as e:
+            return e.status, {"error": str(e)}, e.headers
+        except Exception as e:
+            self.counters["errors"] += 1
+            return 500, {"error": f"{type(e).__name__}: {e}"}, {}
+
+def _result(pack: Dict[str, Any]) -> WorkflowResult:
+    # a /generate response: WorkflowResult fields plus digest/qc/warning extras
+    try:
+        return WorkflowResult(**{k: pack[k] for k in WorkflowResult.__dataclass_fields__ if k in pack})
+    except TypeError as e:
+        raise ValueError(f"not a pack: {e}")
+
+def _params(raw: Any) -> Dict[str, Any]:
+    if not isinstance(raw, dict):
+        raise HTTPError(400, "expected a JSON object per pack")
+    try:
+        return normalize_row(raw, strict=True)
+    except (ValueError, TypeError) as e:
+        raise HTTPError(400, str(e))
+
+def _gemini_request(params: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "topic": params["topic"], "language": params.get("language", "vi"),
+        "platform": params.get("platform", "YouTube Shorts"), "duration_sec": int(params.get("duration_sec", 35)),
+        "audience": params.get("audience", "General"), "style_preset": params.get("style_preset", "Cinematic 3D"),
+    }
+
+def _parse_head(head: bytes) -> Tuple[str, str, str, Dict[str, str]]:
+    lines = head.decode("latin-1").split("\r\n")
+    method, target, version = lines[0].split(" ", 2)
+    headers = {}
+    for line in lines[1:]:
+        if line:
+            name, sep, value = line.partition(":")
+            if not sep:
+                raise ValueError(line)
+            headers[name.strip().lower()] = value.strip()
+    return method.upper(), target, version.strip().upper(), headers
+
+def _keep_alive(version: str, headers: Dict[str, str]) -> bool:
+    conn = headers.get("connection", "").lower()
+    return conn == "keep-alive" if version == "HTTP/1.0" else conn != "close"
+
+def _response(status: int, payload: Any, keep_alive: bool, headers: Optional[Dict[str, str]] = None) -> bytes:
+    body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    lines = [f"HTTP/1.1 {status} {_REASONS.get(status, 'Unknown')}",
+             "Content-Type: application/json; charset=utf-8",
+             f"Content-Length: {len(body)}",
+             f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+    lines += [f"{k}: {v}" for k, v in (headers or {}).items()]
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body
+
+def serve(host: str = "127.0.0.1", port: int = 8080, **options: Any) -> None:
+    """Blocking entry point used by `glowctl api`."""
+    service = ApiService(**options)
+    try:
+        asyncio.run(service.serve_forever(host, port))
+    except KeyboardInterrupt:
+        pass
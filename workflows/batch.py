@@ -0,0 +1,210 @@
+from __future__ import annotations
+import csv, json, os, time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from dataclasses import dataclass, field
+from typing import Dict, Any, Iterable, Iterator, List, Optional, Tuple, Callable, TYPE_CHECKING
+
+from workflows.engine import generate_media_pack, build_markdown, pack_name
+from workflows.export import unique_name
+
+if TYPE_CHECKING:
+    from workflows.export import PackExporter
+
+# Column aliases accepted in CSV headers / JSONL keys
+_ALIASES = {"lang": "language", "duration": "duration_sec", "style": "style_preset"}
+_FIELDS = ("topic", "language", "platform", "duration_sec", "audience", "style_preset", "seed")
+_INT_FIELDS = ("duration_sec", "seed")
+
+# (row_no, params) or (row_no, error message) for rows that could not be parsed
+Row = Tuple[int, Dict[str, Any]]
+
+def normalize_row(raw: Dict[str, Any], strict: bool = False) -> Dict[str, Any]:
+    """
+    Map a raw CSV/JSONL record to generate_media_pack() keyword arguments. With
+    `strict` (JSON request bodies) values must already have their type: integers
+    for duration_sec/seed (not bools or floats), strings for the rest (TypeError).
+    """
+    row: Dict[str, Any] = {}
+    for key, value in raw.items():
+        if key is None:
+            continue
+        key = _ALIASES.get(key.strip().lower(), key.strip().lower())
+        if key not in _FIELDS:
+            continue
+        if strict and value is not None:
+            if key in _INT_FIELDS and (not isinstance(value, int) or isinstance(value, bool)):
+                raise TypeError(f"{key} must be an integer")
+            if key not in _INT_FIELDS and not isinstance(value, str):
+                raise TypeError(f"{key} must be a string")
+        if isinstance(value, str):
+            value = value.strip()
+        if value is None or value == "":
+            continue
+        if key in _INT_FIELDS:
+            value = int(value)
+        row[key] = value
+    if not str(row.get("topic", "")).strip():
+        raise ValueError("missing topic")
+    row["topic"] = str(row["topic"]).strip()
+    return row
+
+def read_rows(path: str) -> Iterator[Tuple[int, Any]]:
+    """
+    Stream rows from a .csv (header required) or .jsonl file.
+    Yields (row_no, params_dict) or (row_no, ValueError) so bad rows
+    are reported without stopping the run.
+    """
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        if path.lower().endswith((".jsonl", ".ndjson")):
+            for row_no, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    raw = json.loads(line)
+                    if not isinstance(raw, dict):
+                        raise ValueError("expected a JSON object")
+                    yield row_no, normalize_row(raw)
+                except (TypeError, ValueError) as e:
+                    yield row_no, ValueError(str(e))
+        else:
+            for row_no, raw in enumerate(csv.DictReader(f), 1):
+                try:
+                    yield row_no, normalize_row(raw)
+                except (TypeError, ValueError) as e:
+                    yield row_no, ValueError(str(e))
+
+def _stage_pack(res: Any, out_dir: str, row_no: int) -> Tuple[str, str]:
+    # written under a temporary name; the parent gives it its final, collision-free one (_place)
+    path = os.path.join(out_dir, pack_name(res))
+    staged = f"{path}.{os.getpid()}.{row_no}.tmp"
+    with open(staged, "w", encoding="utf-8") as f:
+        f.write(build_markdown(res))
+    return staged, path
+
+def _run_chunk(chunk: List[Row], out_dir: Optional[str]) -> List[Tuple[int, Any, Optional[str]]]:
+    # Runs inside a worker process. With an out_dir the pack is written here and
+    # only its path travels back; without one the result goes to the parent's exporter.
+    done = []
+    if out_dir:
+        os.makedirs(out_dir, exist_ok=True)
+    for row_no, params in chunk:
+        try:
+            res = generate_media_pack(**params)
+            done.append((row_no, _stage_pack(res, out_dir, row_no) if out_dir else res, None))
+        except Exception as e:
+            done.append((row_no, None, f"{type(e).__name__}: {e}"))
+    return done
+
+@dataclass
+class BatchReport:
+    total: int = 0
+    ok: int = 0
+    failed: int = 0
+    elapsed_sec: float = 0.0
+    failures: List[Tuple[int, str]] = field(default_factory=list)
+
+    @property
+    def rows_per_sec(self) -> float:
+        """Packs produced per second (failed rows are not throughput)."""
+        return self.ok / self.elapsed_sec if self.elapsed_sec > 0 else 0.0
+
+def _chunked(rows: Iterable[Tuple[int, Any]], size: int, report: BatchReport, on_result) -> Iterator[List[Row]]:
+    chunk: List[Row] = []
+    for row_no, params in rows:
+        if isinstance(params, Exception):
+            report.total += 1
+            _record(report, row_no, None, str(params), on_result)
+            continue
+        chunk.append((row_no, params))
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def _record(report: BatchReport, row_no: int, path: Optional[str], error: Optional[str], on_result, max_failures: int = 1000) -> None:
+    if error is None:
+        report.ok += 1
+    else:
+        report.failed += 1
+        if len(report.failures) < max_failures:
+            report.failures.append((row_no, error))
+    if on_result:
+        on_result(row_no, path, error)
+
+def run_batch(
+    rows: Iterable[Tuple[int, Any]],
+    out_dir: Optional[str],
+    workers: Optional[int] = None,
+    chunk_size: int = 64,
+    max_pending: Optional[int] = None,
+    on_result: Optional[Callable[[int, Optional[str], Optional[str]], None]] = None,
+    exporter: Optional["PackExporter"] = None,
+) -> BatchReport:
+    """
+    Generate + save packs for every row using a process pool.
+    At most `max_pending` chunks are in flight, so memory stays bounded
+    regardless of input size. workers=0 runs in-process (no pool).
+    Rows that give the same file name get name_2, name_3 … as in an export.
+    With an `exporter` (see workflows/export.py) packs are handed to its
+    background writer instead of being written one file at a time.
+    """
+    if exporter is not None:
+        out_dir = None
+    report = BatchReport()
+    started = time.perf_counter()
+    chunks = _chunked(rows, max(1, chunk_size), report, on_result)
+    names: Dict[str, int] = {}
+
+    def _place(staged: str, path: str) -> str:
+        stem = os.path.basename(path)
+        path = os.path.join(os.path.dirname(path), unique_name(stem, names))
+        os.replace(staged, path)
+        return path
+
+    def _collect(done):
+        for row_no, path, error in done:
+            report.total += 1
+            if error is None:
+                try:
+                    if exporter is not None:
+                        path = exporter.submit(path)
+                    elif out_dir:
+                        path = _place(*path)
+                except OSError as e:
+                    path, error = None, f"{type(e).__name__}: {e}"
+            _record(report, row_no, path, error, on_result)
+
+    if workers == 0:
+        for chunk in chunks:
+            _collect(_run_chunk(chunk, out_dir))
+    else:
+        workers = workers or os.cpu_count() or 1
+        max_pending = max_pending or workers * 2
+        def _failed(chunk, e):
+            # a chunk that never came back (worker killed, pool broken): its rows fail, the batch goes on
+            return [(row_no, None, f"{type(e).__name__}: {e}") for row_no, _ in chunk]
+
+        def _result(fut, chunk):
+            try:
+                return fut.result()
+            except Exception as e:
+                return _failed(chunk, e)
+
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            pending: Dict[Any, List[Row]] = {}
+            for chunk in chunks:
+                try:
+                    pending[pool.submit(_run_chunk, chunk, out_dir)] = chunk
+                except Exception as e:
+                    _collect(_failed(chunk, e))
+                    continue
+                if len(pending) >= max_pending:
+                    finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for fut in finished:
+                        _collect(_result(fut, pending.pop(fut)))
+            for fut, chunk in pending.items():
+                _collect(_result(fut, chunk))
+
+    report.elapsed_sec = time.perf_counter() - started
+    return report
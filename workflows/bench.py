@@ -0,0 +1,164 @@
+from __future__ import annotations
+import os, sys, gc, json, time, platform, tempfile, shutil
+from dataclasses import dataclass, asdict
+from typing import Dict, Any, List, Optional, Callable, Tuple
+
+from workflows.engine import (
+    _detect_mode, generate_media_pack, build_markdown, save_pack, quality_check_pack,
+)
+from workflows.catalog import get_catalog
+
+# One realistic topic per routing mode (checked against the classifier when the suite is built)
+SAMPLE_TOPICS = {
+    "Business Growth": "Tăng doanh thu shop online bằng quảng cáo TikTok",
+    "Process Optimization": "Tối ưu quy trình vận hành kho hàng",
+    "AI System": "Xây AI agent đọc dữ liệu nội bộ",
+    "Education": "Dạy trẻ em học tiếng Anh qua trò chơi",
+    "General": "Một ngày làm việc hiệu quả",
+}
+
+@dataclass
+class BenchResult:
+    name: str
+    number: int            # calls per sample
+    samples: int           # timed samples (after warmup)
+    mean_us: float
+    min_us: float
+    p50_us: float
+    p90_us: float
+    p99_us: float
+    max_us: float
+
+def _percentile(sorted_values: List[float], q: float) -> float:
+    # linear interpolation, same as numpy's default
+    if not sorted_values:
+        return 0.0
+    pos = (len(sorted_values) - 1) * q / 100.0
+    lo = int(pos)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (pos - lo)
+
+def _calibrate(fn: Callable[[], Any], min_sample_sec: float) -> int:
+    number = 1
+    while True:
+        t0 = time.perf_counter()
+        for _ in range(number):
+            fn()
+        if time.perf_counter() - t0 >= min_sample_sec or number >= 1_000_000:
+            return number
+        number *= 2
+
+def measure(name: str, fn: Callable[[], Any], repeat: int = 20, warmup: int = 3,
+            number: Optional[int] = None, min_sample_sec: float = 0.01) -> BenchResult:
+    """
+    Time `fn`: `warmup` untimed samples, then `repeat` samples of `number` calls each
+    (auto-calibrated so one sample takes at least `min_sample_sec`). GC is off while timing.
+    """
+    if repeat < 1:
+        raise ValueError("repeat must be at least 1")
+    number = number or _calibrate(fn, min_sample_sec)
+    per_call: List[float] = []
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for i in range(warmup + repeat):
+            t0 = time.perf_counter()
+            for _ in range(number):
+                fn()
+            dt = time.perf_counter() - t0
+            if i >= warmup:
+                per_call.append(dt / number * 1e6)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    per_call.sort()
+    return BenchResult(
+        name=name, number=number, samples=len(per_call),
+        mean_us=sum(per_call) / len(per_call), min_us=per_call[0],
+        p50_us=_percentile(per_call, 50), p90_us=_percentile(per_call, 90),
+        p99_us=_percentile(per_call, 99), max_us=per_call[-1],
+    )
+
+def default_suite(tmp_dir: str) -> List[Tuple[str, Callable[[], Any]]]:
+    """(name, zero-arg callable) pairs for the engine hot paths and the Gemini client path."""
+    from workflows.gemini_client import GeminiClient, FakeTransport
+
+    catalog = get_catalog()
+    suite: List[Tuple[str, Callable[[], Any]]] = []
+    for mode, topic in SAMPLE_TOPICS.items():
+        if _detect_mode(topic) != mode:
+            raise RuntimeError(f"bench topic {topic!r} no longer routes to {mode!r}")
+        suite.append((f"detect_mode[{mode}]", lambda topic=topic: _detect_mode(topic)))
+    for code in catalog.language_codes:
+        for mode, topic in SAMPLE_TOPICS.items():
+            suite.append((f"generate[{code}/{mode}]", lambda topic=topic, code=code: generate_media_pack(topic, code, seed=7)))
+    suite.append(("generate[unseeded]", lambda: generate_media_pack(SAMPLE_TOPICS["AI System"], catalog.default_language)))
+
+    res = generate_media_pack(SAMPLE_TOPICS["Process Optimization"], "vi", seed=7)
+    suite.append(("build_markdown", lambda: build_markdown(res)))
+    suite.append(("save_pack", lambda: save_pack(res, tmp_dir)))
+    suite.append(("quality_check_pack", lambda: quality_check_pack(res.outline, res.script, res.shotlist, res.prompts)))
+
+    # Gemini path end to end (prompt build, transport, JSON parse) against a local fake: no network, no cache
+    client = GeminiClient(api_key="bench", transport=FakeTransport(), retries=0)
+    request = dict(topic=SAMPLE_TOPICS["AI System"], language="en", platform="YouTube Shorts", duration_sec=35,
+                   audience="General", style_preset="Cinematic 3D")
+    suite.append(("gemini_generate_pack[fake]", lambda: client.generate_pack(**request)))
+    suite.append(("gemini_stream_pack[fake]", lambda: list(client.stream_pack(**request))))
+    # same 8 topics through packed mode: per-request overhead amortized over the pack
+    packed = [dict(request, topic=f"{request['topic']} #{i}") for i in range(8)]
+    suite.append(("gemini_generate_packed[fake,8]", lambda: client.generate_packed(packed)))
+    return suite
+
+def run_suite(only: Optional[str] = None, repeat: int = 20, warmup: int = 3, number: Optional[int] = None,
+              min_sample_sec: float = 0.01, on_result: Optional[Callable[[BenchResult], None]] = None) -> Dict[str, Any]:
+    """Run the default suite (names containing `only`, if given) and return a JSON-ready report."""
+    tmp_dir = tempfile.mkdtemp(prefix="glowmini_bench_")
+    try:
+        results = []
+        for name, fn in default_suite(tmp_dir):
+            if only and only not in name:
+                continue
+            r = measure(name, fn, repeat=repeat, warmup=warmup, number=number, min_sample_sec=min_sample_sec)
+            results.append(r)
+            if on_result:
+                on_result(r)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return {
+        "meta": {
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "catalog_version": get_catalog().version,
+            "repeat": repeat,
+            "warmup": warmup,
+        },
+        "results": {r.name: asdict(r) for r in results},
+    }
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float = 0.10,
+            metric: str = "p50_us") -> List[Dict[str, Any]]:
+    """
+    Per-benchmark change vs a stored baseline report. `regressed` is set when
+    current/baseline - 1 exceeds `threshold` (0.10 = 10% slower).
+    """
+    rows = []
+    for name, cur in current["results"].items():
+        base = baseline.get("results", {}).get(name)
+        if base is None or not base.get(metric):
+            rows.append({"name": name, "baseline": None, "current": cur[metric], "change": None, "regressed": False})
+            continue
+        change = cur[metric] / base[metric] - 1.0
+        rows.append({"name": name, "baseline": base[metric], "current": cur[metric],
+                     "change": change, "regressed": change > threshold})
+    return rows
+
+def load_report(path: str) -> Dict[str, Any]:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def save_report(report: Dict[str, Any], path: str) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
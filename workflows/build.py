@@ -0,0 +1,203 @@
+from __future__ import annotations
+import os, json, time, hashlib, inspect, threading
+from dataclasses import dataclass, field
+from typing import Dict, Any, List, Optional, Tuple, Callable
+
+from workflows.engine import generate_media_pack
+from workflows.batch import Row, read_rows, run_batch
+from workflows.catalog import get_catalog, reload_catalog
+from workflows.classifier import reload_classifier
+from workflows.qc import reload_rubric
+
+MANIFEST = ".glowmini-manifest.json"
+ENGINE = "offline"
+SALT_EXCLUDE = ("rubric.json",)  # scores packs, never changes one
+
+# generate_media_pack() defaults, so "language omitted" and "language=vi" hash the same
+_DEFAULTS = {name: p.default for name, p in inspect.signature(generate_media_pack).parameters.items()
+             if p.default is not inspect.Parameter.empty}
+
+def build_salt() -> str:
+    """
+    Everything besides the row that decides what a pack looks like: the engine,
+    the templates (content hash, minus SALT_EXCLUDE) and the engine's own code.
+    Changing any of them changes every row key, so the whole set is rebuilt.
+    """
+    with open(inspect.getsourcefile(generate_media_pack), "rb") as f:
+        code = hashlib.sha1(f.read()).hexdigest()[:12]
+    return f"{ENGINE}:{get_catalog().content_hash(SALT_EXCLUDE)}:{code}"
+
+def row_key(params: Dict[str, Any], salt: str) -> str:
+    """Content hash of one row's inputs (topic, parameters, seed) under `salt`."""
+    canonical = json.dumps({**_DEFAULTS, **params}, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.blake2b(f"{salt}\0{canonical}".encode("utf-8"), digest_size=16).hexdigest()
+
+def load_manifest(out_dir: str) -> Dict[str, str]:
+    """{row key: pack file name} recorded by the last build into out_dir ({} if none)."""
+    try:
+        with open(os.path.join(out_dir, MANIFEST), "r", encoding="utf-8") as f:
+            rows = json.load(f).get("rows")
+    except (FileNotFoundError, ValueError, AttributeError):
+        return {}
+    return rows if isinstance(rows, dict) else {}
+
+def save_manifest(out_dir: str, rows: Dict[str, str], salt: str, source: str) -> None:
+    os.makedirs(out_dir, exist_ok=True)
+    path = os.path.join(out_dir, MANIFEST)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"version": 1, "salt": salt, "source": source, "rows": rows}, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp, path)
+
+@dataclass
+class BuildReport:
+    total: int = 0        # rows read, including bad ones
+    unchanged: int = 0
+    built: int = 0
+    failed: int = 0
+    pruned: int = 0
+    duplicates: int = 0   # rows whose inputs repeat an earlier row (one pack serves both)
+    elapsed_sec: float = 0.0
+    failures: List[Tuple[int, str]] = field(default_factory=list)
+
+    @property
+    def changed(self) -> bool:
+        return bool(self.built or self.pruned or self.failed)
+
+def build(input_path: str, out_dir: str, workers: Optional[int] = None, chunk_size: int = 64, prune: bool = True,
+          dry_run: bool = False, flush_sec: float = 5.0,
+          on_result: Optional[Callable[[int, Optional[str], Optional[str]], None]] = None) -> BuildReport:
+    """
+    Bring out_dir in line with the rows of input_path (CSV/JSONL, as for `batch`).
+    Rows whose key is in the manifest and whose pack is still on disk are left
+    alone; new or changed rows (and packs deleted by hand) are generated; with
+    `prune`, packs recorded for rows no longer in the input are removed. Only
+    files listed in the manifest are ever deleted. Small rebuilds run in-process,
+    large ones in run_batch's process pool; the manifest is flushed every
+    `flush_sec` so an interrupted build keeps what it already wrote.
+    """
+    started = time.perf_counter()
+    report = BuildReport()
+    salt = build_salt()
+    old = load_manifest(out_dir)
+    try:
+        present = set(os.listdir(out_dir))
+    except FileNotFoundError:
+        present = set()
+
+    rows: Dict[str, str] = {}
+    todo: List[Row] = []
+    keys: Dict[int, str] = {}
+    seen = set()
+    for row_no, params in read_rows(input_path):
+        report.total += 1
+        if isinstance(params, Exception):
+            report.failed += 1
+            report.failures.append((row_no, str(params)))
+            if on_result:
+                on_result(row_no, None, str(params))
+            continue
+        key = row_key(params, salt)
+        if key in seen:
+            report.duplicates += 1
+            continue
+        seen.add(key)
+        name = old.get(key)
+        if name is not None and name in present:
+            rows[key] = name
+            report.unchanged += 1
+        else:
+            keys[row_no] = key
+            todo.append((row_no, params))
+    stale = set(old.values()) - set(rows.values())
+
+    if dry_run:
+        report.built = len(todo)
+        report.pruned = len(stale & present) if prune else 0
+        report.elapsed_sec = time.perf_counter() - started
+        return report
+
+    flushed = [time.perf_counter()]
+
+    def _on_result(row_no, path, error):
+        if error is None:
+            rows[keys[row_no]] = os.path.basename(path)
+            if time.perf_counter() - flushed[0] >= flush_sec:
+                # old entries stay listed until the end, so nothing written so far goes untracked
+                save_manifest(out_dir, {**old, **rows}, salt, input_path)
+                flushed[0] = time.perf_counter()
+        if on_result:
+            on_result(row_no, path, error)
+
+    if todo:
+        batch = run_batch(todo, out_dir, workers=workers if len(todo) >= 4 * chunk_size else 0,
+                          chunk_size=chunk_size, on_result=_on_result)
+        report.built, report.failed = report.built + batch.ok, report.failed + batch.failed
+        report.failures.extend(batch.failures)
+
+    if prune:
+        # delete first, then record: a crash in between leaves entries for missing files, which the next build repairs
+        for name in stale - set(rows.values()):
+            try:
+                os.remove(os.path.join(out_dir, name))
+                report.pruned += 1
+            except FileNotFoundError:
+                pass
+    else:
+        rows = {**{k: v for k, v in old.items() if v in present}, **rows}
+    if todo or report.pruned or rows.keys() != old.keys():
+        save_manifest(out_dir, rows, salt, input_path)
+    report.elapsed_sec = time.perf_counter() - started
+    return report
+
+def _stamp(path: str) -> Tuple[int, int]:
+    try:
+        st = os.stat(path)
+        return st.st_mtime_ns, st.st_size
+    except FileNotFoundError:
+        return 0, -1
+
+def _content_stamp(root: str) -> Tuple[Tuple[str, int, int], ...]:
+    return tuple((os.path.join(base, name),) + _stamp(os.path.join(base, name))
+                 for base, _, files in sorted(os.walk(root)) for name in sorted(files) if name.endswith(".json"))
+
+def watch(input_path: str, out_dir: str, interval: float = 1.0, stop: Optional[threading.Event] = None,
+          on_build: Optional[Callable[[BuildReport, str], None]] = None,
+          on_error: Optional[Callable[[Exception], None]] = None, **build_options: Any) -> None:
+    """
+    build() once, then again whenever the input file or the content templates
+    change (polled every `interval` seconds; a change is acted on once the file
+    has stopped changing for one interval). on_build(report, reason) is called
+    after every build; with `on_error` a failed rebuild (say, a template saved
+    half-edited) is reported there and watching goes on. Runs until `stop` is set.
+    """
+    stop = stop or threading.Event()
+    root = get_catalog().root
+    seen = (_stamp(input_path), _content_stamp(root))
+    on_build = on_build or (lambda report, reason: None)
+    on_build(build(input_path, out_dir, **build_options), "start")
+    while not stop.wait(interval):
+        current = (_stamp(input_path), _content_stamp(root))
+        if current == seen:
+            continue
+        while not stop.wait(interval):  # let an editor / exporter finish writing
+            settled = (_stamp(input_path), _content_stamp(root))
+            if settled == current:
+                break
+            current = settled
+        if stop.is_set():
+            break
+        reason = "templates" if current[1] != seen[1] else "input"
+        seen = current
+        if current[0][1] < 0:
+            continue  # input removed mid-save: wait for it to come back rather than prune everything
+        try:
+            if reason == "templates":
+                reload_catalog()
+                reload_classifier()
+                reload_rubric()
+            on_build(build(input_path, out_dir, **build_options), reason)
+        except Exception as e:
+            if on_error is None:
+                raise
+            on_error(e)
@@ -0,0 +1,194 @@
+from __future__ import annotations
+import os, re, json, hashlib, string, threading
+from dataclasses import dataclass
+from typing import Dict, Any, Tuple, Optional, Iterable
+
+CONTENT_DIR = os.environ.get("GLOWMINI_CONTENT_DIR") or os.path.join(os.path.dirname(os.path.abspath(__file__)), "content")
+
+# Placeholders each template kind may use (checked once at load time)
+HOOK_FIELDS = frozenset({"topic", "t"})
+SCRIPT_FIELDS = frozenset({"lang_upper", "duration_sec", "platform", "hook", "topic", "cta"})
+
+_FIELD_RE = re.compile(r"([A-Za-z_]\w*)((?:\[\w+\]|\.[A-Za-z_]\w*)*)$")
+_PART_RE = re.compile(r"\[(\w+)\]|\.([A-Za-z_]\w*)")
+_SPEC_RE = re.compile(r"[\w<>=^+\- #,.%]*$")
+
+def _field_expr(name: str, where: str) -> Tuple[str, str]:
+    m = _FIELD_RE.match(name)
+    if not m:
+        raise ValueError(f"{where}: unsupported placeholder {{{name}}}")
+    expr = m.group(1)
+    for key, attr in _PART_RE.findall(m.group(2)):
+        expr += f".{attr}" if attr else (f"[{int(key)}]" if key.isdigit() else f"[{key!r}]")
+    return m.group(1), expr
+
+def _compile(text: str, where: str):
+    # Turn a str.format template into a function returning an equivalent f-string,
+    # so rendering costs the same as the hand-written f-strings it replaces.
+    names, parts = [], []
+    for literal, name, spec, conv in string.Formatter().parse(text):
+        if literal:
+            parts.append("f" + repr(literal.replace("{", "{{").replace("}", "}}")))
+        if name is None:
+            continue
+        if not name or not _SPEC_RE.match(spec or ""):
+            raise ValueError(f"{where}: unsupported placeholder {{{name}}}")
+        root, expr = _field_expr(name, where)
+        if root not in names:
+            names.append(root)
+        parts.append('f"{' + expr + (f"!{conv}" if conv else "") + (f":{spec}" if spec else "") + '}"')
+    args = "".join(f"{n}, " for n in names)
+    src = f"def render(*, {args}**_):\n    return {' '.join(parts) or repr('')}\n"
+    ns: Dict[str, Any] = {}
+    exec(compile(src, f"<template {where}>", "exec"), ns)
+    return ns["render"], frozenset(names)
+
+class Template:
+    """A str.format-style template, compiled once when the catalog loads."""
+    __slots__ = ("text", "fields", "render")
+
+    def __init__(self, text: str, allowed: Optional[Iterable[str]] = None, where: str = "template"):
+        self.text = text
+        self.render, self.fields = _compile(text, where)
+        if allowed is not None and not self.fields <= set(allowed):
+            raise ValueError(f"{where}: unknown placeholders {sorted(self.fields - set(allowed))}")
+
+    def __repr__(self) -> str:
+        return f"Template({self.text[:40]!r}…)"
+
+@dataclass(frozen=True)
+class ModeContent:
+    hooks: Tuple[Template, ...]
+    beats: Tuple[str, ...]
+    script: Template
+    insight_visual: str
+
+@dataclass(frozen=True)
+class LanguagePack:
+    code: str
+    cta: str
+    modes: Dict[str, ModeContent]
+
+def _read_json(path: str) -> Dict[str, Any]:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+class ContentCatalog:
+    """
+    Offline content banks (hooks, beats, scripts, camera/prop/metaphor lists, styles).
+    Loaded from JSON under `root` once; languages are compiled lazily on first use
+    and indexed by (language, mode). Add a language by dropping lang/<code>.json.
+    """
+
+    def __init__(self, root: str = CONTENT_DIR):
+        self.root = root
+        self._lock = threading.Lock()
+        self._languages: Dict[str, LanguagePack] = {}
+        common = _read_json(os.path.join(root, "common.json"))
+        self.default_mode: str = common.get("default_mode", "General")
+        self.default_style: str = common.get("default_style", "Cinematic 3D")
+        self.default_language: str = common.get("default_language", "en")
+        self.camera_moves: Tuple[str, ...] = tuple(common["camera_moves"])
+        self.props: Tuple[str, ...] = tuple(common["props"])
+        self.metaphors: Tuple[str, ...] = tuple(common["metaphors"])
+        self.styles: Dict[str, Dict[str, str]] = common["styles"]
+        lang_dir = os.path.join(root, "lang")
+        codes = [f[:-5] for f in os.listdir(lang_dir) if f.endswith(".json")]
+        # longest code first so "vi-VN" style files win over "vi"
+        self.language_codes: Tuple[str, ...] = tuple(sorted(codes, key=lambda c: (-len(c), c)))
+        self._version: Optional[str] = None
+        self._by_name: Dict[str, LanguagePack] = {}
+
+    @property
+    def version(self) -> str:
+        """Content hash of every data file; changes whenever templates change."""
+        if self._version is None:
+            self._version = self.content_hash()
+        return self._version
+
+    def content_hash(self, exclude: Iterable[str] = ()) -> str:
+        """Hash of the data files under root, leaving out `exclude` (paths relative to root)."""
+        skip = set(exclude)
+        h = hashlib.sha1()
+        for base, _, files in sorted(os.walk(self.root)):
+            for name in sorted(files):
+                path = os.path.join(base, name)
+                if name.endswith(".json") and os.path.relpath(path, self.root) not in skip:
+                    with open(path, "rb") as f:
+                        h.update(name.encode() + b"\0" + f.read())
+        return h.hexdigest()[:12]
+
+    def resolve_language(self, language: str) -> str:
+        low = (language or "").lower()
+        return next((c for c in self.language_codes if low.startswith(c.lower())), self.default_language)
+
+    def language(self, language: str) -> LanguagePack:
+        pack = self._by_name.get(language)
+        if pack is not None:
+            return pack
+        code = self.resolve_language(language)
+        pack = self._languages.get(code)
+        if pack is None:
+            with self._lock:
+                pack = self._languages.get(code)
+                if pack is None:
+                    pack = self._languages[code] = self._compile_language(code)
+        if len(self._by_name) < 256:
+            self._by_name[language] = pack
+        return pack
+
+    def mode(self, language: str, mode: str) -> ModeContent:
+        modes = self.language(language).modes
+        return modes.get(mode) or modes[self.default_mode]
+
+    def style(self, style_preset: str) -> Dict[str, str]:
+        return self.styles.get(style_preset, self.styles[self.default_style])
+
+    def _raw_language(self, code: str, _seen: Tuple[str, ...] = ()) -> Dict[str, Any]:
+        if code in _seen:
+            raise ValueError(f"lang/{code}.json: circular 'inherit'")
+        data = _read_json(os.path.join(self.root, "lang", f"{code}.json"))
+        parent = data.get("inherit")
+        if not parent:
+            return data
+        base = self._raw_language(parent, _seen + (code,))
+        modes = {name: dict(fields) for name, fields in base.get("modes", {}).items()}
+        for name, fields in data.get("modes", {}).items():
+            modes.setdefault(name, {}).update(fields)
+        return {**base, **data, "modes": modes}
+
+    def _compile_language(self, code: str) -> LanguagePack:
+        data = self._raw_language(code)
+        modes: Dict[str, ModeContent] = {}
+        for name, m in data.get("modes", {}).items():
+            where = f"lang/{code}.json:{name}"
+            if len(m.get("beats", ())) != 5:
+                raise ValueError(f"{where}: exactly 5 beats required")
+            modes[name] = ModeContent(
+                hooks=tuple(Template(h, HOOK_FIELDS, where + ":hooks") for h in m["hooks"]),
+                beats=tuple(m["beats"]),
+                script=Template(m["script"], SCRIPT_FIELDS, where + ":script"),
+                insight_visual=m["insight_visual"],
+            )
+        if self.default_mode not in modes:
+            raise ValueError(f"lang/{code}.json: missing default mode {self.default_mode!r}")
+        return LanguagePack(code=code, cta=data["cta"], modes=modes)
+
+_default: Optional[ContentCatalog] = None
+_default_lock = threading.Lock()
+
+def get_catalog() -> ContentCatalog:
+    """Process-wide catalog (built on first call)."""
+    global _default
+    if _default is None:
+        with _default_lock:
+            if _default is None:
+                _default = ContentCatalog()
+    return _default
+
+def reload_catalog() -> ContentCatalog:
+    """Re-read the content files (after templates changed on disk) and return the fresh catalog."""
+    global _default
+    with _default_lock:
+        _default = ContentCatalog()
+    return _default
@@ -0,0 +1,165 @@
+from __future__ import annotations
+import os, re, json, threading, unicodedata
+from dataclasses import dataclass
+from typing import Dict, List, Iterable, Optional, Sequence, Tuple
+
+from workflows.catalog import CONTENT_DIR
+
+# Vietnamese diacritics: NFD splits tone/vowel marks into combining chars, đ has no decomposition
+_MARKS_RE = re.compile("[\u0300-\u036f]")
+
+def fold(text: str) -> str:
+    """Lowercase + strip Vietnamese diacritics ("Học dữ liệu" -> "hoc du lieu")."""
+    return _MARKS_RE.sub("", unicodedata.normalize("NFD", text.lower())).replace("đ", "d")
+
+def _trie_regex(node: Dict) -> str:
+    alts = [(r"\s+" if ch == " " else re.escape(ch)) + _trie_regex(child) for ch, child in sorted(node.items()) if ch]
+    if not alts:
+        return ""
+    body = alts[0] if len(alts) == 1 else "(?:" + "|".join(alts) + ")"
+    if "" in node:
+        return ("(?:" + body + ")?") if len(alts) == 1 else body + "?"
+    return body
+
+def keyword_pattern(keywords: Iterable[str], whole_words: bool = True) -> Optional["re.Pattern[str]"]:
+    """
+    One compiled regex for many keywords. They are merged into a prefix trie so the
+    regex engine tests each position once per trie branch instead of once per keyword.
+    whole_words=False matches substrings at every position (overlaps included).
+    """
+    trie: Dict = {}
+    for kw in keywords:
+        node = trie
+        for ch in kw:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+    if not trie:
+        return None
+    if whole_words:
+        return re.compile(r"\b" + _trie_regex(trie) + r"\b")
+    return re.compile("(?=(" + _trie_regex(trie) + "))")
+
+@dataclass(frozen=True)
+class Classification:
+    mode: str
+    scores: Dict[str, float]
+    matches: Tuple[str, ...]
+
+class ModeClassifier:
+    """
+    Keyword router: every mode's keywords are compiled into one alternation and
+    matched in a single pass. Topics written with diacritics match the keywords as
+    written, and their folded form matches the diacritic-free forms too (so
+    "hoc dữ lieu" still finds "dữ liệu"); plain-ASCII topics need only the latter.
+
+    strategy "priority": first mode (config order) with any hit, like the old if-chain.
+    strategy "score": highest weighted hit count, ties broken by config order.
+    """
+
+    def __init__(self, modes: Sequence[Dict], default_mode: str = "General", strategy: str = "priority", fold_exclude: Iterable[str] = ()):
+        if strategy not in ("priority", "score"):
+            raise ValueError(f"unknown strategy: {strategy}")
+        self.default_mode = default_mode
+        self.strategy = strategy
+        self.modes: Tuple[str, ...] = tuple(m["name"] for m in modes)
+        self.weights: Tuple[float, ...] = tuple(float(m.get("weight", 1.0)) for m in modes)
+        exclude = {unicodedata.normalize("NFC", k.lower()) for k in fold_exclude}
+        self._exact: Dict[str, Tuple[int, ...]] = {}
+        self._folded: Dict[str, Tuple[int, ...]] = {}
+        self._fold_of: Dict[str, str] = {}  # exact keyword -> folded form
+        for i, m in enumerate(modes):
+            for kw in m.get("keywords", ()):
+                kw = unicodedata.normalize("NFC", kw.lower().strip())
+                self._exact[kw] = self._exact.get(kw, ()) + (i,)
+                self._fold_of[kw] = fold(kw)
+                if kw not in exclude:
+                    self._folded[fold(kw)] = self._folded.get(fold(kw), ()) + (i,)
+        for table in (self._exact, self._folded):
+            for kw, idx in table.items():
+                table[kw] = tuple(sorted(set(idx)))
+        self._exact_re = keyword_pattern(self._exact)
+        self._folded_re = keyword_pattern(self._folded)
+
+    @classmethod
+    def from_file(cls, path: str) -> "ModeClassifier":
+        with open(path, "r", encoding="utf-8") as f:
+            cfg = json.load(f)
+        return cls(cfg["modes"], cfg.get("default_mode", "General"), cfg.get("strategy", "priority"), cfg.get("fold_exclude", ()))
+
+    @staticmethod
+    def _scan(pattern: Optional["re.Pattern[str]"], table: Dict[str, Tuple[int, ...]], text: str) -> List[Tuple[str, Tuple[int, ...]]]:
+        if pattern is None:
+            return []
+        # a whitespace run inside a multi-word keyword matches \s+, so collapse before lookup
+        keys = [m if m in table else " ".join(m.split()) for m in pattern.findall(text)]
+        return [(k, table[k]) for k in keys]
+
+    def _hits(self, topic: str) -> List[Tuple[str, Tuple[int, ...]]]:
+        """(keyword as matched, indexes of its modes) for every keyword occurrence in the topic."""
+        text = unicodedata.normalize("NFC", topic.lower())
+        if text.isascii():
+            return self._scan(self._folded_re, self._folded, text)
+        hits = self._scan(self._exact_re, self._exact, text)
+        # partly accented topics: folded matches too, minus the ones that only repeat an exact hit
+        repeats: Dict[str, int] = {}
+        for kw, _ in hits:
+            repeats[self._fold_of[kw]] = repeats.get(self._fold_of[kw], 0) + 1
+        for kw, idx in self._scan(self._folded_re, self._folded, fold(text)):
+            if repeats.get(kw):
+                repeats[kw] -= 1
+            else:
+                hits.append((kw, idx))
+        return hits
+
+    def detect(self, topic: str) -> str:
+        """Mode only (fast path used by the generator)."""
+        if self.strategy != "priority":
+            return self.classify(topic).mode
+        hits = self._hits(topic)
+        if not hits:
+            return self.default_mode
+        return self.modes[min(idx[0] for _, idx in hits)]
+
+    def classify(self, topic: str) -> Classification:
+        hits = self._hits(topic)
+        raw = [0.0] * len(self.modes)
+        for _, idx in hits:
+            for i in idx:
+                raw[i] += self.weights[i]
+        if self.strategy == "priority":
+            best = next((i for i, v in enumerate(raw) if v > 0), None)
+        else:
+            top = max(raw, default=0.0)
+            best = raw.index(top) if top > 0 else None
+        scores = dict(zip(self.modes, raw))
+        return Classification(self.default_mode if best is None else self.modes[best], scores, tuple(kw for kw, _ in hits))
+
+    def classify_many(self, topics: Iterable[str]) -> List[Classification]:
+        """Batch API for ingest: repeated topics are classified once."""
+        seen: Dict[str, Classification] = {}
+        out = []
+        for t in topics:
+            c = seen.get(t)
+            if c is None:
+                c = seen[t] = self.classify(t)
+            out.append(c)
+        return out
+
+_default: Optional[ModeClassifier] = None
+_default_lock = threading.Lock()
+
+def get_classifier() -> ModeClassifier:
+    """Process-wide classifier built from content/modes.json."""
+    global _default
+    if _default is None:
+        with _default_lock:
+            if _default is None:
+                _default = ModeClassifier.from_file(os.path.join(CONTENT_DIR, "modes.json"))
+    return _default
+
+def reload_classifier() -> ModeClassifier:
+    """Re-read content/modes.json (after it changed on disk) and return the fresh classifier."""
+    global _default
+    with _default_lock:
+        _default = ModeClassifier.from_file(os.path.join(CONTENT_DIR, "modes.json"))
+    return _default
@@ -0,0 +1,180 @@
+from __future__ import annotations
+import random
+from typing import Dict, Any, List, Optional, Union
+
+from workflows.engine import (
+    WorkflowResult, _detect_mode, _draw_pick_indices, _picks_at, _now_stamp,
+    _render_script, _render_outline, _render_shotlist, _render_prompts,
+)
+from workflows.catalog import get_catalog
+
+# meta keys generate_media_pack() always sets; anything else is kept verbatim in `extra`
+_BASE_META = ("generated_at", "mode", "detected_mode", "seed", "style_preset", "platform", "duration_sec", "audience")
+
+class CompactResult:
+    """
+    An offline pack held as its generation inputs plus the indices of its random
+    picks into the catalog (a few dozen bytes); outline/script/shotlist/prompts,
+    picks and meta are rendered from the shared templates on every access.
+    Reads like a WorkflowResult (same attributes, works with build_markdown,
+    pack_digest, quality_check and the exporters via engine.result_dict) but is
+    read-only: expand() gives a regular WorkflowResult to modify or keep.
+    Renders against the loaded catalog, so keep batches within one catalog version.
+    """
+    __slots__ = ("topic", "language", "platform", "duration_sec", "audience", "style_preset", "mode",
+                 "seed", "generated_at", "_idx", "_extra")
+
+    def __init__(self, topic: str, language: str, platform: str, duration_sec: int, audience: str,
+                 style_preset: str, mode: str, seed: Optional[int], generated_at: str,
+                 idx: Union[bytes, tuple], extra: Optional[Dict[str, Any]] = None):
+        self.topic = topic
+        self.language = language
+        self.platform = platform
+        self.duration_sec = duration_sec
+        self.audience = audience
+        self.style_preset = style_preset
+        self.mode = mode
+        self.seed = seed
+        self.generated_at = generated_at
+        self._idx = idx
+        self._extra = extra
+
+    def _content(self) -> Any:
+        return get_catalog().mode(self.language, self.mode)
+
+    def _picks(self, content: Any) -> Dict[str, Any]:
+        picks = _picks_at(content, get_catalog(), self._idx)
+        picks["hook"] = picks["hook"].render(topic=self.topic, t=self.duration_sec)
+        return picks
+
+    @property
+    def picks(self) -> Dict[str, Any]:
+        return self._picks(self._content())
+
+    @property
+    def outline(self) -> str:
+        content = self._content()
+        return _render_outline(content, self._picks(content)["hook"], self.mode, self.platform, self.duration_sec, self.audience)
+
+    @property
+    def script(self) -> str:
+        content = self._content()
+        return _render_script(content, self._picks(content)["hook"], self.topic, self.language, self.platform,
+                              self.duration_sec, get_catalog().language(self.language).cta)
+
+    @property
+    def shotlist(self) -> str:
+        content = self._content()
+        return _render_shotlist(content, self._picks(content))
+
+    @property
+    def prompts(self) -> str:
+        content = self._content()
+        return _render_prompts(content, self._picks(content), get_catalog().style(self.style_preset), self.topic,
+                               self.mode, self.platform, self.duration_sec, self.audience)
+
+    @property
+    def meta(self) -> Dict[str, Any]:
+        meta = {
+            "generated_at": self.generated_at,
+            "mode": "offline_mock_adaptive",
+            "detected_mode": self.mode,
+            "seed": self.seed,
+            "style_preset": self.style_preset,
+            "platform": self.platform,
+            "duration_sec": self.duration_sec,
+            "audience": self.audience,
+        }
+        if self._extra:
+            meta.update(self._extra)
+        return meta
+
+    def expand(self) -> WorkflowResult:
+        """The same pack as a regular (mutable, fully rendered) WorkflowResult."""
+        content = self._content()
+        catalog = get_catalog()
+        picks = self._picks(content)
+        hook = picks["hook"]
+        return WorkflowResult(
+            topic=self.topic,
+            language=self.language,
+            platform=self.platform,
+            duration_sec=self.duration_sec,
+            audience=self.audience,
+            style_preset=self.style_preset,
+            mode=self.mode,
+            outline=_render_outline(content, hook, self.mode, self.platform, self.duration_sec, self.audience),
+            script=_render_script(content, hook, self.topic, self.language, self.platform, self.duration_sec,
+                                  catalog.language(self.language).cta),
+            shotlist=_render_shotlist(content, picks),
+            prompts=_render_prompts(content, picks, catalog.style(self.style_preset), self.topic, self.mode,
+                                    self.platform, self.duration_sec, self.audience),
+            meta=self.meta,
+            picks=picks,
+        )
+
+    def as_dict(self) -> Dict[str, Any]:
+        """Same shape as dataclasses.asdict() of the expanded WorkflowResult."""
+        res = self.expand()
+        return {name: getattr(res, name) for name in WorkflowResult.__dataclass_fields__}
+
+    def __repr__(self) -> str:
+        return f"CompactResult(topic={self.topic!r}, language={self.language!r}, mode={self.mode!r}, seed={self.seed!r})"
+
+def _pack_idx(idx: List[int]) -> Union[bytes, tuple]:
+    return bytes(idx) if max(idx) < 256 else tuple(idx)
+
+def generate_compact_pack(
+    topic: str,
+    language: str = "vi",
+    platform: str = "YouTube Shorts",
+    duration_sec: int = 35,
+    audience: str = "General",
+    style_preset: str = "Cinematic 3D",
+    seed: Optional[int] = None,
+) -> CompactResult:
+    """generate_media_pack() without rendering anything: same draws, same pack on access."""
+    catalog = get_catalog()
+    mode = _detect_mode(topic)
+    content = catalog.mode(language, mode)
+    idx = _draw_pick_indices(content, catalog, random.Random(seed) if seed is not None else random)
+    return CompactResult(topic, language, platform, duration_sec, audience, style_preset, mode, seed,
+                         _now_stamp(), _pack_idx(list(idx)))
+
+def compact(res: WorkflowResult) -> Union[CompactResult, WorkflowResult]:
+    """
+    CompactResult for an offline pack whose sections re-render from its picks exactly
+    (re-rolled packs included); anything else (Gemini, legacy packs without picks,
+    hand-edited text) is returned unchanged.
+    """
+    if isinstance(res, CompactResult) or res.picks is None or res.meta.get("mode") != "offline_mock_adaptive":
+        return res
+    catalog = get_catalog()
+    content = catalog.mode(res.language, res.mode)
+    picks = res.picks
+    try:
+        hooks = [h.render(topic=res.topic, t=res.duration_sec) for h in content.hooks]
+        idx = [hooks.index(picks["hook"]), *[catalog.camera_moves.index(m) for m in picks["moves"]],
+               catalog.props.index(picks["prop"]), catalog.metaphors.index(picks["metaphor"]),
+               catalog.props.index(picks["prompt_prop"])]
+    except (ValueError, KeyError, TypeError):
+        return res
+    extra = {k: v for k, v in res.meta.items() if k not in _BASE_META}
+    out = CompactResult(res.topic, res.language, res.platform, res.duration_sec, res.audience, res.style_preset,
+                        res.mode, res.meta.get("seed"), res.meta.get("generated_at") or _now_stamp(),
+                        _pack_idx(idx), extra or None)
+    if out.meta != res.meta or any(getattr(out, k) != getattr(res, k) for k in ("outline", "script", "shotlist", "prompts")):
+        return res
+    return out
+
+def compact_pack(pack: Any) -> Any:
+    """
+    compact() for a WorkflowResult or a pack dict as exported (.jsonl, result_dict());
+    dicts that do not describe a whole pack are returned unchanged.
+    """
+    if isinstance(pack, dict):
+        try:
+            pack = WorkflowResult(**{k: pack[k] for k in WorkflowResult.__dataclass_fields__ if k in pack})
+        except TypeError:
+            return pack
+    return compact(pack)
@@ -0,0 +1,335 @@
+from __future__ import annotations
+# Keep this module's imports light: the forwarding client runs on every glowctl call.
+import os, sys, json, time, socket, signal, hashlib, tempfile
+from typing import Dict, Any, List, Optional, Callable
+
+PROTOCOL = 2
+MAX_MESSAGE = 1024 * 1024
+
+# the checkout this module (and so glowctl) runs from
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+def default_socket() -> str:
+    """GLOWMINI_SOCKET, else a socket in the temp dir per user and checkout."""
+    path = os.environ.get("GLOWMINI_SOCKET")
+    if path:
+        return path
+    uid = os.getuid() if hasattr(os, "getuid") else 0
+    return os.path.join(tempfile.gettempdir(), f"glowctl-{uid}-{hashlib.sha1(ROOT.encode()).hexdigest()[:10]}.sock")
+
+def supported() -> bool:
+    return hasattr(socket, "AF_UNIX") and hasattr(socket, "send_fds") and hasattr(os, "fork")
+
+def _env_key(env: Dict[str, str]) -> Dict[str, str]:
+    # GLOWMINI_* settings are read at import time (content dir, store path, ...), so a
+    # daemon only serves clients whose settings match the ones it was started with
+    return {k: v for k, v in env.items() if k.startswith("GLOWMINI_") and k != "GLOWMINI_SOCKET"}
+
+def _source_stamp(root: str) -> List[float]:
+    """
+    mtimes of the code and content a glowctl run from `root` loads. The client sends
+    its own; the daemon serves it only if it matches what the daemon warmed up with.
+    """
+    stamps = []
+    content = os.environ.get("GLOWMINI_CONTENT_DIR") or os.path.join(root, "workflows", "content")
+    for base, ext in ((root, ".py"), (os.path.join(root, "workflows"), ".py"),
+                      (content, ".json"), (os.path.join(content, "lang"), ".json")):
+        try:
+            names = sorted(os.listdir(base))
+        except OSError:
+            continue
+        for name in names:
+            if name.endswith(ext):
+                try:
+                    stamps.append(os.stat(os.path.join(base, name)).st_mtime)
+                except OSError:
+                    pass
+    return stamps
+
+def _send(conn: socket.socket, msg: Dict[str, Any], fds: Optional[List[int]] = None) -> None:
+    data = json.dumps(msg).encode("utf-8") + b"\n"
+    if fds:
+        socket.send_fds(conn, [data], fds)
+    else:
+        conn.sendall(data)
+
+def _recv_line(conn: socket.socket, buf: bytearray) -> Optional[Dict[str, Any]]:
+    while b"\n" not in buf:
+        chunk = conn.recv(65536)
+        if not chunk:
+            return None
+        buf += chunk
+        if len(buf) > MAX_MESSAGE:
+            raise ValueError("message too large")
+    line, _, rest = bytes(buf).partition(b"\n")
+    buf[:] = rest
+    return json.loads(line)
+
+# ---------- client ----------
+
+def forward(argv: List[str], path: Optional[str] = None, connect_timeout: float = 0.5) -> Optional[int]:
+    """
+    Run `glowctl argv` in a warm daemon, with this process's cwd, environment and
+    stdin/stdout/stderr. Returns the exit code, or None when no daemon can take the
+    call (not running, unsupported platform, different GLOWMINI_* settings, another
+    checkout, stale code) and the caller should run it in-process.
+    """
+    if not supported() or os.environ.get("GLOWMINI_NO_DAEMON"):
+        return None
+    if any(a.startswith(("/dev/fd/", "/proc/self/")) for a in argv):
+        return None  # process substitution etc.: those paths only exist in this process
+    path = path or default_socket()
+    if not os.path.exists(path):
+        return None
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        conn.settimeout(connect_timeout)
+        conn.connect(path)
+        request = {"protocol": PROTOCOL, "argv": list(argv), "cwd": os.getcwd(), "env": dict(os.environ),
+                   "root": ROOT, "stamp": _source_stamp(ROOT), "encoding": getattr(sys.stdout, "encoding", None) or "utf-8"}
+        for stream in (sys.stdout, sys.stderr):
+            stream.flush()
+        _send(conn, request, fds=[0, 1, 2])
+        buf = bytearray()
+        reply = _recv_line(conn, buf)
+        if not reply or reply.get("status") != "started":
+            return None
+        conn.settimeout(None)
+    except (OSError, ValueError):
+        conn.close()
+        return None
+    # from here on the command is running in the daemon: never fall back (it would run twice)
+    try:
+        try:
+            done = _recv_line(conn, buf)
+        except KeyboardInterrupt:
+            os.kill(reply["pid"], signal.SIGINT)
+            done = _recv_line(conn, buf)
+        return int(done["exit"]) if done else 1
+    except (OSError, ValueError):
+        return 1
+    finally:
+        conn.close()
+
+def ping(path: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """Daemon status, or None when none is listening."""
+    path = path or default_socket()
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        conn.settimeout(1.0)
+        conn.connect(path)
+        _send(conn, {"protocol": PROTOCOL, "ping": True})
+        return _recv_line(conn, bytearray())
+    except (OSError, ValueError):
+        return None
+    finally:
+        conn.close()
+
+def stop(path: Optional[str] = None) -> bool:
+    path = path or default_socket()
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        conn.settimeout(1.0)
+        conn.connect(path)
+        _send(conn, {"protocol": PROTOCOL, "stop": True})
+        return bool(_recv_line(conn, bytearray()))
+    except (OSError, ValueError):
+        return False
+    finally:
+        conn.close()
+
+# ---------- server ----------
+
+def warm_up() -> None:
+    """Import and build everything a command may touch, once, before forking workers."""
+    import workflows.engine, workflows.batch, workflows.export, workflows.store, workflows.qc, workflows.tracing  # noqa: F401
+    from workflows.catalog import get_catalog
+    from workflows.classifier import get_classifier
+    from workflows.qc import get_rubric
+
+    catalog = get_catalog()
+    for code in catalog.language_codes:
+        catalog.language(code)
+    get_classifier()
+    get_rubric()
+    try:
+        import numpy  # noqa: F401  (batch QC)
+    except ImportError:
+        pass
+
+class Daemon:
+    """
+    Warm glowctl server on a Unix socket. Each call is forked off the preloaded
+    process: the child takes the client's stdin/stdout/stderr (passed as file
+    descriptors), cwd and environment, runs the command and reports its exit code,
+    so clients run concurrently and isolated from each other. Exits after
+    `idle_timeout` seconds without calls.
+    """
+
+    def __init__(self, run: Callable[[List[str]], int], path: Optional[str] = None, idle_timeout: float = 900.0,
+                 max_clients: int = 64, root: Optional[str] = None):
+        self.run = run
+        self.path = path or default_socket()
+        self.idle_timeout = idle_timeout
+        self.max_clients = max_clients
+        self.root = os.path.realpath(root) if root else ROOT
+        self.env_key = _env_key(dict(os.environ))
+        self.children: Dict[int, float] = {}
+        self.served = 0
+        self.started = time.time()
+        self.last_active = time.monotonic()
+        self._stamp: List[float] = []
+        self._running = False
+        self._sock: Optional[socket.socket] = None
+
+    def _bind(self) -> socket.socket:
+        if os.path.exists(self.path):
+            if ping(self.path) is not None:
+                raise RuntimeError(f"a glowctl daemon is already listening on {self.path}")
+            os.unlink(self.path)  # stale socket from a crashed daemon
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        old_umask = os.umask(0o177)  # socket usable by this user only
+        try:
+            sock.bind(self.path)
+        finally:
+            os.umask(old_umask)
+        sock.listen(128)
+        return sock
+
+    def serve_forever(self) -> None:
+        warm_up()
+        self._stamp = _source_stamp(self.root)
+        sock = self._sock = self._bind()
+        sock.settimeout(1.0)
+        self._running = True
+        signal.signal(signal.SIGTERM, lambda *_: setattr(self, "_running", False))
+        try:
+            while self._running:
+                self._reap()
+                if not self.children and time.monotonic() - self.last_active > self.idle_timeout:
+                    break
+                if len(self.children) >= self.max_clients:
+                    time.sleep(0.01)
+                    continue
+                try:
+                    conn, _ = sock.accept()
+                except socket.timeout:
+                    continue
+                except InterruptedError:
+                    continue
+                self.last_active = time.monotonic()
+                self._accept(conn)
+        finally:
+            sock.close()
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+            while self.children:
+                self._reap(block=True)
+
+    def _reap(self, block: bool = False) -> None:
+        while self.children:
+            try:
+                pid, _ = os.waitpid(-1, 0 if block else os.WNOHANG)
+            except ChildProcessError:
+                self.children.clear()
+                return
+            if pid == 0:
+                return
+            self.children.pop(pid, None)
+            self.last_active = time.monotonic()
+            if block:
+                return
+
+    def _accept(self, conn: socket.socket) -> None:
+        fds: List[int] = []
+        try:
+            conn.settimeout(5.0)
+            data, fds, _, _ = socket.recv_fds(conn, MAX_MESSAGE, 3)
+            msg = json.loads(data.partition(b"\n")[0])
+            if msg.get("ping") or msg.get("stop"):
+                _send(conn, {"status": "ok", "pid": os.getpid(), "socket": self.path, "clients": len(self.children),
+                             "served": self.served, "uptime_sec": round(time.time() - self.started, 1)})
+                if msg.get("stop"):
+                    self._running = False
+                return
+            if msg.get("protocol") != PROTOCOL or len(fds) != 3:
+                _send(conn, {"status": "unsupported"})
+                return
+            if _env_key(msg.get("env", {})) != self.env_key:
+                _send(conn, {"status": "env_mismatch"})
+                return
+            if msg.get("root") != self.root:
+                _send(conn, {"status": "root_mismatch"})  # a client from another checkout (shared GLOWMINI_SOCKET)
+                return
+            if msg.get("stamp") != self._stamp or _source_stamp(self.root) != self._stamp:
+                # code or content changed since warm-up: let the client run it fresh and retire
+                _send(conn, {"status": "stale"})
+                self._running = False
+                return
+            for stream in (sys.stdout, sys.stderr):
+                stream.flush()
+            pid = os.fork()
+            if pid == 0:
+                self._child(conn, fds, msg)  # never returns
+            self.children[pid] = time.monotonic()
+            self.served += 1
+        except (OSError, ValueError) as e:
+            print(f"glowctl serve: bad request: {e}", file=sys.stderr)
+        finally:
+            for fd in fds:
+                os.close(fd)
+            conn.close()
+
+    def _child(self, conn: socket.socket, fds: List[int], msg: Dict[str, Any]) -> None:
+        code = 1
+        try:
+            self._sock.close()
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.default_int_handler)
+            for target, fd in enumerate(fds):
+                os.dup2(fd, target)
+            encoding = msg.get("encoding") or "utf-8"
+            sys.stdin = open(0, "r", encoding=encoding, closefd=False)
+            sys.stdout = open(1, "w", encoding=encoding, buffering=1 if os.isatty(1) else -1, closefd=False)
+            sys.stderr = open(2, "w", encoding=encoding, errors="backslashreplace", buffering=1, closefd=False)
+            os.chdir(msg["cwd"])
+            os.environ.clear()
+            os.environ.update(msg.get("env", {}))
+            _send(conn, {"status": "started", "pid": os.getpid()})
+            try:
+                code = self.run(list(msg["argv"]))
+            except SystemExit as e:
+                code = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+                if e.code is not None and not isinstance(e.code, int):
+                    print(e.code, file=sys.stderr)
+            except KeyboardInterrupt:
+                code = 130
+            except BaseException:
+                import traceback
+                traceback.print_exc()
+                code = 1
+            try:
+                sys.stdout.flush()
+                sys.stderr.flush()
+            except OSError:
+                pass
+            _send(conn, {"exit": code or 0})
+        except BaseException:
+            pass
+        finally:
+            os._exit(0)
+
+def detach() -> None:
+    """Classic double fork: keep serving after the launching shell exits."""
+    if os.fork() > 0:
+        os._exit(0)
+    os.setsid()
+    if os.fork() > 0:
+        os._exit(0)
+    devnull = os.open(os.devnull, os.O_RDWR)
+    for fd in (0, 1, 2):
+        os.dup2(devnull, fd)
+    os.close(devnull)
@@ -1,7 +1,11 @@
 from __future__ import annotations
-import os, json, random, datetime, re
-from dataclasses import dataclass
-from typing import Dict, Any, List, Optional
+import os, json, random, time, hashlib, threading
+from dataclasses import dataclass, asdict, replace
+from typing import Dict, Any, List, Optional, Sequence, Tuple
+
+from workflows.catalog import Template, get_catalog
+from workflows.classifier import get_classifier
+from workflows.tracing import span, stopwatch
 
 @dataclass
 class WorkflowResult:
@@ -17,239 +21,35 @@ class WorkflowResult:
     shotlist: str
     prompts: str
     meta: Dict[str, Any]
+    # offline choices behind the sections (hook text, camera moves, props, metaphor); see reroll_section()
+    picks: Optional[Dict[str, Any]] = None
+
+_last_stamp = (0, "")
 
 def _now_stamp() -> str:
-    return datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    # strftime is a noticeable share of a pack's cost; reuse it within the same second
+    global _last_stamp
+    now = int(time.time())
+    if now != _last_stamp[0]:
+        _last_stamp = (now, time.strftime("%Y%m%d_%H%M%S", time.localtime(now)))
+    return _last_stamp[1]
 
 def _safe_name(s: str, max_len: int = 50) -> str:
     safe = "".join([c for c in s if c.isalnum() or c in (" ", "_", "-", ".")]).strip().replace(" ", "_")
     return safe[:max_len] if safe else "pack"
 
-def _pick(options: List[str]) -> str:
-    return random.choice(options)
+def _pick(options: Sequence[Any], rng: Any = random) -> Any:
+    return rng.choice(options)
 
 def _style_bank(style_preset: str) -> Dict[str, str]:
-    bank = {
-        "Cinematic 3D": {
-            "global": "cinematic stylized 3D, shallow depth of field, warm highlights, soft rim light, clean composition, high clarity",
-            "lighting": "soft key light + warm rim light, gentle bloom, controlled shadows",
-            "lens": "35mm–50mm, shallow DOF",
-        },
-        "Clean Minimal": {
-            "global": "minimal 3D, bright studio lighting, simple shapes, high readability, clean background",
-            "lighting": "even studio softbox, low contrast, high clarity",
-            "lens": "35mm, medium DOF",
-        },
-        "Handcrafted Cozy": {
-            "global": "handcrafted 3D look, gentle textures, cozy mood, warm palette, family-friendly",
-            "lighting": "warm ambient, soft fill, subtle vignette",
-            "lens": "50mm, soft DOF",
-        },
-        "Tech Explainer": {
-            "global": "modern tech explainer style, schematic icons, crisp edges, professional, avoid readable text artifacts",
-            "lighting": "neutral studio light, balanced contrast",
-            "lens": "35mm, medium DOF",
-        },
-    }
-    return bank.get(style_preset, bank["Cinematic 3D"])
+    return get_catalog().style(style_preset)
 
 def _detect_mode(topic: str) -> str:
-    t = topic.lower()
-    # simple keyword routing (A-level: lightweight + robust)
-    if re.search(r"\b(doanh thu|bán|marketing|ads|quảng cáo|shop|sàn|shopee|tiktok|funnel|conversion|khách hàng)\b", t):
-        return "Business Growth"
-    if re.search(r"\b(quy trình|tối ưu|workflow|process|vận hành|sop|kpi|chi phí|tự động|automation)\b", t):
-        return "Process Optimization"
-    if re.search(r"\b(ai|machine learning|ml|data|dữ liệu|api|system|hệ thống|pipeline|agent)\b", t):
-        return "AI System"
-    if re.search(r"\b(học|giáo dục|dạy|đào tạo|lesson|kids|trẻ em)\b", t):
-        return "Education"
-    return "General"
-
-def generate_media_pack(
-    topic: str,
-    language: str = "vi",
-    platform: str = "YouTube Shorts",
-    duration_sec: int = 35,
-    audience: str = "General",
-    style_preset: str = "Cinematic 3D",
-    seed: Optional[int] = None,
-) -> WorkflowResult:
-    """
-    Offline/mock generator with lightweight adaptive modes.
-    Produces practical outputs:
-    - Outline (mode-specific beats)
-    - Script (mode-specific structure)
-    - Shotlist (5 shots)
-    - Prompt pack (global + per-shot)
-    Runs WITHOUT API keys.
-    """
-    if seed is not None:
-        random.seed(seed)
-
-    style = _style_bank(style_preset)
-    mode = _detect_mode(topic)
-
-    camera_moves = ["slow dolly in", "gentle pan", "top-down reveal", "over-shoulder close-up", "wide establishing shot"]
-    props = ["notebook", "sticky notes", "simple dashboard", "workflow board", "clean desk setup", "product box", "phone screen mockup"]
-    metaphors = ["one clear arrow", "a single checklist", "three-step pipeline", "before/after board", "time-box timer", "simple funnel"]
-
-    # Hooks
-    hooks_vi = {
-        "Business Growth": [
-            "Muốn tăng doanh thu từ “{topic}”? Đây là 1 cách làm gọn mà hiệu quả.",
-            "Đừng chạy theo 10 thứ — chỉ cần 1 điểm rơi để “{topic}” lên số.",
-            "Nếu “{topic}” chưa ra đơn đều, có thể bạn thiếu 1 bước này.",
-        ],
-        "Process Optimization": [
-            "Chỉ {t}s để gỡ rối “{topic}” bằng 1 workflow rõ ràng.",
-            "Một mẹo nhỏ giúp “{topic}” chạy mượt hơn, ít lỗi hơn.",
-            "Muốn “{topic}” nhanh hơn? Bắt đầu từ bước này.",
-        ],
-        "AI System": [
-            "Nếu bạn muốn “{topic}” trông như một hệ thống, hãy bắt đầu từ kiến trúc.",
-            "Đừng chỉ dùng tool — hãy biến “{topic}” thành pipeline có cấu trúc.",
-            "Một cách đơn giản để “{topic}” có output ổn định hơn.",
-        ],
-        "Education": [
-            "Học “{topic}” dễ hơn khi chia thành 3 bước nhỏ.",
-            "Chỉ {t}s để hiểu “{topic}” theo cách rõ ràng, dễ nhớ.",
-            "Một cách học “{topic}” không bị rối.",
-        ],
-        "General": [
-            "Chỉ {t}s để hiểu điều quan trọng về “{topic}”.",
-            "Một điều nhỏ xíu… nhưng có thể thay đổi cách bạn làm “{topic}”.",
-            "Nếu “{topic}” khiến bạn rối, đây là 1 cách gỡ nhanh.",
-        ],
-    }
-    hooks_en = {
-        "Business Growth": [
-            "Want better results from “{topic}”? Here’s a simple, high-leverage move.",
-            "Stop doing 10 things—focus on the one conversion point for “{topic}”.",
-            "If “{topic}” isn’t converting, you may be missing this step.",
-        ],
-        "Process Optimization": [
-            "{t}s to unclog “{topic}” with a clean workflow.",
-            "A small tweak to make “{topic}” smoother and less error-prone.",
-            "To speed up “{topic}”, start here.",
-        ],
-        "AI System": [
-            "To make “{topic}” a system, start with architecture.",
-            "Don’t just use tools—turn “{topic}” into a structured pipeline.",
-            "A simple way to get more consistent outputs for “{topic}”.",
-        ],
-        "Education": [
-            "Learn “{topic}” faster by splitting it into 3 small steps.",
-            "{t}s to understand “{topic}” clearly.",
-            "A simple way to study “{topic}” without confusion.",
-        ],
-        "General": [
-            "{t}s to understand what matters about “{topic}”.",
-            "A tiny shift that changes how you handle “{topic}”.",
-            "If “{topic}” feels messy, here’s a quick unlock.",
-        ],
-    }
+    # keyword routing, one pass over the topic (keywords live in content/modes.json)
+    return get_classifier().detect(topic)
 
-    if language.lower().startswith("vi"):
-        hook = _pick(hooks_vi[mode]).format(topic=topic, t=duration_sec)
-        cta = "Nếu bạn muốn, mình có thể giúp bạn biến nó thành workflow chi tiết hơn."
-    else:
-        hook = _pick(hooks_en[mode]).format(topic=topic, t=duration_sec)
-        cta = "If you want, I can help turn this into a more detailed workflow."
-
-    # Mode-specific beats + script spine
-    if mode == "Business Growth":
-        beats = [
-            "Nêu mục tiêu (đơn/CR/doanh thu) + bối cảnh",
-            "Chỉ ra điểm nghẽn chuyển đổi",
-            "Đưa 1 chiến lược trọng tâm (1 đòn bẩy)",
-            "3 bước triển khai nhanh (hôm nay)",
-            "Kết: KPI nhỏ để đo + khích lệ",
-        ]
-        script = f"""[{language.upper()} SCRIPT — ~{duration_sec}s | {platform}]
-{hook}
-
-(1) Mục tiêu: “{topic}” ra kết quả đều, không đốt sức.
-(2) Điểm nghẽn hay gặp: bạn kéo traffic nhưng thiếu “điểm chốt”.
-(3) Đòn bẩy: tối ưu 1 điểm — (Hook → Offer → Proof).
-(4) Làm ngay 3 bước: viết 1 offer rõ, thêm 1 bằng chứng, và 1 CTA duy nhất.
-(5) Đo bằng 1 KPI nhỏ (CR/đơn/ngày). {cta}
-"""
-        insight_visual = 'reveal a simple funnel concept (Hook→Offer→Proof) via icons/shapes, no readable text'
-    elif mode == "Process Optimization":
-        beats = [
-            "Map quy trình hiện tại (rất ngắn)",
-            "Xác định bottleneck (1 điểm)",
-            "Đưa nguyên tắc tối ưu (Input→Process→Output)",
-            "Tự động hoá 1 bước nhỏ",
-            "Kết: checklist kiểm lỗi + khích lệ",
-        ]
-        script = f"""[{language.upper()} SCRIPT — ~{duration_sec}s | {platform}]
-{hook}
-
-(1) Với “{topic}”, mình luôn vẽ 1 dòng: Input → Process → Output.
-(2) Bottleneck thường nằm ở 1 bước lặp lại nhiều nhất.
-(3) Nguyên tắc: chuẩn hoá input trước, rồi mới tự động hoá process.
-(4) Làm ngay: chọn 1 output, tạo 1 template input, rồi chạy batch.
-(5) Thêm checklist kiểm lỗi 30 giây. {cta}
-"""
-        insight_visual = 'reveal a 3-step pipeline (Input→Process→Output) using shapes/icons, no readable text'
-    elif mode == "AI System":
-        beats = [
-            "Nêu bài toán hệ thống",
-            "Chọn output schema (đầu ra chuẩn)",
-            "Module hoá workflow",
-            "Test loop + logging",
-            "Kết: API-ready + khích lệ",
-        ]
-        script = f"""[{language.upper()} SCRIPT — ~{duration_sec}s | {platform}]
-{hook}
-
-(1) Để “{topic}” thành hệ thống, bạn phải chốt đầu ra trước.
-(2) Chọn 1 output schema: Outline/Script/Prompts (hoặc JSON).
-(3) Module hoá: generator → validator → exporter.
-(4) Chạy test loop: seed ổn định + log lỗi để sửa nhanh.
-(5) Kiến trúc này cắm API sau rất dễ. {cta}
-"""
-        insight_visual = 'reveal modular blocks (generator→validator→exporter) as simple blocks/icons, no readable text'
-    elif mode == "Education":
-        beats = [
-            "Mục tiêu học rõ ràng",
-            "Tách 3 ý chính",
-            "Ví dụ 1 tình huống",
-            "Bài tập 10 phút",
-            "Kết: khích lệ",
-        ]
-        script = f"""[{language.upper()} SCRIPT — ~{duration_sec}s | {platform}]
-{hook}
-
-(1) Với “{topic}”, mình chia thành 3 ý: Khái niệm – Ví dụ – Thực hành.
-(2) Chỉ cần hiểu 1 câu định nghĩa và 1 ví dụ thật.
-(3) Sau đó làm bài tập 10 phút: áp dụng vào 1 tình huống của bạn.
-(4) Ghi lại 1 câu bạn học được hôm nay.
-(5) Làm đều 7 ngày là thấy khác. {cta}
-"""
-        insight_visual = 'reveal a 3-part learning card (concept-example-practice) with icons, no readable text'
-    else:
-        beats = [
-            "Mở cảnh gần gũi → nêu vấn đề",
-            "Chỉ ra điểm nghẽn (1 câu)",
-            "Bật mí nguyên tắc cốt lõi",
-            "Hành động 1 bước (làm ngay)",
-            "Kết: khích lệ + bước tiếp theo",
-        ]
-        script = f"""[{language.upper()} SCRIPT — ~{duration_sec}s | {platform}]
-{hook}
-
-(1) Mình bắt đầu với “{topic}” bằng cách bỏ bớt cái thừa.
-(2) Điểm nghẽn thường là: làm quá nhiều thứ cùng lúc.
-(3) Nguyên tắc: chia nhỏ thành 3 phần — Input → Process → Output.
-(4) Bước làm ngay: chọn 1 output duy nhất, rồi quay ngược để biết cần input gì.
-(5) {cta}
-"""
-        insight_visual = 'reveal a simple 3-step pipeline (Input→Process→Output) via shapes/icons, no readable text'
-
-    outline = f"""MODE: {mode}
+# Pack layouts (language-independent); per-language/per-mode text lives in workflows/content
+_OUTLINE = Template("""MODE: {mode}
 HOOK: {hook}
 
 STRUCTURE (5 beats):
@@ -260,23 +60,21 @@ STRUCTURE (5 beats):
 5) {beats[4]}
 
 TARGET: {platform} | Duration: ~{duration_sec}s | Audience: {audience}
-"""
+""")
 
-    move1, move2, move3, move4, move5 = (_pick(camera_moves) for _ in range(5))
+_SHOTLIST = Template("""SHOTLIST (5 shots)
+S1 Hook: {moves[0]} | close-up | prop: {prop} | metaphor: {metaphor}
+S2 Problem: {moves[1]} | medium | show friction clearly (simple, non-violent)
+S3 Insight: {moves[2]} | insert | {insight_visual}
+S4 Action: {moves[3]} | hands-on | demonstrate the main step (clear and calm)
+S5 Close: {moves[4]} | wide | calm workspace, hopeful mood, subtle smile
+""")
 
-    shotlist = f"""SHOTLIST (5 shots)
-S1 Hook: {move1} | close-up | prop: {_pick(props)} | metaphor: {_pick(metaphors)}
-S2 Problem: {move2} | medium | show friction clearly (simple, non-violent)
-S3 Insight: {move3} | insert | {insight_visual}
-S4 Action: {move4} | hands-on | demonstrate the main step (clear and calm)
-S5 Close: {move5} | wide | calm workspace, hopeful mood, subtle smile
-"""
-
-    prompts = f"""[PROMPT PACK — Offline draft, tool-ready]
+_PROMPTS = Template("""[PROMPT PACK — Offline draft, tool-ready]
 GLOBAL LOOK:
-- {style['global']}
-- lighting: {style['lighting']}
-- lens: {style['lens']}
+- {style[global]}
+- lighting: {style[lighting]}
+- lens: {style[lens]}
 - family-friendly, professional, no gore, no explicit content
 - avoid readable text artifacts, avoid watermark artifacts
 - consistent style across shots
@@ -287,20 +85,118 @@ SCENE CONTEXT:
 - Platform: {platform} | Duration: ~{duration_sec}s | Audience: {audience}
 
 SHOT 1 (Hook):
-{style['global']}, {style['lighting']}, {move1}, close-up, {_pick(props)}, expressive but subtle, clean background
+{style[global]}, {style[lighting]}, {moves[0]}, close-up, {prop}, expressive but subtle, clean background
 
 SHOT 2 (Problem):
-{style['global']}, {style['lighting']}, {move2}, medium shot, show the friction/bottleneck visually, clear storytelling
+{style[global]}, {style[lighting]}, {moves[1]}, medium shot, show the friction/bottleneck visually, clear storytelling
 
 SHOT 3 (Insight):
-{style['global']}, {style['lighting']}, {move3}, insert shot, {insight_visual}
+{style[global]}, {style[lighting]}, {moves[2]}, insert shot, {insight_visual}
 
 SHOT 4 (Action):
-{style['global']}, {style['lighting']}, {move4}, hands arranging steps, one clear action, confident pacing
+{style[global]}, {style[lighting]}, {moves[3]}, hands arranging steps, one clear action, confident pacing
 
 SHOT 5 (Close):
-{style['global']}, {style['lighting']}, {move5}, wide shot, calm workspace, warm hopeful mood, gentle smile
-"""
+{style[global]}, {style[lighting]}, {moves[4]}, wide shot, calm workspace, warm hopeful mood, gentle smile
+""")
+
+def _render_script(content: Any, hook: str, topic: str, language: str, platform: str, duration_sec: int, cta: str) -> str:
+    return content.script.render(
+        lang_upper=language.upper(), duration_sec=duration_sec, platform=platform,
+        hook=hook, topic=topic, cta=cta,
+    )
+
+def _render_outline(content: Any, hook: str, mode: str, platform: str, duration_sec: int, audience: str) -> str:
+    return _OUTLINE.render(
+        mode=mode, hook=hook, beats=content.beats,
+        platform=platform, duration_sec=duration_sec, audience=audience,
+    )
+
+def _render_shotlist(content: Any, picks: Dict[str, Any]) -> str:
+    return _SHOTLIST.render(
+        moves=picks["moves"], prop=picks["prop"], metaphor=picks["metaphor"],
+        insight_visual=content.insight_visual,
+    )
+
+def _render_prompts(content: Any, picks: Dict[str, Any], style: Dict[str, str], topic: str, mode: str,
+                    platform: str, duration_sec: int, audience: str) -> str:
+    return _PROMPTS.render(
+        style=style, topic=topic, mode=mode, platform=platform, duration_sec=duration_sec,
+        audience=audience, moves=picks["moves"], prop=picks["prompt_prop"], insight_visual=content.insight_visual,
+    )
+
+def _draw_pick_indices(content: Any, catalog: Any, rng: Any) -> Tuple[int, ...]:
+    # every random choice of a pack, in the order a seeded stream has always drawn them:
+    # hook, 5 camera moves, prop, metaphor, prompt prop. choice() over a range draws
+    # exactly what choice() over the list does, so these are indices into the catalog.
+    moves = range(len(catalog.camera_moves))
+    props = range(len(catalog.props))
+    return (
+        _pick(range(len(content.hooks)), rng),
+        *[_pick(moves, rng) for _ in range(5)],
+        _pick(props, rng),
+        _pick(range(len(catalog.metaphors)), rng),
+        _pick(props, rng),
+    )
+
+def _picks_at(content: Any, catalog: Any, idx: Sequence[int]) -> Dict[str, Any]:
+    # "hook" is still the template here (rendering needs topic and duration)
+    return {
+        "hook": content.hooks[idx[0]],
+        "moves": [catalog.camera_moves[i] for i in idx[1:6]],
+        "prop": catalog.props[idx[6]],
+        "metaphor": catalog.metaphors[idx[7]],
+        "prompt_prop": catalog.props[idx[8]],
+    }
+
+def _draw_picks(content: Any, catalog: Any, rng: Any) -> Dict[str, Any]:
+    return _picks_at(content, catalog, _draw_pick_indices(content, catalog, rng))
+
+def generate_media_pack(
+    topic: str,
+    language: str = "vi",
+    platform: str = "YouTube Shorts",
+    duration_sec: int = 35,
+    audience: str = "General",
+    style_preset: str = "Cinematic 3D",
+    seed: Optional[int] = None,
+) -> WorkflowResult:
+    """
+    Offline/mock generator with lightweight adaptive modes.
+    Produces practical outputs:
+    - Outline (mode-specific beats)
+    - Script (mode-specific structure)
+    - Shotlist (5 shots)
+    - Prompt pack (global + per-shot)
+    Runs WITHOUT API keys. Content comes from the compiled catalog (workflows/catalog.py).
+    A seeded call draws from its own random.Random(seed) stream, so output is
+    reproducible under threads/processes and the global RNG is never reseeded.
+    Inside a workflows.tracing.trace() block, per-stage timings land in meta["timings_ms"].
+    """
+    sw = stopwatch("generate_media_pack")
+    rng = random.Random(seed) if seed is not None else random
+
+    catalog = get_catalog()
+    style = catalog.style(style_preset)
+    sw.lap("catalog")
+    mode = _detect_mode(topic)
+    sw.lap("detect_mode")
+    lang = catalog.language(language)
+    content = lang.modes.get(mode) or lang.modes[catalog.default_mode]
+    cta = lang.cta
+
+    picks = _draw_picks(content, catalog, rng)
+    hook = picks["hook"] = picks["hook"].render(topic=topic, t=duration_sec)
+    script = _render_script(content, hook, topic, language, platform, duration_sec, cta)
+    sw.lap("render_script")
+    outline = _render_outline(content, hook, mode, platform, duration_sec, audience)
+    sw.lap("render_outline")
+
+    shotlist = _render_shotlist(content, picks)
+    sw.lap("render_shotlist")
+
+    prompts = _render_prompts(content, picks, style, topic, mode, platform, duration_sec, audience)
+    sw.lap("render_prompts")
 
     meta = {
         "generated_at": _now_stamp(),
@@ -312,6 +208,9 @@ SHOT 5 (Close):
         "duration_sec": duration_sec,
         "audience": audience,
     }
+    timings = sw.stop()
+    if timings is not None:
+        meta["timings_ms"] = timings
 
     return WorkflowResult(
         topic=topic,
@@ -326,8 +225,105 @@ SHOT 5 (Close):
         shotlist=shotlist,
         prompts=prompts,
         meta=meta,
+        picks=picks,
     )
 
+SECTIONS = ("outline", "script", "shotlist", "prompts")
+
+# Offline re-roll graph: the picks a section re-roll draws again, and the sections each pick feeds.
+# Outline and script have no free choice of their own, so re-rolling either draws a new hook (shared by both).
+REROLL_PICKS = {
+    "hook": ("hook",),
+    "outline": ("hook",),
+    "script": ("hook",),
+    "shotlist": ("moves", "prop", "metaphor"),
+    "prompts": ("prompt_prop",),
+}
+PICK_FEEDS = {
+    "hook": ("outline", "script"),
+    "moves": ("shotlist", "prompts"),
+    "prop": ("shotlist",),
+    "metaphor": ("shotlist",),
+    "prompt_prop": ("prompts",),
+}
+
+def invalidated_sections(section: str) -> List[str]:
+    """Sections that must be recomputed when `section` is re-rolled (in pack order)."""
+    if section not in REROLL_PICKS:
+        raise ValueError(f"unknown section {section!r}; expected one of {', '.join(REROLL_PICKS)}")
+    stale = {sec for pick in REROLL_PICKS[section] for sec in PICK_FEEDS[pick]}
+    return [sec for sec in SECTIONS if sec in stale]
+
+def _pick_other(options: Sequence[Any], current: Any, rng: Any = random) -> Any:
+    # a re-roll should change something whenever there is an alternative
+    others = [o for o in options if o != current]
+    return _pick(others or options, rng)
+
+def _recover_picks(res: WorkflowResult) -> Dict[str, Any]:
+    # packs stored before picks were recorded: a seeded pack can be replayed
+    seed = res.meta.get("seed")
+    if seed is not None and res.meta.get("mode") == "offline_mock_adaptive":
+        again = generate_media_pack(res.topic, res.language, res.platform, res.duration_sec, res.audience, res.style_preset, seed)
+        if all(getattr(again, k) == getattr(res, k) for k in SECTIONS):
+            return again.picks
+    raise ValueError("pack has no recorded offline picks (Gemini or unseeded legacy pack); regenerate it instead")
+
+def reroll_section(res: WorkflowResult, section: str, seed: Optional[int] = None) -> WorkflowResult:
+    """
+    Offline re-roll of one section ("hook", "outline", "script", "shotlist" or "prompts").
+    Only the picks behind that section are drawn again and only the sections they feed
+    (invalidated_sections) are re-rendered; everything else is kept verbatim.
+    For Gemini packs use workflows.gemini_llm.gemini_reroll_pack.
+    """
+    stale = invalidated_sections(section)
+    res = as_result(res)
+    if res.meta.get("mode") == "gemini":
+        raise ValueError("Gemini pack: use workflows.gemini_llm.gemini_reroll_pack")
+    old = res.picks or _recover_picks(res)
+    rng = random.Random(seed) if seed is not None else random
+
+    catalog = get_catalog()
+    lang = catalog.language(res.language)
+    content = lang.modes.get(res.mode) or lang.modes[catalog.default_mode]
+    picks = {**old, "moves": list(old["moves"])}
+    for pick in REROLL_PICKS[section]:
+        if pick == "hook":
+            hooks = [h.render(topic=res.topic, t=res.duration_sec) for h in content.hooks]
+            picks["hook"] = _pick_other(hooks, old["hook"], rng)
+        elif pick == "moves":
+            for _ in range(8):
+                picks["moves"] = [_pick(catalog.camera_moves, rng) for _ in range(5)]
+                if picks["moves"] != old["moves"]:
+                    break
+        elif pick == "metaphor":
+            picks["metaphor"] = _pick_other(catalog.metaphors, old["metaphor"], rng)
+        else:
+            picks[pick] = _pick_other(catalog.props, old[pick], rng)
+
+    sections: Dict[str, str] = {}
+    if "outline" in stale:
+        sections["outline"] = _render_outline(content, picks["hook"], res.mode, res.platform, res.duration_sec, res.audience)
+    if "script" in stale:
+        sections["script"] = _render_script(content, picks["hook"], res.topic, res.language, res.platform, res.duration_sec, lang.cta)
+    if "shotlist" in stale:
+        sections["shotlist"] = _render_shotlist(content, picks)
+    if "prompts" in stale:
+        sections["prompts"] = _render_prompts(content, picks, catalog.style(res.style_preset), res.topic, res.mode,
+                                              res.platform, res.duration_sec, res.audience)
+
+    meta = {k: v for k, v in res.meta.items() if k != "timings_ms"}
+    meta["generated_at"] = _now_stamp()
+    meta["rerolled"] = list(res.meta.get("rerolled", ())) + [section]
+    return replace(res, meta=meta, picks=picks, **sections)
+
+def as_result(res: Any) -> WorkflowResult:
+    """A WorkflowResult for `res`, expanding a CompactResult (workflows/compact.py)."""
+    return res if isinstance(res, WorkflowResult) else res.expand()
+
+def result_dict(res: Any) -> Dict[str, Any]:
+    """dataclasses.asdict() of a pack; also accepts a CompactResult."""
+    return asdict(res) if isinstance(res, WorkflowResult) else res.as_dict()
+
 def build_markdown(res: WorkflowResult) -> str:
     return f"""# GlowMiniAI Output Pack
 Topic: {res.topic}
@@ -356,48 +352,39 @@ Engine: {res.meta.get('mode')}
 {json.dumps(res.meta, ensure_ascii=False, indent=2)}
 """
 
-def save_pack(res: WorkflowResult, out_dir: str) -> str:
-    os.makedirs(out_dir, exist_ok=True)
+def pack_digest(res: WorkflowResult) -> str:
+    """Short content hash: identical packs share it, different packs (practically) never do."""
+    h = hashlib.sha1()
+    for v in (res.topic, res.language, res.platform, res.duration_sec, res.audience, res.style_preset,
+              res.mode, res.meta.get("seed"), res.outline, res.script, res.shotlist, res.prompts):
+        h.update(str(v).encode("utf-8") + b"\0")
+    return h.hexdigest()[:10]
+
+def pack_name(res: WorkflowResult, ext: str = ".md") -> str:
+    """Deterministic file name: {generated_at}_{safe_topic}_{digest}{ext}."""
     stamp = res.meta.get("generated_at") or _now_stamp()
-    fname = f"{stamp}_{_safe_name(res.topic)}.md"
-    path = os.path.join(out_dir, fname)
-    content = build_markdown(res)
-    with open(path, "w", encoding="utf-8") as f:
-        f.write(content)
-    return path
+    return f"{stamp}_{_safe_name(res.topic)}_{pack_digest(res)}{ext}"
+
+def save_pack(res: WorkflowResult, out_dir: str) -> str:
+    with span("save_pack"):
+        os.makedirs(out_dir, exist_ok=True)
+        path = os.path.join(out_dir, pack_name(res))
+        with span("build_markdown"):
+            content = build_markdown(res)
+        # write-then-rename so readers never see a half-written pack
+        with span("write"):
+            tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(content)
+            os.replace(tmp, path)
+        return path
 
 def quality_check_pack(outline: str, script: str, shotlist: str, prompts: str):
     """
-    Lightweight heuristic QC scoring (offline-safe).
+    Lightweight heuristic QC scoring (offline-safe), driven by content/rubric.json.
+    For many packs at once use workflows.qc.qc_many.
     Returns: (scores_dict, avg_score_float, suggestions_list)
     """
-    scores = {}
-
-    # Clarity
-    scores["Clarity"] = 8 if len(script.split()) > 60 else 6
-
-    # Specificity
-    scores["Specificity"] = 8 if any(w in script.lower() for w in ["bước", "step", "kpi", "input", "process", "offer", "proof"]) else 6
-
-    # Strategic Depth
-    scores["Strategic Depth"] = 8 if any(w in script.lower() for w in ["chiến lược", "strategy", "system", "pipeline", "bottleneck", "funnel"]) else 6
-
-    # Visual Consistency
-    scores["Visual Consistency"] = 8 if "S1" in shotlist and "S5" in shotlist else 6
-
-    # Usefulness
-    scores["Usefulness"] = 8 if any(w in script.lower() for w in ["làm ngay", "action", "đo", "measure", "kpi"]) else 6
-
-    avg_score = round(sum(scores.values()) / len(scores), 1)
-
-    suggestions = []
-    if scores["Specificity"] < 8:
-        suggestions.append("Add 1–2 concrete steps or measurable indicators (KPI/CR/time saved).")
-    if scores["Strategic Depth"] < 8:
-        suggestions.append("Clarify the core principle (system/pipeline/funnel) behind the solution.")
-    if scores["Visual Consistency"] < 8:
-        suggestions.append("Ensure shotlist has 5 shots with clear camera/action cues.")
-    if scores["Usefulness"] < 8:
-        suggestions.append("Include a clear 'do this today' action step.")
-
-    return scores, avg_score, suggestions
+    from workflows.qc import get_rubric
+    with span("quality_check_pack"):
+        return get_rubric().score({"outline": outline, "script": script, "shotlist": shotlist, "prompts": prompts})
@@ -0,0 +1,214 @@
+from __future__ import annotations
+import os, io, json, time, queue, tarfile, zipfile, threading
+from typing import Dict, Any, List, Optional, Tuple, TYPE_CHECKING
+
+from workflows.engine import WorkflowResult, build_markdown, pack_name, result_dict
+
+if TYPE_CHECKING:
+    from workflows.neardup import NearDupGuard
+
+def unique_name(name: str, seen: Dict[str, int]) -> str:
+    """name the first time, then name_2, name_3 … (counts kept in `seen`), so a repeated pack never overwrites one."""
+    n = seen[name] = seen.get(name, 0) + 1
+    if n == 1:
+        return name
+    stem, ext = os.path.splitext(name)
+    return f"{stem}_{n}{ext}"
+
+# ===== Sinks: receive (name, result) batches from the writer thread =====
+
+class DirectorySink:
+    """One .md per pack, each written to a temp file and atomically renamed into place."""
+
+    def __init__(self, out_dir: str, fsync: bool = False):
+        self.out_dir = out_dir
+        self.fsync = fsync
+        os.makedirs(out_dir, exist_ok=True)
+
+    def write_batch(self, items: List[Tuple[str, WorkflowResult]]) -> None:
+        for name, res in items:
+            path = os.path.join(self.out_dir, name)
+            tmp = path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(build_markdown(res))
+                if self.fsync:
+                    f.flush()
+                    os.fsync(f.fileno())
+            os.replace(tmp, path)
+
+    def close(self) -> None:
+        pass
+
+    def abort(self) -> None:
+        pass  # every pack already written is a complete file
+
+class _ArchiveSink:
+    """
+    Single-file targets are written to `<path>.tmp` and renamed on close();
+    abort() deletes the partial `.tmp` instead, leaving any previous file at `path` as it was.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.tmp = path + ".tmp"
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    def _close_file(self) -> None:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        self._close_file()
+        os.replace(self.tmp, self.path)
+
+    def abort(self) -> None:
+        try:
+            self._close_file()
+        finally:
+            try:
+                os.remove(self.tmp)
+            except FileNotFoundError:
+                pass
+
+class ZipSink(_ArchiveSink):
+    def __init__(self, path: str, compression: int = zipfile.ZIP_DEFLATED):
+        super().__init__(path)
+        self._zip = zipfile.ZipFile(self.tmp, "w", compression=compression)
+
+    def write_batch(self, items: List[Tuple[str, WorkflowResult]]) -> None:
+        for name, res in items:
+            self._zip.writestr(name, build_markdown(res))
+
+    def _close_file(self) -> None:
+        self._zip.close()
+
+class TarSink(_ArchiveSink):
+    def __init__(self, path: str):
+        super().__init__(path)
+        mode = "w:gz" if path.endswith((".tar.gz", ".tgz")) else "w"
+        self._tar = tarfile.open(self.tmp, mode)
+
+    def write_batch(self, items: List[Tuple[str, WorkflowResult]]) -> None:
+        now = time.time()
+        for name, res in items:
+            data = build_markdown(res).encode("utf-8")
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            info.mtime = now
+            self._tar.addfile(info, io.BytesIO(data))
+
+    def _close_file(self) -> None:
+        self._tar.close()
+
+class JsonlSink(_ArchiveSink):
+    """One JSON object per pack (all WorkflowResult fields + name)."""
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        self._f = open(self.tmp, "w", encoding="utf-8", buffering=1 << 20)
+
+    def write_batch(self, items: List[Tuple[str, WorkflowResult]]) -> None:
+        self._f.write("".join(json.dumps({"name": name, **result_dict(res)}, ensure_ascii=False) + "\n" for name, res in items))
+
+    def _close_file(self) -> None:
+        self._f.close()
+
+def guess_format(target: str) -> str:
+    low = target.lower().rstrip("/\\")
+    return ("store" if low.endswith(".packstore") else
+            "zip" if low.endswith(".zip") else
+            "tar" if low.endswith((".tar", ".tar.gz", ".tgz")) else
+            "jsonl" if low.endswith((".jsonl", ".ndjson")) else "dir")
+
+def open_sink(target: str, fmt: Optional[str] = None):
+    """Pick a sink from `fmt` (dir|zip|tar|jsonl|store) or from the target's extension."""
+    fmt = fmt or guess_format(target)
+    if fmt == "store":
+        from workflows.store import PackStore
+        return PackStore(target)
+    sinks = {"dir": DirectorySink, "zip": ZipSink, "tar": TarSink, "jsonl": JsonlSink}
+    if fmt not in sinks:
+        raise ValueError(f"unknown export format: {fmt}")
+    return sinks[fmt](target)
+
+# ===== Exporter =====
+
+_STOP = object()
+
+class PackExporter:
+    """
+    Background writer: submit() names the pack and queues it; a writer thread
+    drains the queue in batches into the sink. The bounded queue applies
+    backpressure, so memory stays flat however many packs are exported.
+
+        with PackExporter(open_sink("packs.zip")) as ex:
+            for res in results:
+                ex.submit(res)
+    """
+
+    def __init__(self, sink: Any, queue_size: int = 1024, batch_size: int = 256, ext: str = ".md",
+                 guard: Optional["NearDupGuard"] = None):
+        self.sink = sink
+        self.guard = guard
+        self.batch_size = max(1, batch_size)
+        self.ext = ".json" if isinstance(sink, JsonlSink) else ext
+        self.written = 0
+        self._names: Dict[str, int] = {}
+        self._queue: "queue.Queue[Any]" = queue.Queue(maxsize=queue_size)
+        self._error: Optional[BaseException] = None
+        self._aborting = False
+        self._thread = threading.Thread(target=self._run, name="pack-exporter", daemon=True)
+        self._thread.start()
+
+    def submit(self, res: WorkflowResult) -> Optional[str]:
+        """Queue a pack; returns its entry name, or None when the near-duplicate guard dropped it."""
+        if self._error is not None:
+            raise RuntimeError("export writer failed") from self._error
+        if self.guard is not None:
+            res = self.guard.check(res)
+            if res is None:
+                return None
+        name = unique_name(pack_name(res, self.ext), self._names)  # archives never hold duplicate entries
+        self._queue.put((name, res))
+        return name
+
+    def _run(self) -> None:
+        stop = False
+        while not stop:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if batch[-1] is _STOP:
+                batch.pop()
+                stop = True
+            if batch and self._error is None and not self._aborting:
+                try:
+                    self.sink.write_batch(batch)
+                    self.written += len(batch)
+                except BaseException as e:
+                    self._error = e
+
+    def close(self, abort: bool = False) -> None:
+        """
+        Drain the queue and finalize the sink. With `abort`, or when the writer
+        failed, the sink is aborted instead, so a half-written archive never
+        replaces a good one.
+        """
+        self._aborting = abort
+        self._queue.put(_STOP)
+        self._thread.join()
+        if abort or self._error is not None:
+            self.sink.abort()
+            if not abort:
+                raise RuntimeError("export writer failed") from self._error
+        else:
+            self.sink.close()
+
+    def __enter__(self) -> "PackExporter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close(abort=exc_type is not None)
@@ -0,0 +1,550 @@
+from __future__ import annotations
+import re, json, time, random, asyncio, threading
+import urllib.request, urllib.error
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional, Iterable, Iterator, Callable, Sequence, Tuple, Union, TYPE_CHECKING
+
+from workflows.tracing import span, current as current_trace
+from workflows.ratelimit import (
+    GeminiScheduler, BATCH, OK, THROTTLED, FAILED, OTHER, current_priority, priority, get_scheduler,
+)
+from workflows.gemini_llm import (
+    MODEL_NAME, PROMPT_VERSION, PACK_KEYS, PACKED_HEADER, IncrementalPackParser, build_prompt, build_packed_prompt,
+    build_section_prompt, parse_pack, parse_packed, parse_sections,
+)
+
+if TYPE_CHECKING:
+    from workflows.llm_cache import ResponseCache
+
+class GeminiError(Exception):
+    """Backend failure. `retryable` marks errors worth another attempt."""
+    retryable = False
+
+class RateLimitedError(GeminiError):
+    retryable = True
+
+class TransientError(GeminiError):
+    retryable = True
+
+def _outcome(e: BaseException) -> str:
+    """How a failed backend attempt counts for the scheduler's rate and circuit breaker."""
+    if isinstance(e, RateLimitedError):
+        return THROTTLED
+    if isinstance(e, (TransientError, TimeoutError, asyncio.TimeoutError)):
+        return FAILED
+    return OTHER
+
+# ===== Transports: prompt in, response text out =====
+
+class GenaiTransport:
+    """
+    google-generativeai SDK. genai.configure() is process-global, so the SDK is
+    (re)configured under a lock when a different key shows up; processes that
+    juggle several keys at once should use RestTransport instead. Every call
+    carries `timeout`; a call that runs past it raises TimeoutError.
+    """
+    _lock = threading.Lock()
+    _configured_key: Optional[str] = None
+
+    def __init__(self, api_key: str, model_name: str = MODEL_NAME, timeout: float = 60.0):
+        import google.generativeai as genai
+
+        self._genai = genai
+        self.api_key = api_key
+        self.timeout = timeout
+        with GenaiTransport._lock:
+            self._configure()
+            self._model = genai.GenerativeModel(model_name)
+
+    def _configure(self) -> None:
+        if GenaiTransport._configured_key != self.api_key:
+            self._genai.configure(api_key=self.api_key)
+            GenaiTransport._configured_key = self.api_key
+
+    def generate(self, prompt: str) -> str:
+        if GenaiTransport._configured_key != self.api_key:
+            with GenaiTransport._lock:
+                self._configure()
+        try:
+            return self._model.generate_content(prompt, request_options={"timeout": self.timeout}).text
+        except Exception as e:
+            self._reraise(e)
+
+    def generate_stream(self, prompt: str) -> Iterator[str]:
+        if GenaiTransport._configured_key != self.api_key:
+            with GenaiTransport._lock:
+                self._configure()
+        try:
+            for chunk in self._model.generate_content(prompt, stream=True, request_options={"timeout": self.timeout}):
+                yield chunk.text
+        except Exception as e:
+            self._reraise(e)
+
+    @staticmethod
+    def _reraise(e: Exception) -> None:
+        name = type(e).__name__
+        if name in ("ResourceExhausted", "TooManyRequests"):
+            raise RateLimitedError(str(e)) from e
+        if name == "DeadlineExceeded" or isinstance(e, TimeoutError):
+            raise TimeoutError(str(e)) from e
+        if name in ("ServiceUnavailable", "InternalServerError"):
+            raise TransientError(str(e)) from e
+        raise e
+
+class RestTransport:
+    """Plain HTTPS `generateContent` call; base_url can point at a local stand-in server."""
+
+    def __init__(self, api_key: str, model_name: str = MODEL_NAME,
+                 base_url: str = "https://generativelanguage.googleapis.com", timeout: float = 60.0):
+        self.api_key = api_key
+        self.model_name = model_name
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+
+    def _request(self, prompt: str, method: str = "generateContent", query: str = "") -> urllib.request.Request:
+        url = f"{self.base_url}/v1beta/models/{self.model_name}:{method}?key={self.api_key}{query}"
+        body = json.dumps({"contents": [{"parts": [{"text": prompt}]}]}).encode("utf-8")
+        return urllib.request.Request(url, data=body, headers={"Content-Type": "application/json"})
+
+    @staticmethod
+    def _raise_for(e: urllib.error.HTTPError) -> None:
+        detail = e.read().decode("utf-8", "replace")[:300]
+        if e.code == 429:
+            raise RateLimitedError(f"HTTP 429: {detail}") from e
+        if e.code >= 500:
+            raise TransientError(f"HTTP {e.code}: {detail}") from e
+        raise GeminiError(f"HTTP {e.code}: {detail}") from e
+
+    @staticmethod
+    def _text(payload: Dict[str, Any]) -> str:
+        parts = (payload.get("candidates") or [{}])[0].get("content", {}).get("parts", [])
+        return "".join(p.get("text", "") for p in parts)
+
+    def generate(self, prompt: str) -> str:
+        try:
+            with urllib.request.urlopen(self._request(prompt), timeout=self.timeout) as resp:
+                return self._text(json.loads(resp.read()))
+        except urllib.error.HTTPError as e:
+            self._raise_for(e)
+        except (urllib.error.URLError, TimeoutError, ConnectionError) as e:
+            raise TransientError(str(e)) from e
+
+    def generate_stream(self, prompt: str) -> Iterator[str]:
+        """`streamGenerateContent` with server-sent events; yields text chunks."""
+        try:
+            with urllib.request.urlopen(self._request(prompt, "streamGenerateContent", "&alt=sse"), timeout=self.timeout) as resp:
+                for line in resp:
+                    line = line.strip()
+                    if line.startswith(b"data:"):
+                        text = self._text(json.loads(line[5:]))
+                        if text:
+                            yield text
+        except urllib.error.HTTPError as e:
+            self._raise_for(e)
+        except (urllib.error.URLError, TimeoutError, ConnectionError) as e:
+            raise TransientError(str(e)) from e
+
+_TOPIC_RE = re.compile(r'^Topic: "(.*)"$', re.M)
+_FIELD_RE = re.compile(r"^(Language|Platform|Audience|Style preset): (.*)$", re.M)
+
+def _fake_item(topic: str, language: str, platform: str, audience: str, style_preset: str) -> Dict[str, Any]:
+    from workflows.engine import generate_media_pack
+
+    res = generate_media_pack(topic, language=language, platform=platform, audience=audience,
+                              style_preset=style_preset, seed=0)
+    return {k: getattr(res, k) for k in ("mode", "outline", "script", "shotlist", "prompts")}
+
+def fake_pack_text(prompt: str) -> str:
+    """Plausible JSON answer for a pack prompt (or a JSON array for a packed prompt), rendered by the offline engine."""
+    if PACKED_HEADER in prompt:
+        lines = prompt.split(PACKED_HEADER, 1)[1].strip().split("\n\n", 1)[0].splitlines()
+        items = [json.loads(line) for line in lines]
+        return json.dumps([{"index": it["index"], **_fake_item(it["topic"], it["language"], it["platform"], it["audience"],
+                                                               it["style_preset"])} for it in items], ensure_ascii=False)
+    m = _TOPIC_RE.search(prompt)
+    fields = dict(_FIELD_RE.findall(prompt))
+    return json.dumps(_fake_item(
+        m.group(1) if m else "topic",
+        language=fields.get("Language", "vi"),
+        platform=fields.get("Platform", "YouTube Shorts"),
+        audience=fields.get("Audience", "General"),
+        style_preset=fields.get("Style preset", "Cinematic 3D"),
+    ), ensure_ascii=False)
+
+class FakeTransport:
+    """
+    Offline stand-in for tests/benchmarks: optional latency, scripted failures and
+    an output cap (`max_output_chars` cuts answers off, like a model hitting its token limit).
+    """
+
+    def __init__(self, responder: Callable[[str], str] = fake_pack_text, latency: float = 0.0,
+                 fail: Optional[Callable[[int], Optional[Exception]]] = None, max_output_chars: Optional[int] = None):
+        self.responder = responder
+        self.latency = latency
+        self.fail = fail
+        self.max_output_chars = max_output_chars
+        self.calls = 0
+        self.prompt_chars = 0
+        self._lock = threading.Lock()
+
+    def _respond(self, prompt: str) -> str:
+        with self._lock:
+            self.calls += 1
+            self.prompt_chars += len(prompt)
+            n = self.calls
+        err = self.fail(n) if self.fail else None
+        if err is not None:
+            raise err
+        text = self.responder(prompt)
+        return text[:self.max_output_chars] if self.max_output_chars else text
+
+    def generate(self, prompt: str) -> str:
+        if self.latency:
+            time.sleep(self.latency)
+        return self._respond(prompt)
+
+    def generate_stream(self, prompt: str, chunk_size: int = 64) -> Iterator[str]:
+        # latency is spread over the chunks, like a model emitting tokens
+        text = self._respond(prompt)
+        chunks = [text[i:i + chunk_size] for i in range(0, len(text), chunk_size)]
+        for chunk in chunks:
+            if self.latency:
+                time.sleep(self.latency / len(chunks))
+            yield chunk
+
+# ===== Client =====
+
+Request = Dict[str, Any]
+
+class PackSizer:
+    """
+    Items per packed request, from the model's prompt/output limits (in tokens,
+    converted at a conservative chars-per-token rate) and a running estimate of
+    answer size per item. A cut-off answer lowers the output budget to what
+    actually came back, so the next packs fit; packs keep at least two items
+    while the last answer showed two fit. `stats` counts calls, items and items that had to be retried alone.
+    """
+
+    def __init__(self, max_prompt_tokens: int = 32_000, max_output_tokens: int = 8192, max_items: int = 16,
+                 chars_per_token: float = 3.0, headroom: float = 0.8, item_output_chars: float = 4000.0):
+        self.prompt_budget = max_prompt_tokens * chars_per_token * headroom
+        self.output_budget = max_output_tokens * chars_per_token * headroom
+        self.max_items = max_items
+        self.item_output_chars = item_output_chars
+        self.stats = {"calls": 0, "items": 0, "missing": 0, "truncated": 0}
+        self._two_fit = True
+        self._lock = threading.Lock()
+
+    def size(self, item_prompt_chars: Sequence[int], overhead: int = 1200) -> int:
+        """How many of the next items (their prompt lines, in order) go into one request; at least 1."""
+        by_output = max(int(self.output_budget // max(self.item_output_chars, 1.0)), 2 if self._two_fit else 1)
+        n, used = 0, overhead
+        for chars in item_prompt_chars[:max(1, min(self.max_items, by_output))]:
+            if n and used + chars > self.prompt_budget:
+                break
+            n, used = n + 1, used + chars
+        return max(1, n)
+
+    def observe(self, items: int, response_chars: int, parsed: int, complete: bool) -> None:
+        with self._lock:
+            self.stats["calls"] += 1
+            self.stats["items"] += items
+            self.stats["missing"] += items - parsed
+            if parsed:
+                # a cut-off answer also holds the start of the next item: charge it there, not to the parsed ones
+                self.item_output_chars = 0.7 * self.item_output_chars + 0.3 * response_chars / (parsed if complete else parsed + 1)
+            self._two_fit = complete or parsed >= 2
+            if not complete:
+                # the answer was cut off: the model's real output limit is below our budget
+                self.stats["truncated"] += 1
+                self.output_budget = min(self.output_budget, response_chars * 0.9)
+
+class GeminiClient:
+    """
+    One configured model per (api_key, model_name), reused across calls.
+    Sync generate_pack(), async agenerate_pack(), and bounded fan-out with
+    generate_many()/agenerate_many(). Retries use exponential backoff with
+    full jitter on rate limits, transient errors, timeouts and unparsable JSON.
+    With a `scheduler`, every backend attempt first takes a slot from it (rate,
+    quota, priority queue, circuit breaker) and reports back how it went; single
+    calls queue as interactive and the fan-out methods as batch, unless a
+    ratelimit.priority() block says otherwise.
+    """
+
+    def __init__(self, api_key: str = "", model_name: str = MODEL_NAME, transport: Any = None,
+                 cache: Optional["ResponseCache"] = None, timeout: float = 60.0, retries: int = 3,
+                 backoff: float = 0.5, max_backoff: float = 8.0, max_workers: int = 32,
+                 scheduler: Optional[GeminiScheduler] = None):
+        self.api_key = api_key
+        self.model_name = model_name
+        self._transport = transport
+        self._transport_lock = threading.Lock()
+        self.cache = cache
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_workers = max_workers
+        self.sizer = PackSizer()
+        self.scheduler = scheduler
+        self._pool: Optional[ThreadPoolExecutor] = None
+
+    @property
+    def transport(self) -> Any:
+        if self._transport is None:
+            with self._transport_lock:
+                if self._transport is None:
+                    self._transport = GenaiTransport(self.api_key, self.model_name, self.timeout)
+        return self._transport
+
+    def _executor(self) -> ThreadPoolExecutor:
+        if self._pool is None:
+            with self._transport_lock:
+                if self._pool is None:
+                    self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="gemini")
+        return self._pool
+
+    def _delay(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_backoff, self.backoff * (2 ** attempt)))
+
+    def _retryable(self, e: BaseException) -> bool:
+        return getattr(e, "retryable", False) or isinstance(e, (asyncio.TimeoutError, TimeoutError, ValueError))
+
+    def _slot(self, level: Optional[int] = None) -> Any:
+        if self.scheduler is None:
+            return nullcontext()
+        return self.scheduler.slot(self.api_key, level, _outcome)
+
+    def _cache_key(self, request: Request, cache: "ResponseCache") -> str:
+        return cache.key_for(request, f"{self.model_name}:{PROMPT_VERSION}")
+
+    def _call(self, prompt: str, parse: Callable[[str], Dict[str, Any]] = parse_pack,
+              level: Optional[int] = None) -> Dict[str, Any]:
+        """One blocking transport call + parse, retried with jittered backoff on retryable errors."""
+        for attempt in range(self.retries + 1):
+            try:
+                with span("gemini.call"), self._slot(level):
+                    text = self.transport.generate(prompt)
+                with span("gemini.parse"):
+                    return parse(text)
+            except Exception as e:
+                if attempt >= self.retries or not self._retryable(e):
+                    raise
+                with span("gemini.backoff"):
+                    time.sleep(self._delay(attempt))
+        raise AssertionError("unreachable")
+
+    def generate_pack(self, cache: Optional["ResponseCache"] = None, **request: Any) -> Dict[str, Any]:
+        with span("gemini_generate_pack"):
+            cache = cache if cache is not None else self.cache
+            if cache is not None:
+                with span("gemini.cache_get"):
+                    hit = cache.get(self._cache_key(request, cache))
+                if hit is not None:
+                    return hit
+            with span("gemini.prompt"):
+                prompt = build_prompt(**request)
+            data = self._call(prompt)
+            if cache is not None:
+                with span("gemini.cache_put"):
+                    cache.put(self._cache_key(request, cache), data)
+            return data
+
+    def _generate_pack_of(self, requests: List[Request], level: Optional[int] = None) -> List[Optional[Dict[str, Any]]]:
+        prompt = build_packed_prompt(requests)
+        text, (items, complete) = self._call(prompt, lambda text: (text, parse_packed(text, len(requests))), level)
+        self.sizer.observe(len(requests), len(text), sum(1 for x in items if x is not None), complete)
+        return items
+
+    def generate_packed(self, requests: Iterable[Request], cache: Optional["ResponseCache"] = None,
+                        concurrency: int = 4) -> List[Union[Dict[str, Any], BaseException]]:
+        """
+        Like generate_many(), but several topics share one model call: the instructions
+        and schema go out once per pack and the answer is a JSON array split back per
+        topic. Pack sizes come from self.sizer. Topics missing or broken in a packed
+        answer (or whose whole pack failed) are retried alone with generate_pack().
+        Results, or the exception of a topic that still failed, are in input order;
+        each result is cached under its own request, like generate_pack().
+        """
+        requests = list(requests)
+        cache = cache if cache is not None else self.cache
+        results: List[Any] = [None] * len(requests)
+        todo: List[int] = []
+        level = current_priority(BATCH)
+        with span("gemini_generate_packed"):
+            for i, req in enumerate(requests):
+                hit = cache.get(self._cache_key(req, cache)) if cache is not None else None
+                if hit is not None:
+                    results[i] = hit
+                else:
+                    todo.append(i)
+            line_chars = {i: len(json.dumps(requests[i], ensure_ascii=False)) + 12 for i in todo}
+            alone: List[int] = []
+            pool = self._executor()
+            while todo:
+                # one wave of up to `concurrency` packs, sized with what earlier waves taught the sizer
+                wave: List[List[int]] = []
+                while todo and len(wave) < concurrency:
+                    k = self.sizer.size([line_chars[i] for i in todo[:self.sizer.max_items]])
+                    wave.append(todo[:k])
+                    todo = todo[k:]
+                singles = [idx[0] for idx in wave if len(idx) == 1]
+                alone += singles
+                packs = [idx for idx in wave if len(idx) > 1]
+                futures = [pool.submit(self._generate_pack_of, [requests[i] for i in idx], level) for idx in packs]
+                for idx, fut in zip(packs, futures):
+                    try:
+                        items = fut.result()
+                    except Exception:
+                        items = [None] * len(idx)
+                    for i, data in zip(idx, items):
+                        if data is None:
+                            alone.append(i)
+                        else:
+                            results[i] = data
+                            if cache is not None:
+                                cache.put(self._cache_key(requests[i], cache), data)
+
+            def one(i: int) -> Union[Dict[str, Any], BaseException]:
+                try:
+                    with priority(level):
+                        return self.generate_pack(cache=cache, **requests[i])
+                except Exception as e:
+                    return e
+
+            for i, r in zip(alone, pool.map(one, alone)):
+                results[i] = r
+        return results
+
+    def regenerate_sections(self, current: Dict[str, str], sections: Sequence[str], **request: Any) -> Dict[str, str]:
+        """
+        Ask the model for `sections` only, with the rest of `current` as context.
+        Never cached: a re-roll is meant to produce a different answer.
+        """
+        with span("gemini_regenerate_sections"):
+            with span("gemini.prompt"):
+                prompt = build_section_prompt(sections, current, **request)
+            return self._call(prompt, lambda text: parse_sections(text, sections))
+
+    def stream_pack(self, cache: Optional["ResponseCache"] = None, **request: Any) -> Iterator[Tuple[str, Any]]:
+        """
+        Yield (section, value) pairs as soon as each pack field is complete in the
+        streamed response (falls back to one blocking call for transports without
+        generate_stream). Every key of PACK_KEYS is yielded exactly once.
+        """
+        cache = cache if cache is not None else self.cache
+        if cache is not None:
+            hit = cache.get(self._cache_key(request, cache))
+            if hit is not None:
+                yield from ((k, hit[k]) for k in PACK_KEYS)
+                return
+        transport = self.transport
+        if not hasattr(transport, "generate_stream"):
+            data = self.generate_pack(cache=cache, **request)
+            yield from ((k, data[k]) for k in PACK_KEYS)
+            return
+        trace = current_trace()
+        started = time.perf_counter()
+        first = trace is not None
+        prompt = build_prompt(**request)
+        for attempt in range(self.retries + 1):
+            parser = IncrementalPackParser()
+            try:
+                with self._slot():
+                    for chunk in transport.generate_stream(prompt):
+                        for key, value in parser.feed(chunk):
+                            if key in PACK_KEYS:
+                                if first:
+                                    trace.add("gemini.first_section", started, time.perf_counter(), trace.depth + 1)
+                                    first = False
+                                yield key, value
+                missing = [k for k in PACK_KEYS if k not in parser.fields]
+                if parser.fields and (missing or not parser.done):
+                    # cut off (output limit, dropped connection): never complete it with defaults
+                    raise ValueError(f"streamed pack incomplete after {len(parser.text)} chars "
+                                     f"(missing: {', '.join(missing) or 'closing brace'})")
+                yield from parser.close()
+                break
+            except Exception as e:
+                # only retry while nothing has been shown to the caller yet
+                if parser.fields or attempt >= self.retries or not self._retryable(e):
+                    raise
+                time.sleep(self._delay(attempt))
+        if trace is not None:
+            # spans cannot wrap a generator's yields, so record the whole stream by hand
+            trace.add("gemini_stream_pack", started, time.perf_counter())
+        if cache is not None:
+            cache.put(self._cache_key(request, cache), {k: parser.fields[k] for k in PACK_KEYS})
+
+    async def agenerate_pack(self, cache: Optional["ResponseCache"] = None, **request: Any) -> Dict[str, Any]:
+        loop = asyncio.get_running_loop()
+        cache = cache if cache is not None else self.cache
+        if cache is not None:
+            hit = await loop.run_in_executor(self._executor(), cache.get, self._cache_key(request, cache))
+            if hit is not None:
+                return hit
+        transport = self.transport
+        prompt = build_prompt(**request)
+        level = current_priority()
+        for attempt in range(self.retries + 1):
+            try:
+                if self.scheduler is not None:
+                    await self.scheduler.aacquire(self.api_key, level)
+                try:
+                    if hasattr(transport, "agenerate"):
+                        text = await asyncio.wait_for(transport.agenerate(prompt), self.timeout)
+                    else:
+                        # the worker thread cannot be interrupted; the timeout only stops waiting for it
+                        text = await asyncio.wait_for(loop.run_in_executor(self._executor(), transport.generate, prompt), self.timeout)
+                except BaseException as e:
+                    if self.scheduler is not None:
+                        self.scheduler.release(self.api_key, _outcome(e))
+                    raise
+                if self.scheduler is not None:
+                    self.scheduler.release(self.api_key, OK)
+                data = parse_pack(text)
+                break
+            except Exception as e:
+                if attempt >= self.retries or not self._retryable(e):
+                    raise
+                await asyncio.sleep(self._delay(attempt))
+        if cache is not None:
+            await loop.run_in_executor(self._executor(), cache.put, self._cache_key(request, cache), data)
+        return data
+
+    async def agenerate_many(self, requests: Iterable[Request], concurrency: int = 8) -> List[Union[Dict[str, Any], BaseException]]:
+        """Results in input order; a failed request yields its exception instead of aborting the rest."""
+        sem = asyncio.Semaphore(max(1, concurrency))
+
+        async def one(req: Request):
+            async with sem:
+                try:
+                    return await self.agenerate_pack(**req)
+                except Exception as e:
+                    return e
+
+        with priority(current_priority(BATCH)):  # the tasks inherit it
+            return list(await asyncio.gather(*(one(r) for r in requests)))
+
+    def generate_many(self, requests: Iterable[Request], concurrency: int = 8) -> List[Union[Dict[str, Any], BaseException]]:
+        return asyncio.run(self.agenerate_many(list(requests), concurrency))
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
+            self._pool = None
+
+_clients: Dict[Tuple[str, str], GeminiClient] = {}
+_clients_lock = threading.Lock()
+
+def get_client(api_key: str, model_name: str = MODEL_NAME) -> GeminiClient:
+    """Shared client per (api_key, model_name); all of them share the process-wide scheduler."""
+    key = (api_key, model_name)
+    client = _clients.get(key)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(key)
+            if client is None:
+                client = _clients[key] = GeminiClient(api_key, model_name, scheduler=get_scheduler())
+    return client
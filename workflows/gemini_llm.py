@@ -1,30 +1,35 @@
 from __future__ import annotations
 import json
-from typing import Dict, Any
+from typing import Dict, Any, Iterator, List, Optional, Sequence, Tuple, TYPE_CHECKING
 
-def gemini_generate_pack(
-    api_key: str,
+if TYPE_CHECKING:
+    from workflows.engine import WorkflowResult
+    from workflows.llm_cache import ResponseCache
+
+MODEL_NAME = "gemini-1.5-flash"
+# Bump whenever build_prompt() changes so cached responses from the old prompt are not reused
+PROMPT_VERSION = "1"
+
+PACK_KEYS = ("mode", "outline", "script", "shotlist", "prompts")
+PACK_SCHEMA = {
+    "mode": "Business Growth | Process Optimization | AI System | Education | General",
+    "outline": "string",
+    "script": "string",
+    "shotlist": "string (exactly 5 shots, S1..S5)",
+    "prompts": "string (global + per-shot prompts)",
+}
+
+def build_prompt(
     topic: str,
     language: str,
     platform: str,
     duration_sec: int,
     audience: str,
     style_preset: str,
-) -> Dict[str, Any]:
-    import google.generativeai as genai
+) -> str:
+    schema = PACK_SCHEMA
 
-    genai.configure(api_key=api_key)
-    model = genai.GenerativeModel("gemini-1.5-flash")
-
-    schema = {
-        "mode": "Business Growth | Process Optimization | AI System | Education | General",
-        "outline": "string",
-        "script": "string",
-        "shotlist": "string (exactly 5 shots, S1..S5)",
-        "prompts": "string (global + per-shot prompts)",
-    }
-
-    prompt = f"""
+    return f"""
 You are an applied AI workflow engine. Return ONLY valid JSON. No markdown.
 
 Topic: "{topic}"
@@ -47,15 +52,18 @@ Return JSON with keys exactly:
 Now output the JSON:
 """
 
-    resp = model.generate_content(prompt)
-    text = (resp.text or "").strip()
+def _loads(text: str) -> Any:
+    text = (text or "").strip()
 
     # Robust JSON parse
     try:
-        data = json.loads(text)
+        return json.loads(text)
     except Exception:
         text2 = text.replace("```json", "").replace("```", "").strip()
-        data = json.loads(text2)
+        return json.loads(text2)
+
+def parse_pack(text: str) -> Dict[str, Any]:
+    data = _loads(text)
 
     return {
         "mode": data.get("mode", "General"),
@@ -64,3 +72,326 @@ Now output the JSON:
         "shotlist": data.get("shotlist", ""),
         "prompts": data.get("prompts", ""),
     }
+
+# ----- Packed mode: several topics per request -----
+
+PACKED_HEADER = "Items (one JSON object per line):"
+
+def build_packed_prompt(requests: Sequence[Dict[str, Any]]) -> str:
+    """
+    One prompt for several pack requests (same keyword arguments as build_prompt):
+    the instructions and schema are sent once, the items one JSON line each.
+    """
+    fields = ("topic", "language", "platform", "duration_sec", "audience", "style_preset")
+    items = "\n".join(json.dumps({"index": i, **{k: r[k] for k in fields}}, ensure_ascii=False)
+                      for i, r in enumerate(requests))
+    schema = {"index": "integer (the item's index)", **PACK_SCHEMA}
+    return f"""
+You are an applied AI workflow engine. Return ONLY valid JSON. No markdown.
+
+Write one content pack for EACH of the {len(requests)} items below. Items are independent:
+each follows its own topic, language, platform, duration (~seconds), audience and style preset.
+
+{PACKED_HEADER}
+{items}
+
+Requirements (per item):
+- Make outputs highly topic-specific (avoid generic templates and wording shared between items).
+- Outline: 5 beats, clear and practical.
+- Script: short sentences, production-ready pacing.
+- Shotlist: exactly 5 shots, label S1..S5 with camera+action.
+- Prompt pack: global look + per-shot prompts; avoid readable text artifacts.
+
+Return a JSON array with exactly {len(requests)} objects, in item order, each with keys exactly:
+{json.dumps(schema, ensure_ascii=False)}
+
+Now output the JSON array:
+"""
+
+def _array_items(text: str) -> Tuple[List[Any], bool]:
+    """Top-level array elements that decode, and whether the array was complete (a cut-off answer keeps its finished items)."""
+    text = (text or "").replace("```json", "").replace("```", "").strip()
+    start = text.find("[")
+    if start < 0:
+        return [], False
+    decoder = json.JSONDecoder()
+    out: List[Any] = []
+    i = start + 1
+    while True:
+        while i < len(text) and text[i] in " \t\r\n,":
+            i += 1
+        if i >= len(text):
+            return out, False
+        if text[i] == "]":
+            return out, True
+        try:
+            value, i = decoder.raw_decode(text, i)
+        except ValueError:
+            return out, False
+        out.append(value)
+
+def parse_packed(text: str, n: int) -> Tuple[List[Optional[Dict[str, Any]]], bool]:
+    """
+    Split a packed answer into n parse_pack()-style results, matched by "index"
+    (by position when missing). Slots whose item is absent or incomplete are None.
+    Also returns whether the array was complete, so callers can tell truncation apart.
+    """
+    items, complete = _array_items(text)
+    out: List[Optional[Dict[str, Any]]] = [None] * n
+    for pos, item in enumerate(items):
+        if not isinstance(item, dict):
+            continue
+        i = item.get("index", pos)
+        if not isinstance(i, int) or not 0 <= i < n or out[i] is not None:
+            continue
+        if all(isinstance(item.get(k), str) and item[k].strip() for k in ("outline", "script", "shotlist", "prompts")):
+            out[i] = {"mode": item.get("mode", "General"), **{k: item[k] for k in ("outline", "script", "shotlist", "prompts")}}
+    return out, complete
+
+# Gemini re-roll graph: sections to request again per re-rolled section. The hook
+# opens both outline and script; the prompt pack is written shot by shot from the shotlist.
+REROLL_SECTIONS = {
+    "hook": ("outline", "script"),
+    "outline": ("outline",),
+    "script": ("script",),
+    "shotlist": ("shotlist", "prompts"),
+    "prompts": ("prompts",),
+}
+
+def build_section_prompt(
+    sections: Sequence[str],
+    current: Dict[str, str],
+    topic: str,
+    language: str,
+    platform: str,
+    duration_sec: int,
+    audience: str,
+    style_preset: str,
+    new_hook: bool = False,
+) -> str:
+    keep = {k: v for k, v in current.items() if k in ("outline", "script", "shotlist", "prompts") and k not in sections}
+    hook_rule = "- Open with a NEW, different hook and use that same hook in every rewritten section.\n" if new_hook else ""
+    return f"""
+You are an applied AI workflow engine. Return ONLY valid JSON. No markdown.
+
+Topic: "{topic}"
+Language: {language}
+Platform: {platform}
+Target duration: ~{duration_sec}s
+Audience: {audience}
+Style preset: {style_preset}
+
+This is an existing content pack. Keep these sections exactly as they are and stay consistent with them:
+{json.dumps(keep, ensure_ascii=False)}
+
+Rewrite ONLY these sections, noticeably different from before: {", ".join(sections)}
+{hook_rule}- Shotlist: exactly 5 shots, label S1..S5 with camera+action.
+- Prompt pack: global look + per-shot prompts matching the shotlist; avoid readable text artifacts.
+
+Return JSON with exactly these keys: {json.dumps(list(sections))}
+
+Now output the JSON:
+"""
+
+def parse_sections(text: str, sections: Sequence[str]) -> Dict[str, str]:
+    data = _loads(text)
+    missing = [k for k in sections if not isinstance(data.get(k), str) or not data[k].strip()]
+    if missing:
+        raise ValueError(f"model response is missing section(s): {', '.join(missing)}")
+    return {k: data[k] for k in sections}
+
+def gemini_generate_pack(
+    api_key: str,
+    topic: str,
+    language: str,
+    platform: str,
+    duration_sec: int,
+    audience: str,
+    style_preset: str,
+    cache: Optional["ResponseCache"] = None,
+) -> Dict[str, Any]:
+    # Reuses one configured model per API key (see workflows/gemini_client.py)
+    from workflows.gemini_client import get_client
+
+    return get_client(api_key).generate_pack(
+        cache=cache, topic=topic, language=language, platform=platform,
+        duration_sec=duration_sec, audience=audience, style_preset=style_preset,
+    )
+
+def gemini_stream_pack(
+    api_key: str,
+    topic: str,
+    language: str,
+    platform: str,
+    duration_sec: int,
+    audience: str,
+    style_preset: str,
+    cache: Optional["ResponseCache"] = None,
+) -> Iterator[Tuple[str, Any]]:
+    """Like gemini_generate_pack, but yields (section, value) as each section completes."""
+    from workflows.gemini_client import get_client
+
+    return get_client(api_key).stream_pack(
+        cache=cache, topic=topic, language=language, platform=platform,
+        duration_sec=duration_sec, audience=audience, style_preset=style_preset,
+    )
+
+def gemini_generate_packed(
+    api_key: str,
+    requests: Sequence[Dict[str, Any]],
+    cache: Optional["ResponseCache"] = None,
+) -> List[Any]:
+    """Many gemini_generate_pack() requests, several topics per model call; results (or exceptions) in input order."""
+    from workflows.gemini_client import get_client
+
+    return get_client(api_key).generate_packed(requests, cache=cache)
+
+def pack_result(
+    data: Dict[str, Any],
+    topic: str,
+    language: str,
+    platform: str,
+    duration_sec: int,
+    audience: str,
+    style_preset: str,
+    **meta: Any,
+) -> "WorkflowResult":
+    """Wrap a parsed Gemini pack as a WorkflowResult (meta mode "gemini"); extra kwargs go into meta."""
+    from workflows.engine import WorkflowResult, _now_stamp
+
+    mode = data.get("mode", "LLM")
+    return WorkflowResult(
+        topic=topic,
+        language=language,
+        platform=platform,
+        duration_sec=int(duration_sec),
+        audience=audience,
+        style_preset=style_preset,
+        mode=mode,
+        outline=data["outline"],
+        script=data["script"],
+        shotlist=data["shotlist"],
+        prompts=data["prompts"],
+        meta={
+            "generated_at": _now_stamp(),
+            "mode": "gemini",
+            "seed": None,
+            "style_preset": style_preset,
+            "platform": platform,
+            "duration_sec": int(duration_sec),
+            "audience": audience,
+            **meta,
+        },
+    )
+
+def gemini_reroll_pack(api_key: str, res: "WorkflowResult", section: str) -> "WorkflowResult":
+    """Re-roll one section of a pack with Gemini, requesting only the sections it invalidates."""
+    from dataclasses import replace
+    from workflows.engine import _now_stamp
+    from workflows.gemini_client import get_client
+
+    if section not in REROLL_SECTIONS:
+        raise ValueError(f"unknown section {section!r}; expected one of {', '.join(REROLL_SECTIONS)}")
+    sections = REROLL_SECTIONS[section]
+    current = {k: getattr(res, k) for k in ("outline", "script", "shotlist", "prompts")}
+    data = get_client(api_key).regenerate_sections(
+        current, sections, new_hook=section == "hook", topic=res.topic, language=res.language, platform=res.platform,
+        duration_sec=res.duration_sec, audience=res.audience, style_preset=res.style_preset,
+    )
+    meta = {k: v for k, v in res.meta.items() if k != "timings_ms"}
+    meta["generated_at"] = _now_stamp()
+    meta["rerolled"] = list(res.meta.get("rerolled", ())) + [section]
+    return replace(res, meta=meta, **data)
+
+class IncrementalPackParser:
+    """
+    Parses the pack JSON object while it streams in and reports each top-level
+    field (outline/script/shotlist/prompts/...) as soon as its value is complete.
+    Leading/trailing markdown fences are ignored.
+
+        parser = IncrementalPackParser()
+        for chunk in chunks:
+            for key, value in parser.feed(chunk):
+                ...
+        rest = parser.close()   # fields not seen yet, with parse_pack() defaults
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.fields: Dict[str, Any] = {}
+        self.done = False
+        self._i = 0
+        self._depth = 0
+        self._in_str = False
+        self._esc = False
+        self._expect = "start"  # start -> key -> colon -> value -> comma -> key ...
+        self._key: Optional[str] = None
+        self._tok = -1           # start index of the key/value currently being read
+
+    def _emit(self, end: int, out: list) -> None:
+        value = json.loads(self.text[self._tok:end])
+        self.fields[self._key] = value
+        out.append((self._key, value))
+        self._expect, self._tok = "comma", -1
+
+    def feed(self, chunk: str) -> list:
+        out: list = []
+        self.text += chunk
+        t, i = self.text, self._i
+        while i < len(t) and not self.done:
+            c = t[i]
+            if self._in_str:
+                if self._esc:
+                    self._esc = False
+                elif c == "\\":
+                    self._esc = True
+                elif c == '"':
+                    self._in_str = False
+                    if self._depth == 1 and self._expect == "key":
+                        self._key, self._expect, self._tok = json.loads(t[self._tok:i + 1]), "colon", -1
+                    elif self._depth == 1 and self._expect == "value":
+                        self._emit(i + 1, out)
+            elif self._expect == "start":
+                if c == "{":
+                    self._depth, self._expect = 1, "key"
+            elif c == '"':
+                self._in_str = True
+                if self._depth == 1 and self._tok < 0:
+                    self._tok = i
+            elif c in "{[":
+                if self._depth == 1 and self._tok < 0:
+                    self._tok = i
+                self._depth += 1
+            elif c in "}]":
+                self._depth -= 1
+                if self._depth == 1 and self._expect == "value":
+                    self._emit(i + 1, out)
+                elif self._depth == 0:
+                    if self._expect == "value" and self._tok >= 0:
+                        self._emit(i, out)
+                    self.done = True
+            elif self._depth == 1:
+                if c == ":" and self._expect == "colon":
+                    self._expect = "value"
+                elif c == ",":
+                    if self._expect == "value" and self._tok >= 0:
+                        self._emit(i, out)
+                    self._expect = "key"
+                elif self._expect == "value" and self._tok < 0 and not c.isspace():
+                    self._tok = i  # number / true / false / null
+            i += 1
+        self._i = i
+        return out
+
+    def close(self) -> list:
+        """Finish the stream: fall back to a full parse if needed, then fill in defaults."""
+        if not self.fields:
+            self.fields = dict(json.loads(self.text.replace("```json", "").replace("```", "").strip()))
+            missing = [(k, self.fields[k]) for k in PACK_KEYS if k in self.fields]
+        else:
+            missing = []
+        defaults = parse_pack("{}")
+        missing += [(k, defaults[k]) for k in PACK_KEYS if k not in self.fields]
+        for k, v in missing:
+            self.fields.setdefault(k, v)
+        return missing
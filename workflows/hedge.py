@@ -0,0 +1,102 @@
+from __future__ import annotations
+import time, asyncio
+from concurrent.futures import TimeoutError as FutureTimeout, CancelledError
+from typing import Dict, Any, Optional, TYPE_CHECKING
+
+from workflows.engine import WorkflowResult, generate_media_pack
+from workflows.ratelimit import INTERACTIVE, SchedulerRejected, QueueTimeoutError, priority, deadline
+
+if TYPE_CHECKING:
+    from workflows.gemini_client import GeminiClient
+    from workflows.llm_cache import ResponseCache
+
+class HedgedGeneration:
+    """
+    One pack under a latency budget. The offline pack is generated right away
+    (`offline`, well under a millisecond) and a Gemini call for the same inputs
+    starts in the client's thread pool. result() / aresult() give the Gemini pack
+    if it arrives within `deadline_sec` of construction, else the offline one;
+    meta["hedge"] records which and why (`outcome`: gemini, timeout, error, skipped).
+
+    Past the deadline no further Gemini attempt (retry, queued scheduler slot) is
+    started. A call already on the wire cannot be interrupted: it finishes in the
+    background and its answer still lands in `cache`, ready for the next identical request.
+    """
+
+    def __init__(self, api_key: str, topic: str, language: str = "vi", platform: str = "YouTube Shorts",
+                 duration_sec: int = 35, audience: str = "General", style_preset: str = "Cinematic 3D",
+                 seed: Optional[int] = None, deadline_sec: float = 2.0, cache: Optional["ResponseCache"] = None,
+                 client: Optional["GeminiClient"] = None):
+        from workflows.gemini_client import get_client
+
+        self.started = time.monotonic()
+        self.deadline_sec = deadline_sec
+        self.deadline_at = self.started + deadline_sec
+        self.request: Dict[str, Any] = dict(topic=topic, language=language, platform=platform, duration_sec=int(duration_sec),
+                                            audience=audience, style_preset=style_preset)
+        self.offline = generate_media_pack(seed=seed, **self.request)
+        self.outcome: Optional[str] = None
+        self.error: Optional[str] = None
+        self._final: Optional[WorkflowResult] = None
+        self.client = client or get_client(api_key)
+        scheduler = self.client.scheduler
+        if scheduler is not None and not scheduler.available(self.client.api_key):
+            self._future = None
+            self.outcome, self.error = "skipped", "Gemini backend unavailable (circuit open or quota used up)"
+        else:
+            self._future = self.client._executor().submit(self._gemini, cache)
+
+    def _gemini(self, cache: Optional["ResponseCache"]) -> Dict[str, Any]:
+        with priority(INTERACTIVE), deadline(self.deadline_at):
+            return self.client.generate_pack(cache=cache, **self.request)
+
+    @property
+    def upgraded(self) -> bool:
+        return self.outcome == "gemini"
+
+    def remaining(self) -> float:
+        return max(0.0, self.deadline_at - time.monotonic())
+
+    def result(self) -> WorkflowResult:
+        """Block until the Gemini pack arrives or the deadline passes; the pack to show."""
+        if self._final is None:
+            data = None
+            if self._future is not None:
+                try:
+                    data = self._future.result(timeout=self.remaining())
+                except (FutureTimeout, CancelledError, QueueTimeoutError):
+                    self._future.cancel()  # only stops it if it has not started yet
+                    self.outcome = "timeout"
+                except SchedulerRejected as e:
+                    self.outcome, self.error = "skipped", str(e)
+                except Exception as e:
+                    self.outcome, self.error = "error", str(e)
+            self._final = self._finish(data)
+        return self._final
+
+    async def aresult(self) -> WorkflowResult:
+        """result() without blocking the event loop."""
+        if self._final is None and self._future is not None and not self._future.done():
+            try:
+                await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(self._future)), self.remaining())
+            except Exception:
+                pass  # result() below tells a timeout from an error
+        return self.result()
+
+    def _finish(self, data: Optional[Dict[str, Any]]) -> WorkflowResult:
+        from workflows.gemini_llm import pack_result
+
+        hedge = {"deadline_ms": round(self.deadline_sec * 1000.0, 1),
+                 "elapsed_ms": round((time.monotonic() - self.started) * 1000.0, 1)}
+        if data is not None:
+            self.outcome = "gemini"
+            return pack_result(data, **self.request, hedge=dict(hedge, outcome="gemini"))
+        hedge["outcome"] = self.outcome
+        if self.error:
+            hedge["error"] = self.error
+        self.offline.meta["hedge"] = hedge
+        return self.offline
+
+def hedged_generate(api_key: str, topic: str, deadline_sec: float = 2.0, **options: Any) -> WorkflowResult:
+    """The Gemini pack if it arrives within `deadline_sec`, else the offline pack (see HedgedGeneration)."""
+    return HedgedGeneration(api_key, topic, deadline_sec=deadline_sec, **options).result()
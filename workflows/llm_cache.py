@@ -0,0 +1,176 @@
+from __future__ import annotations
+import os, json, time, sqlite3, hashlib, threading, unicodedata
+from contextlib import contextmanager
+from typing import Dict, Any, Optional, Callable, Iterator
+
+def normalize_request(request: Dict[str, Any]) -> Dict[str, Any]:
+    """Canonical form used for cache keys: NFC text, collapsed whitespace, lowercase language."""
+    out: Dict[str, Any] = {}
+    for k, v in request.items():
+        if isinstance(v, str):
+            v = " ".join(unicodedata.normalize("NFC", v).split())
+            if k == "language":
+                v = v.lower()
+        out[k] = v
+    return out
+
+class ResponseCache:
+    """
+    Content-addressed, on-disk cache for LLM pack responses (SQLite, WAL mode).
+
+    Keys are sha256(normalized request + prompt/model version). Entries expire after
+    `ttl_sec`; when more than `max_entries` or `max_bytes` are stored the least recently
+    used ones are evicted. Safe for concurrent readers/writers across threads and processes.
+    Hit/miss counters are persisted, so stats() reflects every process using the file.
+    """
+
+    def __init__(self, path: str, ttl_sec: Optional[float] = 30 * 86400, max_entries: Optional[int] = 100_000,
+                 max_bytes: Optional[int] = 512 * 1024 * 1024, evict_every: int = 64):
+        self.path = path
+        self.ttl_sec = ttl_sec
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.evict_every = max(1, evict_every)
+        self._local = threading.local()
+        self._puts = 0
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._tx() as db:
+            db.execute("CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)")
+            db.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries(accessed)")
+            db.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+
+    # ---- connection handling ----
+    def _db(self) -> sqlite3.Connection:
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    @contextmanager
+    def _tx(self) -> Iterator[sqlite3.Connection]:
+        db = self._db()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            yield db
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+
+    def _bump(self, db: sqlite3.Connection, name: str, n: int = 1) -> None:
+        db.execute("INSERT INTO counters(name, value) VALUES (?, ?) ON CONFLICT(name) DO UPDATE SET value = value + ?", (name, n, n))
+
+    # ---- public API ----
+    @staticmethod
+    def key_for(request: Dict[str, Any], version: str = "") -> str:
+        blob = json.dumps({"v": version, "r": normalize_request(request)}, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        db = self._db()
+        row = db.execute("SELECT value, created FROM entries WHERE key = ?", (key,)).fetchone()
+        fresh = row is not None and (self.ttl_sec is None or now - row[1] <= self.ttl_sec)
+        with self._tx() as db:
+            if fresh:
+                db.execute("UPDATE entries SET accessed = ? WHERE key = ?", (now, key))
+                self._bump(db, "hits")
+            else:
+                if row is not None:
+                    db.execute("DELETE FROM entries WHERE key = ?", (key,))
+                    self._bump(db, "expired")
+                self._bump(db, "misses")
+        return json.loads(row[0]) if fresh else None
+
+    def put(self, key: str, value: Dict[str, Any]) -> None:
+        blob = json.dumps(value, ensure_ascii=False)
+        now = time.time()
+        with self._tx() as db:
+            db.execute("INSERT OR REPLACE INTO entries(key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                       (key, blob, len(blob.encode("utf-8")), now, now))
+        self._puts += 1
+        if self._puts % self.evict_every == 0:
+            self.evict()
+
+    def get_or_compute(self, key: str, compute: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+        cached = self.get(key)
+        if cached is not None:
+            return cached
+        value = compute()
+        self.put(key, value)
+        return value
+
+    def refresh(self) -> "RefreshingCache":
+        """This cache for a forced refresh: lookups always miss, fresh answers replace the stored ones."""
+        return RefreshingCache(self)
+
+    def evict(self) -> int:
+        """Drop expired entries, then least-recently-used ones beyond the size limits."""
+        removed = 0
+        with self._tx() as db:
+            if self.ttl_sec is not None:
+                removed += db.execute("DELETE FROM entries WHERE created < ?", (time.time() - self.ttl_sec,)).rowcount
+            count, size = db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+            if self.max_entries is not None and count > self.max_entries:
+                n = count - self.max_entries
+                db.execute("DELETE FROM entries WHERE key IN (SELECT key FROM entries ORDER BY accessed LIMIT ?)", (n,))
+                removed += n
+                count, size = db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+            if self.max_bytes is not None and size > self.max_bytes:
+                freed = 0
+                for key, sz in db.execute("SELECT key, size FROM entries ORDER BY accessed").fetchall():
+                    if size - freed <= self.max_bytes:
+                        break
+                    db.execute("DELETE FROM entries WHERE key = ?", (key,))
+                    freed += sz
+                    removed += 1
+            if removed:
+                self._bump(db, "evictions", removed)
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        db = self._db()
+        counters = dict(db.execute("SELECT name, value FROM counters").fetchall())
+        count, size = db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        hits, misses = counters.get("hits", 0), counters.get("misses", 0)
+        return {
+            "entries": count,
+            "bytes": size,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / (hits + misses), 4) if hits + misses else 0.0,
+            "evictions": counters.get("evictions", 0),
+            "expired": counters.get("expired", 0),
+        }
+
+    def clear(self) -> None:
+        with self._tx() as db:
+            db.execute("DELETE FROM entries")
+            db.execute("DELETE FROM counters")
+
+    def close(self) -> None:
+        db = getattr(self._local, "db", None)
+        if db is not None:
+            db.close()
+            self._local.db = None
+
+class RefreshingCache:
+    """ResponseCache.refresh(): get() never hits; key_for/put/stats go to the wrapped cache."""
+
+    def __init__(self, cache: ResponseCache):
+        self.cache = cache
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        return None
+
+    def get_or_compute(self, key: str, compute: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+        value = compute()
+        self.cache.put(key, value)
+        return value
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.cache, name)
@@ -0,0 +1,431 @@
+from __future__ import annotations
+import os, sys, csv, json, math, time, random, platform, threading, itertools
+import multiprocessing as mp
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Dict, Any, List, Optional, Iterator, Callable, Sequence, Tuple
+
+from workflows.engine import generate_media_pack
+from workflows.batch import normalize_row
+from workflows.api import _gemini_request
+from workflows.bench import SAMPLE_TOPICS, _percentile
+from workflows.catalog import get_catalog
+
+ENGINES = ("offline", "gemini", "hedged")
+
+# ===== Workloads: lists of {"params": generate_media_pack kwargs, "engine", "deadline_ms"} =====
+
+def _item(raw: Dict[str, Any], default_deadline_ms: float = 1500.0) -> Dict[str, Any]:
+    engine = str(raw.get("engine") or "offline").strip().lower()
+    if engine not in ENGINES:
+        raise ValueError(f"unknown engine {engine!r}; expected one of {', '.join(ENGINES)}")
+    deadline = raw.get("deadline_ms")
+    return {"params": normalize_row(raw), "engine": engine,
+            "deadline_ms": float(deadline) if deadline not in (None, "") else default_deadline_ms}
+
+def load_workload(path: str) -> List[Dict[str, Any]]:
+    """
+    A .jsonl or .csv workload: the batch columns (topic, language, platform, ...)
+    plus optional `engine` (offline | gemini | hedged) and `deadline_ms` for hedged rows.
+    """
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        if path.lower().endswith((".jsonl", ".ndjson")):
+            raws = [json.loads(line) for line in f if line.strip()]
+        else:
+            raws = list(csv.DictReader(f))
+    items = []
+    for row_no, raw in enumerate(raws, 1):
+        try:
+            items.append(_item(raw))
+        except ValueError as e:
+            raise ValueError(f"{path}: row {row_no}: {e}")
+    if not items:
+        raise ValueError(f"{path}: empty workload")
+    return items
+
+def recorded_workload(store_root: Optional[str] = None, limit: Optional[int] = None,
+                      since: Optional[str] = None) -> List[Dict[str, Any]]:
+    """The pack store's history (oldest first) as a workload: Gemini packs replay as engine=gemini."""
+    from workflows.store import PackStore, DEFAULT_STORE
+
+    store = PackStore(store_root or DEFAULT_STORE)
+    entries = store.find(since=since, limit=limit, newest_first=False)
+    items = []
+    for e in entries:
+        res = store.get(e.id)
+        items.append(_item({"topic": res.topic, "language": res.language, "platform": res.platform,
+                            "duration_sec": res.duration_sec, "audience": res.audience, "style_preset": res.style_preset,
+                            "seed": res.meta.get("seed"), "engine": "gemini" if res.meta.get("mode") == "gemini" else "offline"}))
+    if not items:
+        raise ValueError(f"no packs recorded in {store.root}")
+    return items
+
+def synthetic_workload(n: int = 1000, gemini_ratio: float = 0.2, hedged_ratio: float = 0.0, deadline_ms: float = 1500.0,
+                       languages: Optional[Sequence[str]] = None, seed: int = 0) -> List[Dict[str, Any]]:
+    """`n` requests over the sample topics of every routing mode, all catalog languages, platforms and styles."""
+    catalog = get_catalog()
+    rng = random.Random(seed)
+    languages = list(languages or catalog.language_codes)
+    platforms = ["YouTube Shorts", "TikTok", "Facebook Reels", "Website/Blog"]
+    styles = sorted(catalog.styles)
+    topics = list(SAMPLE_TOPICS.values())
+    items = []
+    for i in range(n):
+        r = rng.random()
+        engine = "gemini" if r < gemini_ratio else "hedged" if r < gemini_ratio + hedged_ratio else "offline"
+        items.append({"params": {"topic": f"{rng.choice(topics)} #{i % 97}", "language": rng.choice(languages),
+                                 "platform": rng.choice(platforms), "duration_sec": rng.choice([15, 30, 35, 45, 60]),
+                                 "style_preset": rng.choice(styles), "seed": rng.choice([None, rng.randrange(1000)])},
+                      "engine": engine, "deadline_ms": deadline_ms})
+    return items
+
+# ===== Stand-in Gemini REST API (generateContent) =====
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024  # the default backlog of 5 resets connections under load
+
+class StandInGemini:
+    """
+    Local HTTP server answering `generateContent` like the Gemini REST API (the
+    answer is workflows.gemini_client.fake_pack_text), after a log-normal latency
+    (median `latency_ms`, spread `jitter`; 0 = fixed) and with injected failures:
+    `rate_limit_rate` of calls get 429 and `error_rate` get 503 at random, and
+    with `rps_limit` calls over that rate get 429 the way a real per-key quota
+    does. GET /stats returns its counters.
+    """
+
+    def __init__(self, latency_ms: float = 800.0, jitter: float = 0.3, error_rate: float = 0.0,
+                 rate_limit_rate: float = 0.0, rps_limit: Optional[float] = None, host: str = "127.0.0.1",
+                 port: int = 0, seed: Optional[int] = None):
+        self.latency_ms = latency_ms
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.rps_limit = rps_limit
+        self.rng = random.Random(seed)
+        self.counters = {"requests": 0, "ok": 0, "injected_429": 0, "injected_503": 0, "limited_429": 0, "bad_request": 0}
+        self._allowance = rps_limit or 0.0
+        self._stamp = time.monotonic()
+        self._lock = threading.Lock()
+        self.server = _Server((host, port), self._handler())
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _draw(self) -> Tuple[float, Optional[str]]:
+        """(latency in seconds, failure to answer with or None)."""
+        with self._lock:
+            self.counters["requests"] += 1
+            delay = self.latency_ms * math.exp(self.rng.gauss(0.0, self.jitter)) if self.jitter else self.latency_ms
+            r = self.rng.random()
+            if self.rps_limit:
+                now = time.monotonic()
+                self._allowance = min(self.rps_limit, self._allowance + (now - self._stamp) * self.rps_limit)
+                self._stamp = now
+                if self._allowance < 1:
+                    return delay / 1000.0, "limited_429"
+                self._allowance -= 1
+        failure = "injected_429" if r < self.rate_limit_rate else "injected_503" if r < self.rate_limit_rate + self.error_rate else None
+        return delay / 1000.0, failure
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self.counters[name] += 1
+
+    def _handler(self) -> type:
+        standin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args: Any) -> None:
+                pass
+
+            def _send(self, status: int, payload: Any) -> None:
+                body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self) -> None:
+                with standin._lock:
+                    self._send(200, dict(standin.counters))
+
+            def do_POST(self) -> None:
+                from workflows.gemini_client import fake_pack_text
+
+                body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                delay, failure = standin._draw()
+                if failure == "limited_429":
+                    standin._count(failure)  # quota checks answer at once
+                    return self._send(429, {"error": {"code": 429, "status": "RESOURCE_EXHAUSTED"}})
+                time.sleep(delay)
+                if ":generateContent" not in self.path:
+                    standin._count("bad_request")
+                    return self._send(404, {"error": {"code": 404, "message": "only generateContent is stubbed"}})
+                if failure is not None:
+                    standin._count(failure)
+                    code, status = (429, "RESOURCE_EXHAUSTED") if failure == "injected_429" else (503, "UNAVAILABLE")
+                    return self._send(code, {"error": {"code": code, "status": status}})
+                try:
+                    prompt = json.loads(body)["contents"][0]["parts"][0]["text"]
+                except (ValueError, KeyError, IndexError, TypeError):
+                    standin._count("bad_request")
+                    return self._send(400, {"error": {"code": 400, "status": "INVALID_ARGUMENT"}})
+                text = fake_pack_text(prompt)
+                standin._count("ok")
+                self._send(200, {"candidates": [{"content": {"parts": [{"text": text}]}}]})
+
+        return Handler
+
+    def start(self) -> "StandInGemini":
+        self._thread = threading.Thread(target=self.server.serve_forever, name="standin-gemini", daemon=True)
+        self._thread.start()
+        return self
+
+    def close(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+def _standin_main(conn: Any, options: Dict[str, Any]) -> None:
+    standin = StandInGemini(**options)
+    conn.send(standin.base_url)
+    try:
+        standin.server.serve_forever()
+    finally:
+        standin.server.server_close()
+
+class StandInProcess:
+    """StandInGemini in a child process, so its CPU and memory stay out of the measurement."""
+
+    def __init__(self, **options: Any):
+        parent, child = mp.Pipe()
+        self.process = mp.get_context("spawn").Process(target=_standin_main, args=(child, options), daemon=True)
+        self.process.start()
+        if not parent.poll(30):
+            self.process.terminate()
+            raise RuntimeError("stand-in Gemini server did not start")
+        self.base_url: str = parent.recv()
+
+    def stats(self) -> Dict[str, Any]:
+        import urllib.request
+
+        with urllib.request.urlopen(self.base_url + "/stats", timeout=5) as resp:
+            return json.loads(resp.read())
+
+    def close(self) -> None:
+        self.process.terminate()
+        self.process.join(5)
+
+# ===== Runner =====
+
+def _max_rss_mb() -> Optional[float]:
+    try:
+        import resource
+    except ImportError:
+        return None  # Windows
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)  # bytes on macOS, KiB elsewhere
+
+def _latency(values: List[float]) -> Dict[str, float]:
+    values = sorted(values)
+    if not values:
+        return {}
+    ms = lambda v: round(v * 1000.0, 3)
+    return {"p50": ms(_percentile(values, 50)), "p95": ms(_percentile(values, 95)), "p99": ms(_percentile(values, 99)),
+            "max": ms(values[-1]), "mean": ms(sum(values) / len(values))}
+
+class LoadRunner:
+    """
+    Replays a workload against the engine in this process: offline rows call
+    generate_media_pack, gemini rows go through a GeminiClient (REST transport,
+    normally pointed at a stand-in) and fall back to offline on errors like the
+    app does, hedged rows use HedgedGeneration with the row's deadline_ms.
+    Every Gemini call passes `scheduler` (default: one without a rate ceiling that matters).
+    """
+
+    def __init__(self, workload: Sequence[Dict[str, Any]], gemini_url: Optional[str] = None, api_key: str = "loadtest",
+                 scheduler: Any = None, retries: int = 2, timeout: float = 30.0):
+        from workflows.gemini_client import GeminiClient, RestTransport
+        from workflows.ratelimit import GeminiScheduler
+
+        self.workload = list(workload)
+        needs_gemini = any(it["engine"] != "offline" for it in self.workload)
+        if needs_gemini and not gemini_url:
+            raise ValueError("the workload has gemini/hedged rows: give a Gemini base URL (or a stand-in)")
+        self.scheduler = scheduler or GeminiScheduler(rate=10_000.0, burst=10_000.0)
+        self.client = GeminiClient(api_key, transport=RestTransport(api_key, base_url=gemini_url or "http://127.0.0.1:9",
+                                                                    timeout=timeout),
+                                   retries=retries, backoff=0.1, max_backoff=1.0, max_workers=256, scheduler=self.scheduler)
+        self.records: List[Tuple[str, str, float, Optional[str], Optional[str]]] = []
+        self._lock = threading.Lock()
+
+    def _serve(self, item: Dict[str, Any]) -> Tuple[str, Optional[str]]:
+        """(engine that produced the pack, fallback reason or None)."""
+        from workflows.gemini_llm import pack_result
+        from workflows.hedge import HedgedGeneration
+
+        params = item["params"]
+        if item["engine"] == "offline":
+            generate_media_pack(**params)
+            return "offline", None
+        request = _gemini_request(params)
+        if item["engine"] == "hedged":
+            hedged = HedgedGeneration(self.client.api_key, seed=params.get("seed"), deadline_sec=item["deadline_ms"] / 1000.0,
+                                      client=self.client, **request)
+            hedged.result()
+            return ("gemini", None) if hedged.upgraded else ("offline", hedged.outcome)
+        try:
+            pack_result(self.client.generate_pack(**request), **request)
+            return "gemini", None
+        except Exception as e:
+            generate_media_pack(**params)
+            return "offline", type(e).__name__
+
+    def _one(self, item: Dict[str, Any], scheduled: float) -> None:
+        error = fallback = None
+        served = "-"
+        try:
+            served, fallback = self._serve(item)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"[:200]
+        latency = time.perf_counter() - scheduled
+        with self._lock:
+            self.records.append((item["engine"], served, latency, error, fallback))
+
+    def _items(self, requests: Optional[int], duration_sec: Optional[float], started: float) -> Iterator[Dict[str, Any]]:
+        for n, item in enumerate(itertools.cycle(self.workload)):
+            if requests is not None and n >= requests:
+                return
+            if duration_sec is not None and time.perf_counter() - started >= duration_sec:
+                return
+            yield item
+
+    def run(self, concurrency: int = 8, rate: Optional[float] = None, requests: Optional[int] = None,
+            duration_sec: Optional[float] = None, seed: int = 0,
+            on_progress: Optional[Callable[[int, float], None]] = None) -> Dict[str, Any]:
+        """
+        Closed loop (rate=None): `concurrency` workers each send the next request as soon as
+        the last one is answered. Open loop: Poisson arrivals at `rate` req/s served by up to
+        `concurrency` workers; latency counts from the scheduled arrival, so queueing shows.
+        Stops after `requests` requests or `duration_sec` seconds (default: one pass over the workload).
+        """
+        if requests is None and duration_sec is None:
+            requests = len(self.workload)
+        self.records = []
+        rss_before = _max_rss_mb()
+        started = time.perf_counter()
+        items = self._items(requests, duration_sec, started)
+        if rate is None:
+            take = threading.Lock()
+
+            def worker() -> None:
+                while True:
+                    with take:
+                        item = next(items, None)
+                    if item is None:
+                        return
+                    self._one(item, time.perf_counter())
+
+            threads = [threading.Thread(target=worker, name=f"load-{i}", daemon=True) for i in range(max(1, concurrency))]
+            for t in threads:
+                t.start()
+            for t in threads:
+                while t.is_alive():
+                    t.join(1.0)
+                    if on_progress and t.is_alive():
+                        on_progress(len(self.records), time.perf_counter() - started)
+        else:
+            rng = random.Random(seed)
+            next_at = reported = started
+            with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="load") as pool:
+                for item in items:
+                    next_at += rng.expovariate(rate)
+                    delay = next_at - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+                    pool.submit(self._one, item, next_at)
+                    if on_progress and next_at - reported >= 1.0:
+                        reported = next_at
+                        on_progress(len(self.records), time.perf_counter() - started)
+        elapsed = time.perf_counter() - started
+        return self.report(elapsed, concurrency=concurrency, rate=rate, rss_before=rss_before)
+
+    def report(self, elapsed: float, concurrency: int, rate: Optional[float], rss_before: Optional[float]) -> Dict[str, Any]:
+        records = list(self.records)
+        errors: Dict[str, int] = {}
+        by_engine: Dict[str, Dict[str, Any]] = {}
+        for engine in ENGINES:
+            rows = [r for r in records if r[0] == engine]
+            if not rows:
+                continue
+            fallbacks: Dict[str, int] = {}
+            for r in rows:
+                if r[4]:
+                    fallbacks[r[4]] = fallbacks.get(r[4], 0) + 1
+            by_engine[engine] = {
+                "requests": len(rows),
+                "errors": sum(1 for r in rows if r[3]),
+                "served_by_gemini": sum(1 for r in rows if r[1] == "gemini"),
+                "fallbacks": fallbacks,
+                "latency_ms": _latency([r[2] for r in rows if not r[3]]),
+            }
+        for r in records:
+            if r[3]:
+                kind = r[3].split(":", 1)[0]
+                errors[kind] = errors.get(kind, 0) + 1
+        n = len(records)
+        n_err = sum(errors.values())
+        return {
+            "meta": {
+                "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "python": sys.version.split()[0],
+                "platform": platform.platform(),
+                "cpu_count": os.cpu_count(),
+                "catalog_version": get_catalog().version,
+                "mode": "closed_loop" if rate is None else "open_loop",
+                "concurrency": concurrency,
+                "target_rate": rate,
+                "workload_size": len(self.workload),
+            },
+            "requests": n,
+            "elapsed_sec": round(elapsed, 3),
+            "throughput_rps": round(n / elapsed, 2) if elapsed > 0 else 0.0,
+            "latency_ms": _latency([r[2] for r in records if not r[3]]),
+            "errors": {"total": n_err, "rate": round(n_err / n, 4) if n else 0.0, "by_type": errors},
+            "by_engine": by_engine,
+            "memory": {"max_rss_mb": _max_rss_mb(), "max_rss_mb_before": rss_before},
+            "scheduler": self.scheduler.stats(),
+        }
+
+def run_loadtest(workload: Sequence[Dict[str, Any]], gemini_url: Optional[str] = None, api_key: str = "loadtest",
+                 standin: Optional[Dict[str, Any]] = None, gemini_rate: float = 100.0,
+                 **run_options: Any) -> Dict[str, Any]:
+    """
+    LoadRunner.run() with the Gemini side set up: `gemini_url` as given, else (when
+    the workload has gemini/hedged rows) a StandInProcess built from the `standin`
+    options, stopped afterwards and its counters added to the report. Gemini calls
+    go through a GeminiScheduler with a `gemini_rate` req/s ceiling.
+    """
+    from workflows.ratelimit import GeminiScheduler
+
+    server = None
+    if not gemini_url and any(it["engine"] != "offline" for it in workload):
+        server = StandInProcess(**(standin or {}))
+        gemini_url = server.base_url
+    try:
+        runner = LoadRunner(workload, gemini_url=gemini_url, api_key=api_key,
+                            scheduler=GeminiScheduler(rate=gemini_rate, burst=max(1.0, gemini_rate)))
+        report = runner.run(**run_options)
+        if server is not None:
+            report["gemini_standin"] = dict(standin or {}, **server.stats())
+        return report
+    finally:
+        if server is not None:
+            server.close()
@@ -0,0 +1,253 @@
+from __future__ import annotations
+import hashlib
+from itertools import accumulate
+from array import array
+from dataclasses import dataclass, field, replace
+from typing import Dict, Any, List, Optional, Tuple, Iterable, Iterator
+
+from workflows.engine import WorkflowResult, as_result, pack_digest, reroll_section
+
+FIELDS = ("script", "shotlist", "prompts")
+BITS = 64
+
+class SimHasher:
+    """
+    64-bit SimHash of a pack's script + shotlist + prompts, with words as features.
+    Offline packs are assembled from a small set of template lines, so each line's
+    feature sum is computed once and kept as a matrix row: a pack costs a few dict
+    lookups and one gather-and-sum, and only lines never seen before are tokenized.
+    Both caches are bounded (reset, matrices included, when full), so memory stays
+    flat at any volume; a pack too big for a cache on its own is hashed uncached.
+    """
+
+    def __init__(self, max_lines: int = 1 << 16, max_words: int = 1 << 18):
+        self.max_lines = max_lines
+        self.max_words = max_words
+        self._line_ids: Dict[str, int] = {}
+        self._word_ids: Dict[str, int] = {}
+        self._line_vecs: Any = None   # int32 rows: sum of the line's ±1 word bit vectors
+        self._word_vecs: Any = None   # int8 rows: ±1 per bit of the word's 64-bit hash
+
+    @staticmethod
+    def _grow(matrix: Any, rows: int, limit: int, dtype: Any) -> Any:
+        """`matrix`, or a larger copy of it, with room for at least `rows` rows (at most `limit`)."""
+        import numpy as np
+
+        have = 0 if matrix is None else len(matrix)
+        if rows <= have:
+            return matrix
+        grown = np.empty((min(limit, max(rows, 2 * have, 1024)), BITS), dtype=dtype)
+        if have:
+            grown[:have] = matrix
+        return grown
+
+    @staticmethod
+    def _word_bits(words: List[str]) -> Any:
+        import numpy as np
+
+        digests = b"".join(hashlib.blake2b(w.encode("utf-8"), digest_size=8).digest() for w in words)
+        return np.unpackbits(np.frombuffer(digests, np.uint8)).reshape(-1, BITS).astype(np.int8) * 2 - 1
+
+    def _word_vectors(self, words: List[str]) -> Any:
+        """±1 bit rows for `words`; new words are cached unless they alone would overflow the cache."""
+        import numpy as np
+
+        ids = self._word_ids
+        rows = list(map(ids.get, words))
+        if None in rows:
+            new = list(dict.fromkeys(w for w, i in zip(words, rows) if i is None))
+            if len(ids) + len(new) > self.max_words:
+                ids.clear()
+                self._word_vecs = None
+                new = list(dict.fromkeys(words))
+            if len(new) > self.max_words:
+                return self._word_bits(words)
+            first = len(ids)
+            for k, w in enumerate(new):
+                ids[w] = first + k
+            self._word_vecs = self._grow(self._word_vecs, first + len(new), self.max_words, np.int8)
+            self._word_vecs[first:first + len(new)] = self._word_bits(new)
+            rows = [ids[w] for w in words]
+        return self._word_vecs[rows]
+
+    def _line_sums(self, lines: List[str]) -> Any:
+        import numpy as np
+
+        words = [line.split() for line in lines]
+        starts = list(accumulate(len(ws) for ws in words[:-1]))
+        starts.insert(0, 0)
+        return np.add.reduceat(self._word_vectors([w for ws in words for w in ws]), starts, axis=0, dtype=np.int32)
+
+    def fingerprint(self, res: Any) -> int:
+        """SimHash of a WorkflowResult (or anything with script/shotlist/prompts attributes)."""
+        import numpy as np
+
+        lines = [line for name in FIELDS for line in getattr(res, name).splitlines() if line and not line.isspace()]
+        if not lines:
+            return 0
+        get = self._line_ids.get
+        rows = list(map(get, lines))
+        if None in rows:
+            new = list(dict.fromkeys(line for line, i in zip(lines, rows) if i is None))
+            if len(self._line_ids) + len(new) > self.max_lines:
+                self._line_ids.clear()
+                self._line_vecs = None
+                new = list(dict.fromkeys(lines))
+            if len(new) > self.max_lines:
+                # one pack bigger than the whole cache: sum its lines without caching them
+                return int.from_bytes(np.packbits(self._line_sums(lines).sum(axis=0) > 0).tobytes(), "big")
+            first = len(self._line_ids)
+            for k, line in enumerate(new):
+                self._line_ids[line] = first + k
+            self._line_vecs = self._grow(self._line_vecs, first + len(new), self.max_lines, np.int32)
+            self._line_vecs[first:first + len(new)] = self._line_sums(new)
+            rows = list(map(get, lines))
+        return int.from_bytes(np.packbits(self._line_vecs[rows].sum(axis=0) > 0).tobytes(), "big")
+
+def distance(a: int, b: int) -> int:
+    """Hamming distance between two fingerprints."""
+    return (a ^ b).bit_count()
+
+class SimHashIndex:
+    """
+    Fingerprints within `max_distance` bits of a query, without a linear scan.
+    The 64 bits are cut into max_distance + 1 bands: two fingerprints that close
+    agree exactly on at least one band, so only same-band buckets are checked.
+    Keeps the most recent `capacity` fingerprints (ring buffer, oldest evicted),
+    so memory is bounded: ~(8 + 4 * bands) bytes per entry plus the labels kept.
+    """
+
+    def __init__(self, max_distance: int = 3, capacity: int = 1_000_000):
+        if not 0 <= max_distance < 16:
+            raise ValueError("max_distance must be between 0 and 15")
+        self.max_distance = max_distance
+        self.capacity = capacity
+        bands = max_distance + 1
+        widths = [BITS // bands + (1 if i < BITS % bands else 0) for i in range(bands)]
+        self._bands: List[Tuple[int, int]] = []
+        shift = 0
+        for w in widths:
+            self._bands.append((shift, (1 << w) - 1))
+            shift += w
+        self._tables: List[Dict[int, array]] = [{} for _ in self._bands]
+        self._fps = array("Q")
+        self._labels: List[Optional[str]] = []
+        self._next = 0  # ring slot overwritten by the next add() once full
+
+    def __len__(self) -> int:
+        return len(self._fps)
+
+    def add(self, fp: int, label: Optional[str] = None) -> None:
+        if len(self._fps) < self.capacity:
+            slot = len(self._fps)
+            self._fps.append(fp)
+            self._labels.append(label)
+        else:
+            slot = self._next
+            self._next = (slot + 1) % self.capacity
+            old = self._fps[slot]
+            for (shift, mask), table in zip(self._bands, self._tables):
+                key = (old >> shift) & mask
+                bucket = table[key]
+                bucket.remove(slot)
+                if not bucket:
+                    del table[key]
+            self._fps[slot] = fp
+            self._labels[slot] = label
+        for (shift, mask), table in zip(self._bands, self._tables):
+            key = (fp >> shift) & mask
+            bucket = table.get(key)
+            if bucket is None:
+                table[key] = array("I", (slot,))
+            else:
+                bucket.append(slot)
+
+    def nearest(self, fp: int, max_distance: Optional[int] = None) -> Optional[Tuple[int, Optional[str], int]]:
+        """(distance, label, fingerprint) of the closest entry within max_distance, or None."""
+        limit = self.max_distance if max_distance is None else min(max_distance, self.max_distance)
+        best: Optional[Tuple[int, Optional[str], int]] = None
+        fps = self._fps
+        for (shift, mask), table in zip(self._bands, self._tables):
+            bucket = table.get((fp >> shift) & mask)
+            if not bucket:
+                continue
+            for slot in bucket:
+                d = (fps[slot] ^ fp).bit_count()
+                if d <= limit and (best is None or d < best[0]):
+                    best = (d, self._labels[slot], fps[slot])
+                    if d == 0:
+                        return best
+        return best
+
+@dataclass
+class NearDupStats:
+    checked: int = 0
+    unique: int = 0
+    flagged: int = 0
+    rerolled: int = 0
+    skipped: int = 0
+    distances: Dict[int, int] = field(default_factory=dict)  # distance -> near-duplicates found at it
+
+class NearDupGuard:
+    """
+    Gate packs on their way out: check(res) looks the pack up in the index and,
+    when it is within max_distance of a pack already emitted,
+      "flag"   - keeps it, with meta["near_duplicate"] = {"distance", "of"}
+      "reroll" - re-rolls hook, shotlist and prompts (offline packs) up to
+                 `max_rerolls` times until it is distinct; flags it if it never is
+      "skip"   - drops it (check() returns None)
+    Packs that pass are added to the index under their pack_digest(), which is
+    what "of" reports. Not thread-safe: call from one thread.
+    """
+
+    def __init__(self, policy: str = "flag", max_distance: int = 3, capacity: int = 1_000_000,
+                 max_rerolls: int = 3, hasher: Optional[SimHasher] = None):
+        if policy not in ("flag", "reroll", "skip"):
+            raise ValueError(f"unknown near-duplicate policy {policy!r}; expected flag, reroll or skip")
+        self.policy = policy
+        self.max_rerolls = max_rerolls
+        self.index = SimHashIndex(max_distance, capacity)
+        self.hasher = hasher or SimHasher()
+        self.stats = NearDupStats()
+
+    def _reroll(self, res: WorkflowResult, attempt: int) -> WorkflowResult:
+        seed = res.meta.get("seed")
+        for i, section in enumerate(("hook", "shotlist", "prompts")):
+            res = reroll_section(res, section, None if seed is None else seed * 1000 + attempt * 3 + i)
+        return res
+
+    def check(self, res: WorkflowResult) -> Optional[WorkflowResult]:
+        self.stats.checked += 1
+        fp = self.hasher.fingerprint(res)
+        hit = self.index.nearest(fp)
+        if hit is not None and self.policy == "reroll" and res.meta.get("mode") != "gemini":
+            for attempt in range(self.max_rerolls):
+                try:
+                    candidate = self._reroll(res, attempt)
+                except ValueError:
+                    break  # no recorded picks to re-roll from: flag it instead
+                cfp = self.hasher.fingerprint(candidate)
+                chit = self.index.nearest(cfp)
+                if chit is None:
+                    self.stats.rerolled += 1
+                    res, fp, hit = candidate, cfp, None
+                    break
+        if hit is None:
+            self.stats.unique += 1
+            self.index.add(fp, pack_digest(res))
+            return res
+        d = hit[0]
+        self.stats.distances[d] = self.stats.distances.get(d, 0) + 1
+        if self.policy == "skip":
+            self.stats.skipped += 1
+            return None
+        self.stats.flagged += 1
+        res = as_result(res)
+        return replace(res, meta=dict(res.meta, near_duplicate={"distance": d, "of": hit[1] or f"{hit[2]:016x}"}))
+
+def filter_near_duplicates(results: Iterable[WorkflowResult], guard: NearDupGuard) -> Iterator[WorkflowResult]:
+    """Generation-side hook: pass a lazy stream of packs (generate_variants(), a loop over generate_media_pack()) through the guard."""
+    for res in results:
+        res = guard.check(res)
+        if res is not None:
+            yield res
@@ -0,0 +1,173 @@
+from __future__ import annotations
+import os, json, threading
+from dataclasses import dataclass, field
+from typing import Dict, Any, List, Optional, Sequence, Tuple, Iterable
+
+from workflows.catalog import CONTENT_DIR
+from workflows.classifier import keyword_pattern
+
+SECTIONS = ("outline", "script", "shotlist", "prompts")
+
+@dataclass(frozen=True)
+class Criterion:
+    name: str
+    kind: str                      # keywords | contains_all | min_words
+    field: str                     # outline | script | shotlist | prompts
+    hit: float = 8
+    miss: float = 6
+    weight: float = 1.0
+    threshold: Optional[float] = None   # suggestion when score < threshold (default: hit)
+    suggestion: Optional[str] = None
+    keywords: Tuple[str, ...] = ()      # kind=keywords: any, case-insensitive substring
+    terms: Tuple[str, ...] = ()         # kind=contains_all: all, case-sensitive
+    min_words: int = 0                  # kind=min_words
+
+class Rubric:
+    """
+    QC rubric loaded from data (content/rubric.json). All keyword criteria that
+    read the same section share one overlapping-substring scan of that section.
+    """
+
+    def __init__(self, criteria: Sequence[Dict[str, Any]]):
+        self.criteria: Tuple[Criterion, ...] = tuple(
+            Criterion(**{**c, "keywords": tuple(k.lower() for k in c.get("keywords", ())), "terms": tuple(c.get("terms", ()))})
+            for c in criteria
+        )
+        for c in self.criteria:
+            if c.kind not in ("keywords", "contains_all", "min_words") or c.field not in SECTIONS:
+                raise ValueError(f"rubric criterion {c.name!r}: unsupported kind/field {c.kind}/{c.field}")
+        self.names: Tuple[str, ...] = tuple(c.name for c in self.criteria)
+        self.weights: Tuple[float, ...] = tuple(c.weight for c in self.criteria)
+        self.thresholds: Tuple[float, ...] = tuple(c.hit if c.threshold is None else c.threshold for c in self.criteria)
+        # per section: compiled pattern + keyword -> criterion indexes it satisfies
+        self._scans: Dict[str, Tuple[Any, Dict[str, frozenset], frozenset]] = {}
+        for section in SECTIONS:
+            owners: Dict[str, set] = {}
+            for i, c in enumerate(self.criteria):
+                if c.kind == "keywords" and c.field == section:
+                    for kw in c.keywords:
+                        owners.setdefault(kw, set()).add(i)
+            if owners:
+                # the scan reports the longest keyword at each position, so credit its prefixes too
+                table = {kw: frozenset().union(*(idx for p, idx in owners.items() if kw.startswith(p))) for kw in owners}
+                self._scans[section] = (keyword_pattern(owners, whole_words=False), table, frozenset().union(*owners.values()))
+
+    @classmethod
+    def from_file(cls, path: str) -> "Rubric":
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(json.load(f)["criteria"])
+
+    def hits(self, sections: Dict[str, str]) -> List[bool]:
+        """Which criteria a pack satisfies; each section is lowercased/split at most once."""
+        found: set = set()
+        for section, (pattern, table, wanted) in self._scans.items():
+            seen: set = set()
+            for m in pattern.finditer(sections[section].lower()):
+                seen |= table[m.group(1)]
+                if len(seen) == len(wanted):
+                    break
+            found |= seen
+        words: Dict[str, int] = {}
+        out = []
+        for i, c in enumerate(self.criteria):
+            if c.kind == "keywords":
+                out.append(i in found)
+            elif c.kind == "contains_all":
+                text = sections[c.field]
+                out.append(all(t in text for t in c.terms))
+            else:
+                if c.field not in words:
+                    words[c.field] = len(sections[c.field].split())
+                out.append(words[c.field] >= c.min_words)
+        return out
+
+    def score(self, sections: Dict[str, str]):
+        """Single pack: (scores_dict, avg_score_float, suggestions_list), like quality_check_pack."""
+        scores = {c.name: (c.hit if h else c.miss) for c, h in zip(self.criteria, self.hits(sections))}
+        total_w = sum(self.weights)
+        avg_score = round(sum(v * w for v, w in zip(scores.values(), self.weights)) / total_w, 1)
+        suggestions = [c.suggestion for c, t in zip(self.criteria, self.thresholds) if c.suggestion and scores[c.name] < t]
+        return scores, avg_score, suggestions
+
+_default: Optional[Rubric] = None
+_default_lock = threading.Lock()
+
+def get_rubric() -> Rubric:
+    global _default
+    if _default is None:
+        with _default_lock:
+            if _default is None:
+                _default = Rubric.from_file(os.path.join(CONTENT_DIR, "rubric.json"))
+    return _default
+
+def reload_rubric() -> Rubric:
+    """Re-read content/rubric.json (after it changed on disk) and return the fresh rubric."""
+    global _default
+    with _default_lock:
+        _default = Rubric.from_file(os.path.join(CONTENT_DIR, "rubric.json"))
+    return _default
+
+def _sections(pack: Any) -> Dict[str, str]:
+    if isinstance(pack, dict):
+        return {s: pack.get(s, "") or "" for s in SECTIONS}
+    if isinstance(pack, (tuple, list)):
+        return dict(zip(SECTIONS, pack))
+    return {s: getattr(pack, s) for s in SECTIONS}
+
+@dataclass
+class QCReport:
+    criteria: Tuple[str, ...]
+    scores: Any                    # np.ndarray (packs × criteria)
+    averages: Any                  # np.ndarray (packs,)
+    passed: Any                    # np.ndarray bool (packs × criteria): score >= threshold
+    suggestions: List[List[str]]
+    stats: Dict[str, Any] = field(default_factory=dict)
+
+    def pack(self, i: int):
+        """Row i in quality_check_pack's (scores_dict, avg, suggestions) shape."""
+        return dict(zip(self.criteria, self.scores[i].tolist())), float(self.averages[i]), self.suggestions[i]
+
+def qc_many(
+    packs: Iterable[Any],
+    rubric: Optional[Rubric] = None,
+    weights: Optional[Dict[str, float]] = None,
+    thresholds: Optional[Dict[str, float]] = None,
+) -> QCReport:
+    """
+    Batch QC: packs are WorkflowResults (or CompactResults), dicts or (outline,
+    script, shotlist, prompts) tuples. Returns a packs × criteria score matrix
+    (NumPy), weighted averages, per-pack suggestions and aggregate statistics.
+    `weights` / `thresholds` override the rubric per criterion name, e.g. to re-score history.
+    """
+    import numpy as np
+
+    rubric = rubric or get_rubric()
+    crit = rubric.criteria
+    unknown = set(weights or ()).union(thresholds or ()) - set(rubric.names)
+    if unknown:
+        raise ValueError(f"unknown QC criteria: {', '.join(sorted(unknown))}")
+    hits = np.array([rubric.hits(_sections(p)) for p in packs], dtype=bool).reshape(-1, len(crit))
+    hit_v = np.array([c.hit for c in crit], dtype=float)
+    miss_v = np.array([c.miss for c in crit], dtype=float)
+    w = np.array([(weights or {}).get(c.name, c.weight) for c in crit], dtype=float)
+    th = np.array([(thresholds or {}).get(c.name, t) for c, t in zip(crit, rubric.thresholds)], dtype=float)
+
+    scores = np.where(hits, hit_v, miss_v)
+    averages = np.round(scores @ w / w.sum(), 1) if len(crit) else np.zeros(len(hits))
+    passed = scores >= th
+    has_tip = np.array([bool(c.suggestion) for c in crit])
+    tips = [c.suggestion for c in crit]
+    need = ~passed & has_tip
+    suggestions = [[tips[j] for j in np.flatnonzero(row)] for row in need]
+
+    n = len(scores)
+    stats: Dict[str, Any] = {"packs": n}
+    if n:
+        stats.update({
+            "average": {"mean": float(averages.mean()), "min": float(averages.min()), "max": float(averages.max()),
+                        "p50": float(np.percentile(averages, 50)), "p10": float(np.percentile(averages, 10))},
+            "criterion_mean": dict(zip(rubric.names, scores.mean(axis=0).round(3).tolist())),
+            "criterion_pass_rate": dict(zip(rubric.names, passed.mean(axis=0).round(4).tolist())),
+            "all_pass_rate": float(passed.all(axis=1).mean()),
+        })
+    return QCReport(rubric.names, scores, averages, passed, suggestions, stats)
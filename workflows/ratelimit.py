@@ -0,0 +1,473 @@
+from __future__ import annotations
+import os, time, heapq, asyncio, itertools, threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from collections import deque
+from typing import Dict, Any, List, Optional, Iterator, Callable, Tuple, Deque
+
+# Priorities: lower is served first. Interactive = a person waiting on the page / API call.
+INTERACTIVE, BATCH = 0, 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BATCH: "batch"}
+
+# Outcomes reported back with release()
+OK, THROTTLED, FAILED, OTHER = "ok", "throttled", "failed", "other"
+
+def key_label(key: str) -> str:
+    """How a key appears in stats(): its last 4 characters only."""
+    return "…" + key[-4:]
+
+def rate_text(rate: Optional[float]) -> str:
+    """How a bucket rate appears in messages (None: not limited yet)."""
+    return "no rate limit" if rate is None else f"{rate:.2f} req/s"
+
+class SchedulerRejected(Exception):
+    """The scheduler turned the call down without trying the backend; `retry_after` in seconds."""
+    retryable = False
+
+    def __init__(self, message: str, retry_after: float = 0.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class CircuitOpenError(SchedulerRejected):
+    pass
+
+class QuotaExceededError(SchedulerRejected):
+    pass
+
+class QueueTimeoutError(SchedulerRejected):
+    pass
+
+_priority: ContextVar[Optional[int]] = ContextVar("glowmini_priority", default=None)
+_deadline: ContextVar[Optional[float]] = ContextVar("glowmini_deadline", default=None)
+
+def current_priority(default: int = INTERACTIVE) -> int:
+    p = _priority.get()
+    return default if p is None else p
+
+@contextmanager
+def priority(level: int) -> Iterator[None]:
+    """Calls made inside the block (same thread / asyncio task) queue at `level`."""
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+@contextmanager
+def deadline(at: float) -> Iterator[None]:
+    """Calls made inside the block are not started after time.monotonic() passes `at` (QueueTimeoutError instead)."""
+    token = _deadline.set(at)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+class AdaptiveTokenBucket:
+    """
+    Token bucket whose refill rate follows AIMD: each success adds `increase`
+    req/s or `growth` times the rate, whichever is more (up to `max_rate`); a
+    throttle sets it to `decrease` times the rate actually granted over the last
+    second (down to `min_rate`) and empties the bucket. Throttles within a second
+    of the last decrease are one congestion event (concurrent calls see the same
+    429 storm) and do not cut it again. A rate of None means no limit: every call
+    is let through until the first throttle sets one (max_rate None: no ceiling
+    for the increase either). A success `recover_after` seconds after the last
+    throttle puts the rate back to max_rate (unlimited, when that is None).
+    Not locked: GeminiScheduler holds its lock.
+    """
+
+    def __init__(self, rate: Optional[float], burst: float, min_rate: float = 0.05, increase: float = 0.05,
+                 decrease: float = 0.5, growth: float = 0.02, recover_after: float = 60.0):
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.growth = growth
+        self.recover_after = recover_after
+        self.tokens = burst
+        self._stamp = time.monotonic()
+        self._grants: Deque[float] = deque(maxlen=4096)
+        self._decreased_at = float("-inf")
+        self._throttled_at = float("-inf")
+
+    def refill(self, now: float) -> None:
+        if self.rate is None:
+            self.tokens = self.burst
+        else:
+            self.tokens = min(self.burst, self.tokens + (now - self._stamp) * self.rate)
+        self._stamp = now
+
+    def wait_time(self) -> float:
+        """Seconds until one token is available (after refill())."""
+        return 0.0 if self.tokens >= 1 or self.rate is None else (1 - self.tokens) / self.rate
+
+    def take(self, now: float) -> None:
+        self.tokens -= 1
+        self._grants.append(now)
+
+    def granted_rate(self, now: float) -> float:
+        """Grants per second over the last second."""
+        return sum(1 for t in self._grants if now - t <= 1.0)
+
+    def on_success(self, now: float) -> None:
+        if self.rate is None:
+            return
+        if now - self._throttled_at >= self.recover_after:
+            self.rate = self.max_rate  # quiet for a while: the 429s that set the rate are history
+            return
+        rate = self.rate + max(self.increase, self.rate * self.growth)
+        self.rate = rate if self.max_rate is None else min(self.max_rate, rate)
+
+    def on_throttle(self, now: float) -> None:
+        self.tokens = min(self.tokens, 0.0)
+        self._throttled_at = now
+        if now - self._decreased_at < 1.0:
+            return
+        self._decreased_at = now
+        granted = max(self.granted_rate(now), 1.0)
+        self.rate = max(self.min_rate, (granted if self.rate is None else min(self.rate, granted)) * self.decrease)
+
+class CircuitBreaker:
+    """
+    closed -> open after `threshold` consecutive failures; open rejects every call
+    for `cooldown` seconds, then half-open lets one probe through. A good probe
+    closes it, a bad one reopens it with the cooldown doubled (up to `max_cooldown`).
+    A probe that never reports back is given up on after a cooldown.
+    """
+
+    def __init__(self, threshold: int = 5, cooldown: float = 30.0, max_cooldown: float = 300.0):
+        self.threshold = threshold
+        self.base_cooldown = cooldown
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probe_at: Optional[float] = None
+        self.trips = 0
+
+    def retry_after(self, now: float) -> float:
+        if self.state == "open":
+            return max(0.0, self.opened_at + self.cooldown - now)
+        if self.state == "half_open" and self.probe_at is not None:
+            return max(0.0, self.probe_at + self.cooldown - now)
+        return 0.0
+
+    def allow(self, now: float) -> bool:
+        if self.state == "open" and now - self.opened_at >= self.cooldown:
+            self.state, self.probe_at = "half_open", None
+        if self.state == "half_open":
+            return self.probe_at is None or now - self.probe_at >= self.cooldown
+        return self.state == "closed"
+
+    def on_grant(self, now: float) -> None:
+        if self.state == "half_open":
+            self.probe_at = now
+
+    def on_success(self) -> None:
+        self.state, self.failures, self.probe_at = "closed", 0, None
+        self.cooldown = self.base_cooldown
+
+    def on_failure(self, now: float) -> None:
+        self.failures += 1
+        if self.state == "half_open":
+            self.cooldown = min(self.max_cooldown, self.cooldown * 2)
+        elif self.failures < self.threshold:
+            return
+        self.state, self.opened_at, self.probe_at = "open", now, None
+        self.trips += 1
+
+class _KeyState:
+    def __init__(self, bucket: AdaptiveTokenBucket, breaker: CircuitBreaker):
+        self.bucket = bucket
+        self.breaker = breaker
+        self.waiting: List[Tuple[int, int]] = []  # heap of (priority, arrival)
+        self.wakers: Dict[Tuple[int, int], Tuple[asyncio.AbstractEventLoop, asyncio.Event]] = {}  # aacquire() entries
+        self.quota: Optional[int] = None
+        self.quota_window = 86400.0
+        self.quota_start = time.monotonic()
+        self.quota_used = 0
+        self.counters: Dict[str, float] = {
+            "granted": 0, OK: 0, THROTTLED: 0, FAILED: 0, OTHER: 0,
+            "rejected_open": 0, "rejected_quota": 0, "timed_out": 0, "wait_ms": 0.0,
+        }
+
+class GeminiScheduler:
+    """
+    Admission for backend calls, per API key: an adaptive token bucket (AIMD on
+    429s), an optional call quota per window, a priority queue so interactive
+    calls go ahead of queued batch work, and a circuit breaker. Callers wrap each
+    backend attempt in slot() (or acquire()/release()); while the breaker is open
+    acquire() raises CircuitOpenError at once, so callers go straight to their
+    offline fallback. `max_wait` bounds queueing per priority (None = no bound).
+    `rate` is the per-key ceiling in req/s (None: none, calls go unthrottled until
+    the backend's first 429 sets a rate); `quota` calls per `quota_window` seconds
+    applies to every key (set_rate()/set_quota() override both for one key).
+    Thread-safe; stats() is a snapshot of every key's state and counters.
+    """
+
+    def __init__(self, rate: Optional[float] = None, burst: float = 4.0, min_rate: float = 0.05, increase: float = 0.05,
+                 decrease: float = 0.5, failure_threshold: int = 5, cooldown: float = 30.0, max_cooldown: float = 300.0,
+                 max_wait: Optional[Dict[int, Optional[float]]] = None, quota: Optional[int] = None,
+                 quota_window: float = 86400.0, growth: float = 0.02, recover_after: float = 60.0):
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.growth = growth
+        self.recover_after = recover_after
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.max_wait = {INTERACTIVE: 10.0, BATCH: None, **(max_wait or {})}
+        self.quota = quota
+        self.quota_window = quota_window
+        self._keys: Dict[str, _KeyState] = {}
+        self._cond = threading.Condition()
+        self._arrivals = itertools.count()
+
+    def _state(self, key: str) -> _KeyState:
+        st = self._keys.get(key)
+        if st is None:
+            st = self._keys[key] = _KeyState(
+                AdaptiveTokenBucket(self.rate, self.burst, self.min_rate, self.increase, self.decrease, self.growth,
+                                    self.recover_after),
+                CircuitBreaker(self.failure_threshold, self.cooldown, self.max_cooldown),
+            )
+            st.quota, st.quota_window = self.quota, self.quota_window
+        return st
+
+    def set_quota(self, key: str, calls: Optional[int], window_sec: float = 86400.0) -> None:
+        """At most `calls` granted calls per `window_sec` for this key (None removes the quota)."""
+        with self._cond:
+            st = self._state(key)
+            st.quota, st.quota_window = calls, window_sec
+            st.quota_start, st.quota_used = time.monotonic(), 0
+
+    def set_rate(self, key: str, rate: Optional[float], burst: Optional[float] = None) -> None:
+        """Per-key ceiling for the adaptive rate (req/s; None: no ceiling, unthrottled until a 429)."""
+        with self._cond:
+            bucket = self._state(key).bucket
+            bucket.max_rate = bucket.rate = rate
+            if burst is not None:
+                bucket.burst = burst
+            self._wake(self._state(key))
+
+    def available(self, key: str) -> bool:
+        """False while calls with this key would be rejected outright (breaker open or quota spent)."""
+        with self._cond:
+            st = self._state(key)
+            now = time.monotonic()
+            return st.breaker.allow(now) and not self._quota_spent(st, now)
+
+    @staticmethod
+    def _quota_spent(st: _KeyState, now: float) -> bool:
+        if st.quota is None:
+            return False
+        if now - st.quota_start >= st.quota_window:
+            st.quota_start, st.quota_used = now, 0
+        return st.quota_used >= st.quota
+
+    def _check(self, st: _KeyState, now: float) -> None:
+        if not st.breaker.allow(now):
+            st.counters["rejected_open"] += 1
+            retry = st.breaker.retry_after(now)
+            raise CircuitOpenError(f"Gemini backend unhealthy, circuit {st.breaker.state} (retry in {retry:.0f}s)", retry)
+        if self._quota_spent(st, now):
+            st.counters["rejected_quota"] += 1
+            retry = st.quota_start + st.quota_window - now
+            raise QuotaExceededError(f"Gemini quota of {st.quota} calls per {st.quota_window:.0f}s used up "
+                                     f"(resets in {retry:.0f}s)", retry)
+
+    def _limits(self, key: str, level: Optional[int], timeout: Optional[float]) -> Tuple[int, float, Optional[float], Optional[float]]:
+        # (level, started, give-up time, timeout) for a new acquire, honouring an enclosing deadline()
+        level = current_priority() if level is None else level
+        timeout = self.max_wait.get(level) if timeout is None else timeout
+        started = time.monotonic()
+        limit = _deadline.get()
+        if limit is not None:
+            if limit <= started:
+                with self._cond:
+                    self._state(key).counters["timed_out"] += 1
+                raise QueueTimeoutError("deadline passed before the Gemini call could start")
+            timeout = limit - started if timeout is None else min(timeout, limit - started)
+        return level, started, None if timeout is None else started + timeout, timeout
+
+    def _poll(self, st: _KeyState, entry: Tuple[int, int], started: float, deadline: Optional[float],
+              timeout: Optional[float]) -> Tuple[bool, Optional[float]]:
+        # under the lock: (True, None) once `entry` got its slot, else (False, seconds to wait; None = until woken)
+        now = time.monotonic()
+        st.bucket.refill(now)
+        head = st.waiting[0] is entry
+        if head and st.bucket.tokens >= 1:
+            self._check(st, now)
+            heapq.heappop(st.waiting)
+            st.bucket.take(now)
+            st.breaker.on_grant(now)
+            if st.quota is not None:
+                st.quota_used += 1
+            st.counters["granted"] += 1
+            st.counters["wait_ms"] += (now - started) * 1000.0
+            return True, None
+        if deadline is not None and now >= deadline:
+            st.counters["timed_out"] += 1
+            raise QueueTimeoutError(f"Gemini call queued over {timeout:.2f}s ({len(st.waiting)} waiting at "
+                                    f"{rate_text(st.bucket.rate)})", st.bucket.wait_time())
+        # the head sleeps until its token; the others until something changes
+        wait = st.bucket.wait_time() if head else None
+        if deadline is not None:
+            wait = deadline - now if wait is None else min(wait, deadline - now)
+        return False, wait
+
+    def _leave(self, st: _KeyState, entry: Tuple[int, int]) -> None:
+        if entry in st.waiting:
+            st.waiting.remove(entry)
+            heapq.heapify(st.waiting)
+        self._wake(st)
+
+    def _wake(self, st: _KeyState) -> None:
+        # under the lock: threads blocked in acquire(), and the head of the queue if it is an aacquire() (only
+        # the head can be granted; the rest wake for their own deadline, or when they become the head)
+        self._cond.notify_all()
+        waker = st.wakers.get(st.waiting[0]) if st.waiting else None
+        if waker is not None:
+            try:
+                waker[0].call_soon_threadsafe(waker[1].set)
+            except RuntimeError:
+                pass  # that loop is closed; its waiter is gone
+
+    def acquire(self, key: str, level: Optional[int] = None, timeout: Optional[float] = None) -> None:
+        """
+        Block until this call may go to the backend. Raises CircuitOpenError,
+        QuotaExceededError, or QueueTimeoutError after `timeout` (default:
+        max_wait for the priority, cut short by an enclosing deadline() block).
+        Every successful acquire() needs a release().
+        """
+        level, started, deadline, timeout = self._limits(key, level, timeout)
+        with self._cond:
+            st = self._state(key)
+            self._check(st, started)
+            entry = (level, next(self._arrivals))
+            heapq.heappush(st.waiting, entry)
+            try:
+                while True:
+                    granted, wait = self._poll(st, entry, started, deadline, timeout)
+                    if granted:
+                        return
+                    self._cond.wait(wait)
+                    self._check(st, time.monotonic())
+            finally:
+                self._leave(st, entry)
+
+    async def aacquire(self, key: str, level: Optional[int] = None, timeout: Optional[float] = None) -> None:
+        """
+        acquire() for coroutines: queues in the same priority order, but waits on
+        the event loop (woken by release() and the like), not in a thread. A
+        caller cancelled while queued just leaves the queue.
+        """
+        level, started, deadline, timeout = self._limits(key, level, timeout)
+        waker = (asyncio.get_running_loop(), asyncio.Event())
+        with self._cond:
+            st = self._state(key)
+            self._check(st, started)
+            entry = (level, next(self._arrivals))
+            heapq.heappush(st.waiting, entry)
+            st.wakers[entry] = waker
+        try:
+            while True:
+                with self._cond:
+                    granted, wait = self._poll(st, entry, started, deadline, timeout)
+                    if granted:
+                        return
+                    waker[1].clear()  # under the lock: a wake-up sent after this is not lost
+                try:
+                    await asyncio.wait_for(waker[1].wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+                with self._cond:
+                    self._check(st, time.monotonic())
+        finally:
+            with self._cond:
+                del st.wakers[entry]
+                self._leave(st, entry)
+
+    def release(self, key: str, outcome: str) -> None:
+        """Report how the granted call went: OK, THROTTLED (429), FAILED (unavailable/timeout) or OTHER."""
+        with self._cond:
+            st = self._state(key)
+            st.counters[outcome] += 1
+            now = time.monotonic()
+            if outcome == OK:
+                st.bucket.on_success(now)
+                st.breaker.on_success()
+            elif outcome == THROTTLED:
+                st.bucket.on_throttle(now)
+                st.breaker.on_failure(now)
+            elif outcome == FAILED:
+                st.breaker.on_failure(now)
+            elif st.breaker.state == "half_open":
+                st.breaker.on_success()  # the backend answered, even if the request was bad
+            self._wake(st)
+
+    @contextmanager
+    def slot(self, key: str, level: Optional[int] = None, classify: Callable[[BaseException], str] = lambda e: FAILED) -> Iterator[None]:
+        """acquire() ... release(): an exception from the block is reported as classify(e)."""
+        self.acquire(key, level)
+        try:
+            yield
+        except BaseException as e:
+            self.release(key, classify(e))
+            raise
+        self.release(key, OK)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Per key (shown as its last 4 characters): breaker, rate, queue and counters."""
+        out: Dict[str, Dict[str, Any]] = {}
+        with self._cond:
+            now = time.monotonic()
+            for key, st in self._keys.items():
+                st.bucket.refill(now)
+                st.breaker.allow(now)
+                queued = {name: sum(1 for lv, _ in st.waiting if lv == level) for level, name in PRIORITY_NAMES.items()}
+                out[key_label(key)] = {
+                    "circuit": st.breaker.state,
+                    "consecutive_failures": st.breaker.failures,
+                    "trips": st.breaker.trips,
+                    "retry_in_sec": round(st.breaker.retry_after(now), 1),
+                    "rate": None if st.bucket.rate is None else round(st.bucket.rate, 3),
+                    "max_rate": st.bucket.max_rate,
+                    "tokens": round(st.bucket.tokens, 2),
+                    "queued": queued,
+                    "quota": None if st.quota is None else {"calls": st.quota, "used": st.quota_used,
+                                                            "window_sec": st.quota_window},
+                    **{k: round(v, 1) if isinstance(v, float) else v for k, v in st.counters.items()},
+                }
+        return out
+
+def _env_number(name: str, kind: Callable[[str], Any] = float) -> Any:
+    value = os.environ.get(name)
+    return kind(value) if value else None
+
+_scheduler: Optional[GeminiScheduler] = None
+_scheduler_lock = threading.Lock()
+
+def get_scheduler() -> GeminiScheduler:
+    """
+    The process-wide scheduler every shared Gemini client (get_client()) goes
+    through. Per key: GLOWMINI_GEMINI_RPS caps the rate (default: no ceiling, the
+    first 429 sets it), GLOWMINI_GEMINI_BURST the burst (default 4) and
+    GLOWMINI_GEMINI_QUOTA the calls per GLOWMINI_GEMINI_QUOTA_WINDOW seconds
+    (default: no quota; window one day).
+    """
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = GeminiScheduler(rate=_env_number("GLOWMINI_GEMINI_RPS"),
+                                             burst=_env_number("GLOWMINI_GEMINI_BURST") or 4.0,
+                                             quota=_env_number("GLOWMINI_GEMINI_QUOTA", int),
+                                             quota_window=_env_number("GLOWMINI_GEMINI_QUOTA_WINDOW") or 86400.0)
+    return _scheduler
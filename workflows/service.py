@@ -0,0 +1,144 @@
+from __future__ import annotations
+import os, time, threading
+from collections import deque
+from typing import Dict, Any, List, Optional, Callable, Hashable
+
+class ServiceBusy(Exception):
+    """The queue is full; try again shortly."""
+
+class Job:
+    """
+    One queued or running piece of work. Every caller that submitted the same key
+    while it was in flight holds this same Job and gets the same result. The work
+    function receives the Job and may publish() partial output (sections streamed
+    so far, a draft) for callers to show while they wait.
+    """
+
+    def __init__(self, key: Hashable, fn: Callable[..., Any], args: tuple, kwargs: Dict[str, Any]):
+        self.key = key
+        self.state = "queued"  # queued -> running -> done
+        self.callers = 1
+        self.submitted = time.monotonic()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.progress: Dict[str, Any] = {}
+        self._call = (fn, args, kwargs)
+        self._done = threading.Event()
+        self._result: Any = None
+        self._error: Optional[BaseException] = None
+
+    def publish(self, name: str, value: Any) -> None:
+        self.progress = dict(self.progress, **{name: value})  # swapped whole, so readers never see it mid-update
+
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        return self._done.wait(timeout)
+
+    def result(self, timeout: Optional[float] = None) -> Any:
+        if not self._done.wait(timeout):
+            raise TimeoutError(f"job {self.key!r} still {self.state}")
+        if self._error is not None:
+            raise self._error
+        return self._result
+
+    @property
+    def failed(self) -> bool:
+        return self._error is not None
+
+    def elapsed(self) -> float:
+        return (self.finished or time.monotonic()) - self.submitted
+
+class GenerationService:
+    """
+    Process-wide worker pool shared by every session of the app. At most
+    `workers` jobs run at once and at most `max_queue` wait behind them (submit
+    raises ServiceBusy beyond that). Submitting a key that is already queued or
+    running joins that job instead of starting another (single flight), so
+    identical requests from several sessions cost one generation. A finished job
+    leaves the in-flight table; callers keep their Job handle to read the result.
+    """
+
+    def __init__(self, workers: int = 4, max_queue: int = 64):
+        self.workers = max(1, workers)
+        self.max_queue = max_queue
+        self._cond = threading.Condition()
+        self._queue: deque = deque()
+        self._inflight: Dict[Hashable, Job] = {}
+        self._threads: List[threading.Thread] = []
+        self._running = 0
+        self.submitted = self.coalesced = self.completed = self.failed = self.rejected = 0
+
+    def submit(self, key: Hashable, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Job:
+        """Queue fn(job, *args, **kwargs) under `key`, or join the job already in flight for it."""
+        with self._cond:
+            job = self._inflight.get(key)
+            if job is not None:
+                job.callers += 1
+                self.coalesced += 1
+                return job
+            if self._running + len(self._queue) >= self.workers + self.max_queue:
+                self.rejected += 1
+                raise ServiceBusy(f"generation queue is full ({self.max_queue} waiting)")
+            job = self._inflight[key] = Job(key, fn, args, kwargs)
+            self._queue.append(job)
+            self.submitted += 1
+            if len(self._threads) < self.workers and self._running + len(self._queue) > len(self._threads):
+                t = threading.Thread(target=self._work, name=f"glowmini-gen-{len(self._threads)}", daemon=True)
+                self._threads.append(t)
+                t.start()
+            self._cond.notify()
+            return job
+
+    def position(self, job: Job) -> int:
+        """1-based place of a queued job in line (0 once it runs)."""
+        with self._cond:
+            try:
+                return self._queue.index(job) + 1
+            except ValueError:
+                return 0
+
+    def _work(self) -> None:
+        while True:
+            with self._cond:
+                while not self._queue:
+                    self._cond.wait()
+                job = self._queue.popleft()
+                self._running += 1
+            job.state, job.started = "running", time.monotonic()
+            fn, args, kwargs = job._call
+            try:
+                job._result = fn(job, *args, **kwargs)
+            except BaseException as e:
+                job._error = e
+            with self._cond:
+                self._running -= 1
+                if job._error is None:
+                    self.completed += 1
+                else:
+                    self.failed += 1
+                job.state, job.finished, job._call = "done", time.monotonic(), None
+                job._done.set()
+                if self._inflight.get(job.key) is job:
+                    del self._inflight[job.key]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {"workers": self.workers, "running": self._running, "queued": len(self._queue),
+                    "in_flight": len(self._inflight), "waiting_callers": sum(j.callers for j in self._inflight.values()),
+                    "submitted": self.submitted, "coalesced": self.coalesced, "completed": self.completed,
+                    "failed": self.failed, "rejected": self.rejected}
+
+_default: Optional[GenerationService] = None
+_default_lock = threading.Lock()
+
+def get_service() -> GenerationService:
+    """Process-wide service; size from GLOWMINI_APP_WORKERS / GLOWMINI_APP_QUEUE (default 4 / 64)."""
+    global _default
+    if _default is None:
+        with _default_lock:
+            if _default is None:
+                _default = GenerationService(int(os.environ.get("GLOWMINI_APP_WORKERS") or 4),
+                                             int(os.environ.get("GLOWMINI_APP_QUEUE") or 64))
+    return _default
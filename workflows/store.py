@@ -0,0 +1,294 @@
+from __future__ import annotations
+import os, json, mmap, zlib, struct, sqlite3, threading
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Dict, Any, List, Optional, Iterable, Iterator, Tuple
+
+try:
+    import fcntl  # cross-process append lock (POSIX); Windows falls back to the in-process lock
+except ImportError:
+    fcntl = None
+
+from workflows.engine import WorkflowResult, pack_digest, result_dict
+
+DEFAULT_STORE = os.environ.get("GLOWMINI_STORE", ".glowmini_store")
+
+# Segment record: magic, payload length, crc32(payload), then UTF-8 JSON payload
+_HEADER = struct.Struct("<4sII")
+_MAGIC = b"GPK1"
+
+@dataclass(frozen=True)
+class PackEntry:
+    id: str
+    generated_at: str
+    topic: str
+    mode: str
+    seed: Optional[int]
+    engine: str
+    language: str
+    platform: str
+
+_COLUMNS = "id, generated_at, topic, mode, seed, engine, language, platform"
+
+class PackStore:
+    """
+    Append-only pack store: WorkflowResult records are appended to segment files
+    (<root>/segments/NNNNNN.seg) and indexed in SQLite by id, topic, mode, seed,
+    engine and generated_at. Reads are memory-mapped; lookups never touch other
+    records. Deletes append a tombstone; compact() rewrites only the live records.
+    The index can always be rebuilt from the segments with reindex().
+
+    Also usable as a PackExporter sink (write_batch/close).
+    """
+
+    def __init__(self, root: str = DEFAULT_STORE, max_segment_bytes: int = 64 * 1024 * 1024):
+        self.root = root
+        self.max_segment_bytes = max_segment_bytes
+        self._seg_dir = os.path.join(root, "segments")
+        os.makedirs(self._seg_dir, exist_ok=True)
+        self._lock = threading.RLock()
+        self._local = threading.local()
+        self._maps: Dict[int, Tuple[Any, mmap.mmap, int]] = {}
+        with self._db() as db:
+            db.execute("CREATE TABLE IF NOT EXISTS packs (id TEXT PRIMARY KEY, segment INTEGER NOT NULL, offset INTEGER NOT NULL, "
+                       "length INTEGER NOT NULL, generated_at TEXT, topic TEXT, mode TEXT, seed INTEGER, engine TEXT, "
+                       "language TEXT, platform TEXT)")
+            for col in ("generated_at", "topic", "mode", "seed", "engine"):
+                db.execute(f"CREATE INDEX IF NOT EXISTS packs_{col} ON packs({col}, generated_at)")
+
+    # ---- plumbing ----
+    @contextmanager
+    def _db(self) -> Iterator[sqlite3.Connection]:
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(os.path.join(self.root, "index.sqlite"), timeout=30)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        with db:
+            yield db
+
+    @contextmanager
+    def _write_lock(self) -> Iterator[None]:
+        with self._lock:
+            with open(os.path.join(self.root, "lock"), "a") as lf:
+                if fcntl is not None:
+                    fcntl.flock(lf, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(lf, fcntl.LOCK_UN)
+
+    def _segments(self) -> List[int]:
+        return sorted(int(f[:-4]) for f in os.listdir(self._seg_dir) if f.endswith(".seg"))
+
+    def _seg_path(self, seg: int) -> str:
+        return os.path.join(self._seg_dir, f"{seg:06d}.seg")
+
+    def _view(self, seg: int, end: int) -> mmap.mmap:
+        cached = self._maps.get(seg)
+        if cached is None or cached[2] < end:
+            if cached is not None:
+                cached[1].close()
+                cached[0].close()
+            f = open(self._seg_path(seg), "rb")
+            size = os.fstat(f.fileno()).st_size
+            cached = self._maps[seg] = (f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ), size)
+        return cached[1]
+
+    def _close_maps(self) -> None:
+        for f, mm, _ in self._maps.values():
+            mm.close()
+            f.close()
+        self._maps.clear()
+
+    @staticmethod
+    def _encode(payload: Dict[str, Any]) -> bytes:
+        body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        return _HEADER.pack(_MAGIC, len(body), zlib.crc32(body)) + body
+
+    def _read(self, seg: int, offset: int, length: int) -> Dict[str, Any]:
+        with self._lock:
+            view = self._view(seg, offset + length)
+            magic, size, crc = _HEADER.unpack_from(view, offset)
+            body = view[offset + _HEADER.size: offset + _HEADER.size + size]
+        if magic != _MAGIC or zlib.crc32(body) != crc:
+            raise ValueError(f"corrupt record in segment {seg} at {offset}")
+        return json.loads(body)
+
+    def _iter_segment(self, seg: int) -> Iterator[Tuple[int, int, Dict[str, Any]]]:
+        with open(self._seg_path(seg), "rb") as f:
+            data = f.read()
+        pos = 0
+        while pos + _HEADER.size <= len(data):
+            magic, size, crc = _HEADER.unpack_from(data, pos)
+            body = data[pos + _HEADER.size: pos + _HEADER.size + size]
+            if magic != _MAGIC or len(body) < size or zlib.crc32(body) != crc:
+                break  # torn tail from an interrupted append
+            yield pos, _HEADER.size + size, json.loads(body)
+            pos += _HEADER.size + size
+
+    @staticmethod
+    def _row(pack_id: str, seg: int, offset: int, length: int, rec: Dict[str, Any]) -> tuple:
+        meta = rec.get("meta") or {}
+        return (pack_id, seg, offset, length, meta.get("generated_at"), rec.get("topic"), rec.get("mode"),
+                meta.get("seed"), meta.get("mode"), rec.get("language"), rec.get("platform"))
+
+    def _append(self, records: List[Tuple[str, Dict[str, Any]]]) -> List[tuple]:
+        # caller holds the write lock
+        segs = self._segments()
+        seg = segs[-1] if segs else 1
+        rows = []
+        f = open(self._seg_path(seg), "ab")
+        try:
+            for pack_id, rec in records:
+                if f.tell() >= self.max_segment_bytes:
+                    f.close()
+                    seg += 1
+                    f = open(self._seg_path(seg), "ab")
+                blob = self._encode(rec)
+                rows.append(self._row(pack_id, seg, f.tell(), len(blob), rec))
+                f.write(blob)
+        finally:
+            f.close()
+        return rows
+
+    # ---- public API ----
+    def put_many(self, results: Iterable[WorkflowResult]) -> List[str]:
+        """Append packs; a pack already in the store (same content digest) is not stored twice."""
+        batch: Dict[str, Dict[str, Any]] = {}
+        for res in results:
+            batch.setdefault(pack_digest(res), result_dict(res))
+        if not batch:
+            return []
+        with self._write_lock():
+            with self._db() as db:
+                known = set()
+                ids = list(batch)
+                for i in range(0, len(ids), 500):
+                    chunk = ids[i:i + 500]
+                    known.update(r[0] for r in db.execute(f"SELECT id FROM packs WHERE id IN ({','.join('?' * len(chunk))})", chunk))
+                rows = self._append([(k, v) for k, v in batch.items() if k not in known])
+                db.executemany("INSERT OR REPLACE INTO packs VALUES (?,?,?,?,?,?,?,?,?,?,?)", rows)
+        return list(batch)
+
+    def put(self, res: WorkflowResult) -> str:
+        return self.put_many([res])[0]
+
+    def entry(self, pack_id: str) -> Optional[PackEntry]:
+        with self._db() as db:
+            row = db.execute(f"SELECT {_COLUMNS} FROM packs WHERE id = ?", (pack_id,)).fetchone()
+        return PackEntry(*row) if row else None
+
+    def get(self, pack_id: str) -> WorkflowResult:
+        with self._db() as db:
+            row = db.execute("SELECT segment, offset, length FROM packs WHERE id = ?", (pack_id,)).fetchone()
+        if row is None:
+            raise KeyError(pack_id)
+        return WorkflowResult(**self._read(*row))
+
+    def __contains__(self, pack_id: str) -> bool:
+        return self.entry(pack_id) is not None
+
+    def __len__(self) -> int:
+        with self._db() as db:
+            return db.execute("SELECT COUNT(*) FROM packs").fetchone()[0]
+
+    def find(self, topic: Optional[str] = None, mode: Optional[str] = None, seed: Optional[int] = None,
+             engine: Optional[str] = None, since: Optional[str] = None, until: Optional[str] = None,
+             limit: Optional[int] = 100, newest_first: bool = True) -> List[PackEntry]:
+        """Index-only query; `since`/`until` are generated_at stamps (YYYYmmdd_HHMMSS, inclusive)."""
+        where, args = [], []
+        for col, val in (("topic", topic), ("mode", mode), ("seed", seed), ("engine", engine)):
+            if val is not None:
+                where.append(f"{col} = ?")
+                args.append(val)
+        if since is not None:
+            where.append("generated_at >= ?")
+            args.append(since)
+        if until is not None:
+            where.append("generated_at <= ?")
+            args.append(until)
+        sql = f"SELECT {_COLUMNS} FROM packs" + (" WHERE " + " AND ".join(where) if where else "")
+        sql += f" ORDER BY generated_at {'DESC' if newest_first else 'ASC'}, rowid {'DESC' if newest_first else 'ASC'}"
+        if limit is not None:
+            sql += f" LIMIT {int(limit)}"
+        with self._db() as db:
+            return [PackEntry(*r) for r in db.execute(sql, args)]
+
+    def scan(self, since: Optional[str] = None, until: Optional[str] = None, **filters: Any) -> Iterator[WorkflowResult]:
+        """Range scan in generated_at order, loading records lazily."""
+        for e in self.find(since=since, until=until, limit=None, newest_first=False, **filters):
+            yield self.get(e.id)
+
+    def delete(self, pack_id: str) -> bool:
+        with self._write_lock():
+            with self._db() as db:
+                if db.execute("DELETE FROM packs WHERE id = ?", (pack_id,)).rowcount == 0:
+                    return False
+                self._append([(pack_id, {"_deleted": pack_id})])
+        return True
+
+    def compact(self) -> Dict[str, int]:
+        """Rewrite live records into fresh segments and drop the old ones (tombstones included)."""
+        with self._write_lock():
+            old = self._segments()
+            before = sum(os.path.getsize(self._seg_path(s)) for s in old)
+            with self._db() as db:
+                live = db.execute("SELECT id, segment, offset, length FROM packs ORDER BY segment, offset").fetchall()
+                seg = (old[-1] if old else 0) + 1
+                rows = []
+                f = open(self._seg_path(seg), "wb")
+                try:
+                    for pack_id, s, off, length in live:
+                        if f.tell() >= self.max_segment_bytes:
+                            f.close()
+                            seg += 1
+                            f = open(self._seg_path(seg), "wb")
+                        rec = self._read(s, off, length)
+                        blob = self._encode(rec)
+                        rows.append(self._row(pack_id, seg, f.tell(), len(blob), rec))
+                        f.write(blob)
+                    f.flush()
+                    os.fsync(f.fileno())
+                finally:
+                    f.close()
+                db.execute("DELETE FROM packs")
+                db.executemany("INSERT INTO packs VALUES (?,?,?,?,?,?,?,?,?,?,?)", rows)
+            self._close_maps()
+            for s in old:
+                os.remove(self._seg_path(s))
+            after = sum(os.path.getsize(self._seg_path(s)) for s in self._segments())
+        return {"records": len(rows), "bytes_before": before, "bytes_after": after}
+
+    def reindex(self) -> int:
+        """Rebuild the index by scanning every segment (e.g. after the index file was lost)."""
+        with self._write_lock():
+            rows: Dict[str, tuple] = {}
+            for seg in self._segments():
+                for offset, length, rec in self._iter_segment(seg):
+                    if "_deleted" in rec:
+                        rows.pop(rec["_deleted"], None)
+                    else:
+                        pack_id = pack_digest(WorkflowResult(**rec))
+                        rows.setdefault(pack_id, self._row(pack_id, seg, offset, length, rec))
+            with self._db() as db:
+                db.execute("DELETE FROM packs")
+                db.executemany("INSERT INTO packs VALUES (?,?,?,?,?,?,?,?,?,?,?)", rows.values())
+        return len(rows)
+
+    # ---- PackExporter sink protocol ----
+    def write_batch(self, items: List[Tuple[str, WorkflowResult]]) -> None:
+        self.put_many(res for _, res in items)
+
+    def abort(self) -> None:
+        self.close()  # packs already put are committed records; nothing to roll back
+
+    def close(self) -> None:
+        with self._lock:
+            self._close_maps()
+        db = getattr(self._local, "db", None)
+        if db is not None:
+            db.close()
+            self._local.db = None
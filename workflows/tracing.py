@@ -0,0 +1,137 @@
+from __future__ import annotations
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Any, List, Optional, Iterator, Tuple
+
+# (name, start offset sec, duration sec, depth)
+Span = Tuple[str, float, float, int]
+
+class Trace:
+    """Spans recorded while a trace() block is active in the current context."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.spans: List[Span] = []
+        self.depth = 0
+
+    def add(self, name: str, start: float, end: float, depth: Optional[int] = None) -> None:
+        self.spans.append((name, start - self.started, end - start, self.depth if depth is None else depth))
+
+    def timings(self) -> Dict[str, float]:
+        """Total milliseconds per span name, in start order."""
+        out: Dict[str, float] = {}
+        for name, _, dur, _ in sorted(self.spans, key=lambda s: (s[1], s[3])):
+            out[name] = out.get(name, 0.0) + dur * 1000.0
+        return {k: round(v, 3) for k, v in out.items()}
+
+    def table(self) -> List[Dict[str, Any]]:
+        """Per-name calls / total / mean, for display."""
+        rows: Dict[str, Dict[str, Any]] = {}
+        for name, _, dur, depth in sorted(self.spans, key=lambda s: (s[1], s[3])):
+            row = rows.setdefault(name, {"span": name, "depth": depth, "calls": 0, "total_ms": 0.0})
+            row["calls"] += 1
+            row["total_ms"] += dur * 1000.0
+        for row in rows.values():
+            row["mean_ms"] = round(row["total_ms"] / row["calls"], 3)
+            row["total_ms"] = round(row["total_ms"], 3)
+        return list(rows.values())
+
+    def format(self) -> str:
+        lines = [f"{'span':<40} {'calls':>6} {'total ms':>10} {'mean ms':>10}"]
+        for row in self.table():
+            name = "  " * row["depth"] + row["span"]
+            lines.append(f"{name:<40} {row['calls']:>6} {row['total_ms']:>10.3f} {row['mean_ms']:>10.3f}")
+        return "\n".join(lines)
+
+_current: ContextVar[Optional[Trace]] = ContextVar("glowmini_trace", default=None)
+
+def current() -> Optional[Trace]:
+    return _current.get()
+
+@contextmanager
+def trace() -> Iterator[Trace]:
+    """Record spans from everything called inside the block (same thread / asyncio task)."""
+    t = Trace()
+    token = _current.set(t)
+    try:
+        yield t
+    finally:
+        _current.reset(token)
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NULL = _NullSpan()
+
+class _Span:
+    __slots__ = ("trace", "name", "start")
+
+    def __init__(self, trace: Trace, name: str):
+        self.trace = trace
+        self.name = name
+
+    def __enter__(self):
+        self.trace.depth += 1
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        end = time.perf_counter()
+        self.trace.depth -= 1
+        self.trace.add(self.name, self.start, end)
+        return False
+
+def span(name: str):
+    """`with span("stage"):` — a shared no-op unless a trace is active."""
+    t = _current.get()
+    return _NULL if t is None else _Span(t, name)
+
+class Stopwatch:
+    """
+    Consecutive stages of one function without nesting `with` blocks:
+    each lap() closes the stage that started at the previous lap.
+    """
+    __slots__ = ("trace", "name", "start", "last", "laps", "depth")
+
+    def __init__(self, trace: Trace, name: str):
+        self.trace = trace
+        self.name = name
+        self.depth = trace.depth
+        self.start = self.last = time.perf_counter()
+        self.laps: Dict[str, float] = {}
+
+    def lap(self, stage: str) -> None:
+        now = time.perf_counter()
+        self.trace.add(f"{self.name}.{stage}", self.last, now, self.depth + 1)
+        self.laps[stage] = round((now - self.last) * 1000.0, 3)
+        self.last = now
+
+    def stop(self) -> Dict[str, float]:
+        """Close the stopwatch; returns {stage: ms, ..., "total": ms}."""
+        now = time.perf_counter()
+        self.trace.add(self.name, self.start, now, self.depth)
+        self.laps["total"] = round((now - self.start) * 1000.0, 3)
+        return self.laps
+
+class _NullStopwatch:
+    __slots__ = ()
+
+    def lap(self, stage: str) -> None:
+        pass
+
+    def stop(self) -> None:
+        return None
+
+_NULL_STOPWATCH = _NullStopwatch()
+
+def stopwatch(name: str):
+    """A Stopwatch, or a shared no-op one unless a trace is active (stop() then returns None)."""
+    t = _current.get()
+    return _NULL_STOPWATCH if t is None else Stopwatch(t, name)
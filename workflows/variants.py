@@ -0,0 +1,107 @@
+from __future__ import annotations
+import time, random, hashlib
+from dataclasses import dataclass
+from typing import Optional, Iterable, Iterator, Sequence
+
+from workflows.engine import (
+    WorkflowResult, _detect_mode, _draw_picks, _now_stamp,
+    _render_script, _render_outline, _render_shotlist, _render_prompts,
+)
+from workflows.catalog import get_catalog
+
+@dataclass
+class SweepReport:
+    total: int = 0          # grid points visited
+    unique: int = 0         # packs yielded
+    duplicates: int = 0     # skipped: same rendered sections as an earlier variant
+    elapsed_sec: float = 0.0
+
+    @property
+    def variants_per_sec(self) -> float:
+        return self.total / self.elapsed_sec if self.elapsed_sec > 0 else 0.0
+
+def grid_size(topics: Sequence[str], platforms: Sequence[str], style_presets: Sequence[str],
+              durations: Sequence[int], seeds: Sequence[Optional[int]]) -> int:
+    return len(topics) * len(platforms) * len(style_presets) * len(durations) * len(seeds)
+
+def _sections_key(*sections: str) -> bytes:
+    h = hashlib.blake2b(digest_size=16)
+    for s in sections:
+        h.update(s.encode("utf-8") + b"\0")
+    return h.digest()
+
+def generate_variants(
+    topics: Iterable[str],
+    language: str = "vi",
+    platforms: Sequence[str] = ("YouTube Shorts",),
+    style_presets: Sequence[str] = ("Cinematic 3D",),
+    durations: Sequence[int] = (35,),
+    seeds: Sequence[Optional[int]] = (None,),
+    audience: str = "General",
+    dedupe: bool = True,
+    report: Optional[SweepReport] = None,
+) -> Iterator[WorkflowResult]:
+    """
+    Lazily yield one pack per topic × seed × duration × platform × style_preset.
+    Each variant equals generate_media_pack() with the same arguments, but the work
+    is shared along the grid: mode and content once per topic, the random picks once
+    per seed, the hook per duration, script/outline per platform, and only the prompt
+    pack per style. A seed of None makes one unseeded draw shared by the whole grid.
+    With `dedupe`, variants whose four sections match an earlier one are skipped
+    (e.g. style presets that fall back to the same look); `report` counts them.
+    """
+    report = report if report is not None else SweepReport()
+    started = time.perf_counter()
+    catalog = get_catalog()
+    lang = catalog.language(language)
+    styles = [(name, catalog.style(name)) for name in style_presets]
+    for topic in topics:
+        seen = set()  # the topic is part of every pack, so duplicates never cross topics
+        mode = _detect_mode(topic)
+        content = lang.modes.get(mode) or lang.modes[catalog.default_mode]
+        for seed in seeds:
+            drawn = _draw_picks(content, catalog, random.Random(seed) if seed is not None else random)
+            shotlist = _render_shotlist(content, drawn)
+            for duration_sec in durations:
+                duration_sec = int(duration_sec)
+                picks = dict(drawn, hook=drawn["hook"].render(topic=topic, t=duration_sec))
+                hook = picks["hook"]
+                for platform in platforms:
+                    script = _render_script(content, hook, topic, language, platform, duration_sec, lang.cta)
+                    outline = _render_outline(content, hook, mode, platform, duration_sec, audience)
+                    for style_preset, style in styles:
+                        report.total += 1
+                        prompts = _render_prompts(content, picks, style, topic, mode, platform, duration_sec, audience)
+                        if dedupe:
+                            key = _sections_key(outline, script, shotlist, prompts)
+                            if key in seen:
+                                report.duplicates += 1
+                                continue
+                            seen.add(key)
+                        report.unique += 1
+                        report.elapsed_sec = time.perf_counter() - started
+                        yield WorkflowResult(
+                            topic=topic,
+                            language=language,
+                            platform=platform,
+                            duration_sec=duration_sec,
+                            audience=audience,
+                            style_preset=style_preset,
+                            mode=mode,
+                            outline=outline,
+                            script=script,
+                            shotlist=shotlist,
+                            prompts=prompts,
+                            meta={
+                                "generated_at": _now_stamp(),
+                                "mode": "offline_mock_adaptive",
+                                "detected_mode": mode,
+                                "seed": seed,
+                                "style_preset": style_preset,
+                                "platform": platform,
+                                "duration_sec": duration_sec,
+                                "audience": audience,
+                            },
+                            picks=dict(picks),
+                        )
+    report.elapsed_sec = time.perf_counter() - started